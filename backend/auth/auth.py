@@ -3,15 +3,47 @@ from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from models.models import User
-from models.database import get_session
+from models.database import engine, get_session, get_async_session
+from services.tenancy import set_session_agency
+import asyncio
 import os
+import secrets
+import time
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Cache de usuários autenticados (evita um SELECT por requisição)
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", "1024"))
+# Com esta opção, tokens que trazem as claims uid/aid/active dispensam o banco.
+# Um usuário desativado continua válido até o token expirar.
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() in ("1", "true", "yes")
+
+# Usuários com acesso às rotas de administração (separados por vírgula)
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+# Token fixo do coletor (Prometheus) para /metrics; vazio: só administradores
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Custo do bcrypt. Hashes com outro custo são refeitos no próximo login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Executor dedicado ao bcrypt, separado do threadpool das rotas
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 # Hash e verificação de senha
@@ -21,6 +53,146 @@ def get_password_hash(password):
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+class PasswordHashExecutor:
+    """
+    Executor limitado para bcrypt.
+
+    Roda o hash fora do event loop e do threadpool das rotas, em
+    `workers` threads. Quando há `workers + max_queue` tarefas pendentes,
+    novas tarefas são recusadas com HTTP 503 em vez de enfileirar sem
+    limite. Deve ser usado a partir do event loop.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Serviço de autenticação sobrecarregado, tente novamente",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BaseException:
+            # Erro do hash ou requisição cancelada (cliente desconectou)
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": min(self.pending, self.workers),
+            "queue_depth": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def resize(self, workers: int, max_queue: int = None):
+        """Troca o pool (usado pelo benchmark para dimensionar o executor)."""
+        old = self._executor
+        self.workers = workers
+        if max_queue is not None:
+            self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        old.shutdown(wait=False)
+
+password_executor = PasswordHashExecutor(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+async def get_password_hash_async(password):
+    return await password_executor.run(pwd_context.hash, password)
+
+async def verify_and_update_password_async(plain_password, hashed_password):
+    """
+    Verifica a senha no executor dedicado.
+
+    Retorna (válida, novo_hash); novo_hash vem preenchido quando o hash
+    salvo usa outro custo (BCRYPT_ROUNDS mudou) e deve ser regravado.
+    """
+    return await password_executor.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+class UserCache:
+    """
+    Cache LRU com TTL de usuários ativos, indexado pelo subject do token.
+
+    Guarda cópias desanexadas da sessão, então podem ser compartilhadas
+    entre requisições. Thread-safe; mantém contadores de acertos e falhas.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.claims_hits = 0
+
+    def get(self, username: str):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[username]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, username: str, user: User):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[username] = (time.monotonic() + self.ttl_seconds, user)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record_claims_hit(self):
+        with self._lock:
+            self.claims_hits += 1
+
+    def invalidate_user(self, user_id: int):
+        """Remove o usuário do cache (chamado quando o registro muda)."""
+        with self._lock:
+            for key in [k for k, (_, u) in self._entries.items() if u.id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "claims_hits": self.claims_hits,
+            }
+
+user_cache = UserCache(AUTH_CACHE_MAX_SIZE, AUTH_CACHE_TTL_SECONDS)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate_user(target.id)
+
 # Geração de token JWT
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -29,22 +201,124 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# Verificação de token JWT
-def get_current_user(token: str = Depends(oauth2_scheme), session=Depends(get_session)):
-    from sqlmodel import select
-    credentials_exception = HTTPException(
+def user_token_claims(user: User) -> dict:
+    """
+    Claims do token de acesso. uid/aid (imobiliária)/active permitem o
+    caminho sem banco quando AUTH_TRUST_TOKEN_CLAIMS está ativo.
+    """
+    return {"sub": user.username, "uid": user.id, "aid": user.agency_id, "active": user.is_active}
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _resolve_token(token: str):
+    """
+    Valida o token e tenta resolver o usuário sem banco (claims ou cache).
+
+    Retorna (username, user); user é None quando é preciso consultar o banco.
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise _credentials_exception()
+    except JWTError:
+        raise _credentials_exception()
+
+    # Caminho sem banco: confia nas claims assinadas do token
+    has_claims = payload.get("uid") is not None and payload.get("aid") is not None and "active" in payload
+    if AUTH_TRUST_TOKEN_CLAIMS and has_claims:
+        if not payload["active"]:
+            raise _credentials_exception()
+        user_cache.record_claims_hit()
+        return username, User(
+            id=payload["uid"], username=username, email="", hashed_password="",
+            is_active=True, agency_id=payload["aid"],
+        )
+
+    return username, user_cache.get(username)
+
+def resolve_user_without_db(token: str):
+    """
+    Usuário do token quando dá para resolvê-lo sem banco (claims ou cache).
+
+    Retorna None se o token é inválido ou se seria preciso consultar o
+    banco; quem chama segue então pelo caminho normal da rota.
+    """
+    try:
+        return _resolve_token(token)[1]
+    except HTTPException:
+        return None
+
+def token_user_id(token: str):
+    """
+    Id do usuário do token, sem banco: a claim uid (assinatura conferida)
+    ou, em tokens sem ela, o usuário do cache. Não verifica se o usuário
+    está ativo; serve para identificar o autor, não para autorizar.
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
-        raise credentials_exception
-    user = session.exec(select(User).where(User.username == username)).first()
+        return None
+    if isinstance(payload.get("uid"), int):
+        return payload["uid"]
+    user = user_cache.get(payload.get("sub")) if payload.get("sub") else None
+    return user.id if user is not None else None
+
+def _cache_loaded_user(username: str, db_user):
+    if db_user is None or not db_user.is_active:
+        raise _credentials_exception()
+    user = User.model_validate(db_user)
+    user_cache.set(username, user)
+    return user
+
+# Verificação de token JWT. A sessão da requisição (a mesma instância
+# recebida pela rota) passa a enxergar só a imobiliária do usuário.
+def get_current_user(token: str = Depends(oauth2_scheme), session=Depends(get_session)):
+    from sqlmodel import select
+    username, user = _resolve_token(token)
     if user is None:
-        raise credentials_exception
+        db_user = session.exec(select(User).where(User.username == username)).first()
+        user = _cache_loaded_user(username, db_user)
+    set_session_agency(session, user.agency_id, user.id)
     return user
+
+# Versão assíncrona (rotas com AsyncSession)
+async def get_current_user_async(token: str = Depends(oauth2_scheme), session=Depends(get_async_session)):
+    from sqlmodel import select
+    username, user = _resolve_token(token)
+    if user is None:
+        db_user = (await session.exec(select(User).where(User.username == username))).first()
+        user = _cache_loaded_user(username, db_user)
+    set_session_agency(session, user.agency_id, user.id)
+    return user
+
+# Conexões longas (feed de alterações): autentica sem prender uma sessão do
+# pool enquanto a conexão durar. Síncrona; no event loop, via threadpool
+def authenticate_token(token: str):
+    from sqlmodel import Session, select
+    username, user = _resolve_token(token)
+    if user is None:
+        with Session(engine) as session:
+            db_user = session.exec(select(User).where(User.username == username)).first()
+        user = _cache_loaded_user(username, db_user)
+    return user
+
+# Administradores (ADMIN_USERNAMES)
+def is_admin(user) -> bool:
+    return user is not None and user.username in ADMIN_USERNAMES
+
+def get_current_admin(user=Depends(get_current_user)):
+    if not is_admin(user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acesso restrito a administradores")
+    return user
+
+# /metrics: administrador ou o coletor, com METRICS_TOKEN como Bearer
+def get_metrics_reader(token: str = Depends(oauth2_scheme), session=Depends(get_session)):
+    if METRICS_TOKEN and secrets.compare_digest(token, METRICS_TOKEN):
+        return None
+    return get_current_admin(get_current_user(token, session))
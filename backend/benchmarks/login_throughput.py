@@ -0,0 +1,100 @@
+"""
+Benchmark de vazão de login para dimensionar o executor do bcrypt.
+
+Sobe a aplicação em processo (httpx + ASGITransport) sobre um SQLite
+temporário, dispara logins concorrentes e, ao mesmo tempo, chamadas a
+/ping para mostrar que as demais rotas não são afetadas. Repete para cada
+tamanho de pool informado em --workers.
+
+Uso:
+    python -m benchmarks.login_throughput --workers 1 2 4 8 --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_round(app, logins: int, concurrency: int):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    login_latencies = []
+    ping_latencies = []
+    status_codes = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login_once():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/users/login", data={"username": "bench", "password": "bench-password"})
+                login_latencies.append((time.perf_counter() - start) * 1000)
+                status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+
+        async def ping_loop():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/ping")
+                ping_latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.01)
+
+        pinger = asyncio.create_task(ping_loop())
+        start = time.perf_counter()
+        await asyncio.gather(*(login_once() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await pinger
+
+    return elapsed, login_latencies, ping_latencies, status_codes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-queue", type=int, default=1000, help="Fila do executor (alta para não recusar durante o teste)")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_login.db"
+
+    import main as app_module
+    from sqlmodel import Session, SQLModel
+    from auth.auth import BCRYPT_ROUNDS, get_password_hash, password_executor
+    from models.database import engine
+    from models.models import Agency, User
+
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        agency = Agency(name="Imobiliária 1")
+        session.add(agency)
+        session.flush()
+        session.add(User(
+            username="bench", email="bench@example.com",
+            hashed_password=get_password_hash("bench-password"), agency_id=agency.id,
+        ))
+        session.commit()
+
+    print(f"bcrypt rounds={BCRYPT_ROUNDS}, {args.logins} logins, concorrência {args.concurrency}\n")
+    print(f"{'workers':>7} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'/ping p99 ms':>13}  status")
+    for workers in args.workers:
+        password_executor.resize(workers, args.max_queue)
+        elapsed, logins, pings, codes = asyncio.run(run_round(app_module.app, args.logins, args.concurrency))
+        ping_p99 = percentile(pings, 99) if pings else float("nan")
+        print(
+            f"{workers:>7} {args.logins / elapsed:>9.1f} {statistics.median(logins):>8.1f} "
+            f"{percentile(logins, 99):>8.1f} {ping_p99:>13.2f}  {codes}"
+        )
+
+if __name__ == "__main__":
+    main()
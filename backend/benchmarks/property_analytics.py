@@ -0,0 +1,95 @@
+"""
+Benchmark de /properties/analytics.
+
+Para cada tamanho em --sizes, popula um SQLite temporário com imóveis
+(50 bairros, 6 tipos, 5 status, valores entre 100 mil e 5 milhões), monta
+o rollup e mede property_value_analytics para cada agrupamento. Para
+comparação, mede também a leitura ordenada dos valores direto da tabela
+property, que é o mínimo que um cálculo sem rollup precisaria fazer.
+
+O custo do rollup é limitado por grupos x faixas de valor: fica estável
+assim que o histograma de cada grupo está preenchido (poucos milhares de
+imóveis), enquanto a varredura cresce com o número de imóveis.
+
+Uso:
+    python -m benchmarks.property_analytics --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select, text
+from sqlmodel import Session, SQLModel
+
+from models.database import create_db_engine
+from models.models import Agency, Property, PropertyValueRollup
+from services.property_analytics import property_value_analytics, rebuild_property_rollup
+
+TYPES = ["Casa", "Apartamento", "Terreno", "Comercial", "Chácara", "Sobrado"]
+STATUSES = ["Disponível", "Reservado", "Vendido", "Alugado", "Indisponível"]
+LOCATIONS = [f"Bairro {i}" for i in range(50)]
+GROUPINGS = ["type", "status", "location"]
+
+def populate(engine, size: int, seed: int = 42):
+    rng = random.Random(seed)
+    batch_size = 50000
+    with engine.begin() as conn:
+        conn.execute(insert(Agency.__table__), [{"id": 1, "name": "Imobiliária 1", "created_at": datetime.now()}])
+    for offset in range(0, size, batch_size):
+        rows = [
+            {
+                "agency_id": 1,
+                "type": rng.choice(TYPES),
+                "location": rng.choice(LOCATIONS),
+                "status": rng.choice(STATUSES),
+                "value": round(10 ** rng.uniform(5, 6.7), -3),
+            }
+            for _ in range(min(batch_size, size - offset))
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(Property.__table__), rows)
+    rebuild_property_rollup(engine)
+
+def timed(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    header = f"{'imóveis':>9} {'rollup':>8} " + " ".join(f"{g:>10}" for g in GROUPINGS) + f" {'varredura':>10}"
+    print("Tempo mediano em ms\n")
+    print(header)
+    for size in args.sizes:
+        engine = create_db_engine(f"sqlite:///{tempfile.mkdtemp()}/bench_analytics.db")
+        SQLModel.metadata.create_all(engine)
+        populate(engine, size)
+        with Session(engine) as session:
+            rollup_rows = session.execute(select(func.count()).select_from(PropertyValueRollup)).scalar()
+            timings = [
+                timed(lambda: property_value_analytics(session, grouping), args.repeat)
+                for grouping in GROUPINGS
+            ]
+            scan = timed(
+                lambda: session.execute(text("SELECT type, status, value FROM property ORDER BY type, status, value")).all(),
+                max(1, args.repeat // 5),
+            )
+        engine.dispose()
+        print(f"{size:>9} {rollup_rows:>8} " + " ".join(f"{t:>10.2f}" for t in timings) + f" {scan:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Roteamento de leituras para réplicas com dois arquivos SQLite.
+
+O primário é populado (benchmarks.visit_calendar.populate) e copiado
+para o arquivo da réplica com a API de backup do SQLite, que faz o papel
+da replicação. Com a aplicação em processo (TestClient), mostra para onde
+vão os GETs em cada situação:
+
+1. réplica em dia: leituras na réplica, com a latência dos GETs pesados;
+2. leitura das próprias escritas: POST e o GET seguinte no primário;
+   depois da janela, a réplica sem a escrita já passou do atraso máximo;
+3. réplica parada (sem cópias): sai do rodízio depois do atraso máximo;
+4. réplica quebrada (arquivo removido): leituras no primário.
+
+Uso:
+    python -m benchmarks.read_replicas --visits 50000 --max-lag 1
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def sync_replica(primary_path: str, replica_path: str):
+    """Copia o primário para a réplica (backup online do SQLite)."""
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--visits", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-lag", type=float, default=1.0, help="DB_REPLICA_MAX_LAG_SECONDS")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    primary_path = os.path.join(directory, "primary.db")
+    replica_path = os.path.join(directory, "replica.db")
+    interval = args.max_lag / 5
+    # Configuração lida na importação do app
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{primary_path}",
+        "DATABASE_REPLICA_URLS": f"sqlite:///{replica_path}",
+        "DB_REPLICA_MAX_LAG_SECONDS": str(args.max_lag),
+        "DB_REPLICA_CHECK_INTERVAL_SECONDS": str(interval),
+        "DB_READ_YOUR_WRITES_SECONDS": str(args.max_lag),
+        "RESPONSE_CACHE_URL": "",
+    })
+
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session
+
+    import main as app_module
+    from auth.auth import get_password_hash
+    from benchmarks.visit_calendar import populate
+    from models.database import create_db_and_tables, engine
+    from models.models import User
+    from services.read_replicas import replica_router
+
+    create_db_and_tables()
+    populate(engine, args.visits, clients=max(1000, args.visits // 10), properties=max(500, args.visits // 20))
+    with Session(engine) as session:
+        session.add(User(username="bench", email="bench@example.com", hashed_password=get_password_hash("bench"), agency_id=1))
+        session.commit()
+
+    client = TestClient(app_module.app)
+    token = client.post("/users/login", data={"username": "bench", "password": "bench"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def fresh_replica():
+        replica_router.check()  # heartbeat novo no primário, copiado em seguida
+        sync_replica(primary_path, replica_path)
+        replica_router.check()
+
+    def reads(paths, repeat=1):
+        """GETs em `paths`; devolve {destino: quantidade} e as latências em ms."""
+        before = dict(replica_router.stats)
+        timings = []
+        for _ in range(repeat):
+            for path in paths:
+                start = time.perf_counter()
+                response = client.get(path, headers=headers)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code in (200, 404), response.text
+        routed = {key: replica_router.stats[key] - before[key] for key in before}
+        return {key: count for key, count in routed.items() if count}, timings
+
+    dashboard = ["/visits/calendar?month=6&year=2025", "/visits/statistics/summary?group_by=month", "/clients/?limit=100"]
+
+    print(f"primário: {primary_path}\nréplica:  {replica_path}\n")
+    fresh_replica()
+    routed, timings = reads(dashboard, args.repeat)
+    print(f"1. réplica em dia: {routed}, p50 {statistics.median(timings):.1f} ms")
+    print(f"   {replica_router.status()['replicas'][0]}")
+
+    created = client.post("/clients/", headers=headers, json={
+        "name": "Cliente novo", "phone": "11999999999", "email": "novo@example.com", "interest_type": "Compra",
+    }).json()
+    before = dict(replica_router.stats)
+    found = client.get(f"/clients/{created['id']}", headers=headers).status_code
+    print(f"2. GET logo após o POST: {found} via {[k for k in before if replica_router.stats[k] > before[k]]}")
+    time.sleep(args.max_lag + interval)
+    replica_router.check()
+    before = dict(replica_router.stats)
+    found = client.get(f"/clients/{created['id']}", headers=headers).status_code
+    print(f"   depois da janela, com a réplica sem a cópia: {found} via "
+          f"{[k for k in before if replica_router.stats[k] > before[k]]}")
+
+    time.sleep(args.max_lag)
+    replica_router.check()
+    routed, _ = reads(dashboard)
+    print(f"3. réplica parada há {args.max_lag * 2:.1f}s: {routed}")
+    print(f"   {replica_router.status()['replicas'][0]}")
+    fresh_replica()
+    routed, _ = reads(dashboard)
+    print(f"   nova cópia: {routed}")
+
+    replica_router.replicas[0].engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(replica_path + suffix):
+            os.remove(replica_path + suffix)
+    replica_router.check()
+    routed, _ = reads(dashboard)
+    print(f"4. réplica removida: {routed}")
+    print(f"   {replica_router.status()['replicas'][0]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmark das consultas de agenda de visitas.
+
+Popula um banco SQLite temporário (ou o informado em --database-url) com
+visitas distribuídas entre 2020 e 2030 e mede as consultas usadas por
+/visits/calendar, /visits/today e pela verificação de conflitos de
+horário, que devem ficar abaixo do orçamento (padrão: 1 ms) graças aos
+índices compostos sobre scheduled_datetime.
+
+Uso:
+    python -m benchmarks.visit_calendar --visits 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text
+from sqlmodel import Session, SQLModel, create_engine
+
+from models.models import Agency, Client, Property, Visit
+from services.visit_schedule import active_visits_between, day_bounds, find_conflicting_visit, month_bounds
+
+START = datetime(2020, 1, 1)
+END = datetime(2030, 12, 31)
+STATUSES = ["Agendada", "Realizada", "Cancelada", "Reagendada"]
+
+def populate(engine, visits: int, clients: int, properties: int, seed: int = 42):
+    """
+    Insere clientes, imóveis e visitas em lotes (executemany), todos da
+    imobiliária 1.
+    """
+    rng = random.Random(seed)
+    span = int((END - START).total_seconds() // 60)
+    with engine.begin() as conn:
+        conn.execute(insert(Agency.__table__), [{"id": 1, "name": "Imobiliária 1", "created_at": datetime.now()}])
+        conn.execute(insert(Client.__table__), [
+            {"agency_id": 1, "name": f"Cliente {i}", "phone": "11999999999", "email": f"c{i}@example.com",
+             "interest_type": "Compra", "status": "Lead"}
+            for i in range(clients)
+        ])
+        conn.execute(insert(Property.__table__), [
+            {"agency_id": 1, "type": "Apartamento", "location": f"Bairro {i % 50}", "value": 100000.0 + i,
+             "status": "Disponível"}
+            for i in range(properties)
+        ])
+    batch_size = 50000
+    now = datetime.now()
+    for offset in range(0, visits, batch_size):
+        rows = [
+            {
+                "agency_id": 1,
+                "client_id": rng.randint(1, clients),
+                "property_id": rng.randint(1, properties),
+                "scheduled_datetime": START + timedelta(minutes=rng.randrange(0, span, 30)),
+                "status": rng.choice(STATUSES),
+                "created_at": now,
+                "duration_minutes": 60,
+            }
+            for _ in range(min(batch_size, visits - offset))
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(Visit.__table__), rows)
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            conn.execute(text("ANALYZE"))
+        else:
+            conn.execute(text("ANALYZE visit"))
+
+def measure(engine, query, repeat: int):
+    """
+    Executa a consulta `repeat` vezes e devolve (tempos em ms, linhas).
+
+    Mede a consulta no banco e a leitura das linhas, sem montar objetos ORM.
+    """
+    timings = []
+    rows = 0
+    with engine.connect() as conn:
+        conn.execute(query).all()  # aquecimento (cache de compilação e páginas)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(conn.execute(query).all())
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings, rows
+
+def measure_conflict_check(engine, sample, repeat: int):
+    """
+    Mede find_conflicting_visit (sessão ORM) no horário de uma visita existente.
+    """
+    timings = []
+    with Session(engine) as session:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            find_conflicting_visit(
+                session, sample.client_id, sample.property_id,
+                sample.scheduled_datetime, 60, exclude_visit_id=sample.id
+            )
+            timings.append((time.perf_counter() - start) * 1000)
+            session.expunge_all()
+    return timings
+
+def query_plan(engine, query):
+    with engine.connect() as conn:
+        compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+        if engine.dialect.name == "sqlite":
+            return " | ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+        return " | ".join(row[0].strip() for row in conn.execute(text(f"EXPLAIN {compiled}")))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--visits", type=int, default=1_000_000)
+    parser.add_argument("--clients", type=int, default=50_000)
+    parser.add_argument("--properties", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    parser.add_argument("--database-url", default=None, help="Banco vazio para o teste (padrão: SQLite temporário)")
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench_visits.db"
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+
+    print(f"Populando {args.visits} visitas em {url} ...")
+    start = time.perf_counter()
+    populate(engine, args.visits, args.clients, args.properties)
+    print(f"Carga concluída em {time.perf_counter() - start:.1f}s\n")
+
+    month_start, month_end = month_bounds(2025, 6)
+    day_start, day_end = day_bounds(datetime(2025, 6, 17).date())
+    # Usa um cliente e um imóvel que tenham visitas no mês medido
+    with Session(engine) as session:
+        sample = session.exec(active_visits_between(month_start, month_end).limit(1)).one()
+    cases = [
+        ("calendário do imóvel (mês)", active_visits_between(month_start, month_end, property_id=sample.property_id), True),
+        ("calendário do cliente (mês)", active_visits_between(month_start, month_end, client_id=sample.client_id), True),
+        ("agenda do dia", active_visits_between(day_start, day_end), True),
+        ("calendário geral (mês)", active_visits_between(month_start, month_end), False),
+    ]
+
+    failed = False
+    print(f"{'consulta':32} {'linhas':>7} {'p50 ms':>8} {'p95 ms':>8}  orçamento")
+    for name, query, budgeted in cases:
+        timings, rows = measure(engine, query, args.repeat)
+        p50 = statistics.median(timings)
+        p95 = statistics.quantiles(timings, n=20)[-1]
+        if budgeted:
+            ok = p50 <= args.budget_ms
+            failed = failed or not ok
+            verdict = "OK" if ok else "ACIMA"
+        else:
+            verdict = "-"
+        print(f"{name:32} {rows:>7} {p50:>8.3f} {p95:>8.3f}  {verdict}")
+        print(f"    plano: {query_plan(engine, query)}")
+
+    timings = measure_conflict_check(engine, sample, args.repeat)
+    p50 = statistics.median(timings)
+    p95 = statistics.quantiles(timings, n=20)[-1]
+    ok = p50 <= args.budget_ms
+    failed = failed or not ok
+    print(f"{'verificação de conflito':32} {'-':>7} {p50:>8.3f} {p95:>8.3f}  {'OK' if ok else 'ACIMA'}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from models.database import get_session, create_db_and_tables
-from models.models import User
+from models.models import Agency, User
 from auth.auth import get_password_hash
 from sqlmodel import Session
 
@@ -28,13 +28,22 @@ def create_test_user():
         if existing_user:
             print(f"✅ Usuário '{test_username}' já existe!")
         else:
+            # Usa a primeira imobiliária do banco (ou cria uma)
+            agency = session.exec(select(Agency).order_by(Agency.id)).first()
+            if not agency:
+                agency = Agency(name="Imobiliária principal")
+                session.add(agency)
+                session.flush()
+                print(f"🏢 Imobiliária '{agency.name}' criada")
+
             # Cria o usuário
             hashed_password = get_password_hash(test_password)
             test_user = User(
                 username=test_username,
                 email=test_email,
                 hashed_password=hashed_password,
-                is_active=True
+                is_active=True,
+                agency_id=agency.id
             )
             
             session.add(test_user)
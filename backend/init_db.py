@@ -1,6 +1,7 @@
 """
 Script para inicializar o banco de dados
-Cria todas as tabelas necessárias para o CRM
+Cria todas as tabelas necessárias para o CRM (banco novo) ou aplica as
+migrações pendentes (banco existente, ver migrate.py)
 """
 from models.database import create_db_and_tables
 
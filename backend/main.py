@@ -1,6 +1,16 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy.orm.exc import StaleDataError
 from fastapi.middleware.cors import CORSMiddleware
-from routers import user, properties, client, visit, negotiation
+from routers import user, properties, client, visit, negotiation, export, search, admin, changes
+from routers.async_routes import make_async_router
+from auth.auth import get_current_admin, get_metrics_reader
+from models.database import DB_ASYNC
+from services.pagination import NEXT_CURSOR_HEADER, TOTAL_ESTIMATE_HEADER
+from services.http_cache import ConditionalGetMiddleware, http_cache_stats
+from services.metrics import METRICS_ENABLED, MetricsMiddleware, render_metrics
+from services.profiling import PROFILE_ID_HEADER, ProfilingMiddleware
+from services.read_replicas import ReplicaRoutingMiddleware, replica_router
 import os
 from dotenv import load_dotenv
 
@@ -18,22 +28,60 @@ origins = [
     "http://127.0.0.1:5175",
     os.getenv("FRONTEND_URL", "http://localhost:5173")
 ]
+# ETags / cache de respostas (registrado antes do CORS, que fica por fora)
+app.add_middleware(ConditionalGetMiddleware)
+# GETs nas réplicas (DATABASE_REPLICA_URLS); por fora do cache, que lê as versões do banco escolhido
+app.add_middleware(ReplicaRoutingMiddleware)
+# Perfil de SQL/pilha sob demanda (X-Profile, amostragem ou requisições lentas)
+app.add_middleware(ProfilingMiddleware)
+# Latência, SQL por rota e Server-Timing (por fora do cache, para medir também os 304)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_ESTIMATE_HEADER, "ETag", "Server-Timing", PROFILE_ID_HEADER],
 )
 
-# Routers
+# UPDATE/DELETE do ORM que não encontrou a versão carregada: outra
+# requisição alterou o registro no meio do caminho
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    return JSONResponse(status_code=409, content={"detail": "Registro alterado por outra requisição, tente novamente"})
+
+# Routers (DB_ASYNC troca os de CRUD pelas versões com AsyncSession)
+crud_router = make_async_router if DB_ASYNC else (lambda router: router)
+
 app.include_router(user.router)
-app.include_router(properties.router)
-app.include_router(client.router)
-app.include_router(visit.router)
-app.include_router(negotiation.router)
+app.include_router(crud_router(properties.router))
+app.include_router(crud_router(client.router))
+app.include_router(crud_router(visit.router))
+app.include_router(crud_router(negotiation.router))
+app.include_router(crud_router(search.router))
+app.include_router(export.router)
+app.include_router(admin.router)
+# Feed de alterações (SSE/WebSocket), assíncrono nos dois modos
+app.include_router(changes.router)
 
 # Healthcheck
 @app.get("/ping", tags=["Health"])
 def ping():
     return {"status": "ok"}
+
+# Métricas no formato do Prometheus (administradores ou o coletor, ver METRICS_TOKEN)
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse, dependencies=[Depends(get_metrics_reader)])
+def prometheus_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Eficácia dos ETags e do cache de respostas
+@app.get("/cache/stats", tags=["Health"], dependencies=[Depends(get_current_admin)])
+def cache_stats():
+    return http_cache_stats()
+
+# Saúde e atraso das réplicas de leitura
+@app.get("/replicas/status", tags=["Health"], dependencies=[Depends(get_current_admin)])
+def replicas_status():
+    return replica_router.status()
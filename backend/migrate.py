@@ -0,0 +1,74 @@
+"""
+Aplica as migrações versionadas do banco (migrations/versions).
+
+Uso:
+    python migrate.py                  # aplica as pendentes
+    python migrate.py upgrade --to 0005
+    python migrate.py status           # aplicadas e pendentes
+    python migrate.py stamp            # marca como aplicadas sem executar
+
+As versões aplicadas ficam na tabela schemamigration. Funciona com
+SQLite e PostgreSQL (DATABASE_URL). Se for interrompida, basta executar
+de novo: a migração em andamento recomeça e os backfills continuam do
+último lote gravado. Para bancos grandes, MIGRATION_BATCH_SIZE controla
+o tamanho dos lotes e MIGRATION_LOCK_TIMEOUT_MS a espera por lock na DDL.
+"""
+
+import argparse
+import sys
+import os
+
+# Adiciona o diretório do backend ao path para importar modelos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models.database import engine
+from migrations.runner import MigrationError, applied_versions, discover, stamp, upgrade
+
+def show_status():
+    applied = applied_versions(engine)
+    for migration in discover():
+        row = applied.get(migration.version)
+        if row:
+            print(f"✅ {migration.version} {migration.description} "
+                  f"({row.applied_at:%Y-%m-%d %H:%M}, {row.duration_seconds:.1f}s)")
+        else:
+            print(f"⏳ {migration.version} {migration.description}")
+    known = {m.version for m in discover()}
+    for version in sorted(set(applied) - known):
+        print(f"⚠️  {version} aplicada no banco, mas não existe em migrations/versions")
+
+def main(argv=None) -> bool:
+    parser = argparse.ArgumentParser(description="Migrações do banco do CRM")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status", "stamp"])
+    parser.add_argument("--to", dest="target", help="Versão final (padrão: a última)")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        show_status()
+        return True
+
+    try:
+        if args.command == "stamp":
+            migrations = stamp(engine, args.target)
+            print(f"🏷️  {len(migrations)} migração(ões) marcada(s) como aplicada(s)")
+            return True
+        migrations = upgrade(engine, args.target)
+    except MigrationError as e:
+        print(f"❌ {e}")
+        return False
+
+    if migrations:
+        print(f"✅ {len(migrations)} migração(ões) aplicada(s)")
+    else:
+        print("✅ Banco já está na última versão")
+    return True
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("🗄️  MIGRAÇÕES DO BANCO - VMP CRM")
+    print("=" * 50)
+
+    ok = main()
+
+    print("\n" + "=" * 50)
+    sys.exit(0 if ok else 1)
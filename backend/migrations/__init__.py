@@ -0,0 +1 @@
+# Migrações versionadas do banco (ver migrations/runner.py e migrate.py)
@@ -0,0 +1,417 @@
+"""
+Runner das migrações versionadas do banco (SQLite e PostgreSQL).
+
+Cada módulo de migrations/versions se chama NNNN_descricao.py e define
+upgrade(ctx); a primeira linha da docstring do módulo é a descrição. As
+versões aplicadas ficam na tabela schemamigration. upgrade() aplica as
+pendentes em ordem e para na primeira que falhar, que continua pendente.
+
+Para alterar um banco grande sem parar a aplicação, as migrações usam
+os passos de MigrationContext:
+
+- DDL comum (ADD COLUMN, RENAME COLUMN, CREATE TABLE) em
+  ctx.transaction(): no PostgreSQL a DDL é transacional e roda com
+  lock_timeout, então um ALTER TABLE que não consegue o lock falha em
+  poucos segundos em vez de enfileirar todas as consultas da tabela;
+- índices com ctx.create_index(): CREATE INDEX CONCURRENTLY no
+  PostgreSQL, fora de transação, sem bloquear escritas;
+- atualização de dados com ctx.backfill(): lotes por id, cada um na sua
+  transação, que também grava o ponto de parada em migrationprogress;
+  se o processo cair, a próxima execução continua do último lote.
+
+Uma migração interrompida é executada de novo desde o início, então
+cada passo precisa ser idempotente (add_column, create_table e
+create_index não fazem nada se o objeto já existe; drop_table e
+drop_index, se ele não existe). Migrações antigas não devem depender do
+formato atual dos modelos: tabelas e índices da época são declarados na
+própria migração (ctx.index, Table com MetaData própria).
+"""
+import importlib
+import os
+import pkgutil
+import re
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import Index, MetaData, Table, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex
+
+from models.models import MigrationProgress, SchemaMigration
+
+VERSIONS_PACKAGE = "migrations.versions"
+
+# Linhas por lote nos backfills
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+# PostgreSQL: espera máxima por lock na DDL (0 desativa)
+MIGRATION_LOCK_TIMEOUT_MS = int(os.getenv("MIGRATION_LOCK_TIMEOUT_MS", "5000"))
+# Chave do pg_advisory_lock que impede duas execuções ao mesmo tempo
+ADVISORY_LOCK_KEY = 7_230_022
+
+_MODULE_NAME = re.compile(r"^(\d{4})_(\w+)$")
+_CREATE_INDEX = re.compile(r"^CREATE (UNIQUE )?INDEX ")
+
+class MigrationError(Exception):
+    """Migração inválida ou que falhou; o banco fica na última versão aplicada."""
+
+@dataclass
+class Migration:
+    version: str
+    name: str
+    description: str
+    upgrade: Callable[["MigrationContext"], None]
+
+def discover() -> List[Migration]:
+    """Migrações de migrations/versions, em ordem de versão."""
+    package = importlib.import_module(VERSIONS_PACKAGE)
+    migrations = []
+    for module_info in pkgutil.iter_modules(package.__path__):
+        match = _MODULE_NAME.match(module_info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{VERSIONS_PACKAGE}.{module_info.name}")
+        if not callable(getattr(module, "upgrade", None)):
+            raise MigrationError(f"{module_info.name} não define upgrade(ctx)")
+        description = (module.__doc__ or match.group(2)).strip().splitlines()[0]
+        migrations.append(Migration(match.group(1), module_info.name, description, module.upgrade))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    duplicated = sorted({v for v in versions if versions.count(v) > 1})
+    if duplicated:
+        raise MigrationError(f"Versões repetidas: {', '.join(duplicated)}")
+    return migrations
+
+class MigrationContext:
+    """Passos seguros para as migrações, ligados a um engine."""
+
+    def __init__(self, engine: Engine, migration: Migration, log: Callable[[str], None] = print):
+        self.engine = engine
+        self.migration = migration
+        self._log = log
+
+    @property
+    def dialect(self) -> str:
+        return self.engine.dialect.name
+
+    def log(self, message: str):
+        self._log(f"   {message}")
+
+    @contextmanager
+    def transaction(self) -> Iterable[Connection]:
+        """Transação com commit no fim (rollback em caso de erro)."""
+        with self.engine.begin() as conn:
+            if self.dialect == "postgresql":
+                conn.execute(text("SET LOCAL statement_timeout = 0"))
+                conn.execute(text(f"SET LOCAL lock_timeout = {MIGRATION_LOCK_TIMEOUT_MS}"))
+            yield conn
+
+    @contextmanager
+    def autocommit(self) -> Iterable[Connection]:
+        """Conexão fora de transação (CREATE INDEX CONCURRENTLY, VACUUM...)."""
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if self.dialect == "postgresql":
+                conn.execute(text("SET statement_timeout = 0"))
+                conn.execute(text(f"SET lock_timeout = {MIGRATION_LOCK_TIMEOUT_MS}"))
+            try:
+                yield conn
+            finally:
+                if self.dialect == "postgresql":
+                    conn.execute(text("RESET statement_timeout"))
+                    conn.execute(text("RESET lock_timeout"))
+
+    def execute(self, statement: str, params: dict = None):
+        with self.transaction() as conn:
+            return conn.execute(text(statement), params or {})
+
+    def quote(self, name: str) -> str:
+        """Nome com aspas quando necessário ("user" é reservado no PostgreSQL)."""
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def sql_type(self, type_) -> str:
+        """Nome do tipo no banco atual (DateTime -> DATETIME / TIMESTAMP ...)."""
+        return type_.compile(dialect=self.engine.dialect)
+
+    # Inspeção (sem cache: cada chamada vê o estado atual do banco)
+
+    def has_table(self, table: str) -> bool:
+        return inspect(self.engine).has_table(table)
+
+    def columns(self, table: str) -> Dict[str, object]:
+        return {c["name"]: c["type"] for c in inspect(self.engine).get_columns(table)}
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in self.columns(table)
+
+    def has_index(self, table: str, name: str) -> bool:
+        return any(index["name"] == name for index in inspect(self.engine).get_indexes(table))
+
+    def index(self, name: str, table: str, *columns: str, **kwargs) -> Index:
+        """
+        Índice sobre a tabela como ela está no banco agora (refletida), para
+        a migração não depender do formato atual dos modelos.
+        """
+        reflected = Table(table, MetaData(), autoload_with=self.engine)
+        return Index(name, *(reflected.c[column] for column in columns), **kwargs)
+
+    # DDL
+
+    def create_table(self, table: Table) -> bool:
+        """Cria a tabela (com seus índices, ainda vazia) se não existir."""
+        if self.has_table(table.name):
+            self.log(f"✔️  Tabela {table.name} já existe")
+            return False
+        with self.transaction() as conn:
+            table.create(conn)
+        self.log(f"📇 Tabela {table.name} criada")
+        return True
+
+    def add_column(self, table: str, column: str, definition: str):
+        """
+        ALTER TABLE ... ADD COLUMN, se a coluna ainda não existir. Erros
+        são propagados (a migração falha e continua pendente).
+        """
+        if self.has_column(table, column):
+            self.log(f"✔️  {table}.{column} já existe")
+            return
+        with self.transaction() as conn:
+            conn.execute(text(f"ALTER TABLE {self.quote(table)} ADD COLUMN {column} {definition}"))
+        self.log(f"➕ Coluna {table}.{column} adicionada")
+
+    def drop_table(self, table: str):
+        """Remove a tabela (e os seus índices), se existir."""
+        if not self.has_table(table):
+            return
+        with self.transaction() as conn:
+            conn.execute(text(f"DROP TABLE {self.quote(table)}"))
+        self.log(f"🗑️  Tabela {table} removida")
+
+    def rename_column(self, table: str, old: str, new: str):
+        """
+        Renomeia a coluna (só altera o catálogo, sem reescrever a tabela).
+        Não faz nada se a coluna nova já existe.
+        """
+        columns = self.columns(table)
+        if new in columns or old not in columns:
+            self.log(f"✔️  {table}.{old} já renomeada")
+            return
+        with self.transaction() as conn:
+            conn.execute(text(f"ALTER TABLE {self.quote(table)} RENAME COLUMN {old} TO {new}"))
+        self.log(f"🔄 Coluna {table}.{old} renomeada para {new}")
+
+    def drop_invalid_index(self, name: str):
+        """
+        PostgreSQL: remove o índice deixado inválido por um CREATE INDEX
+        CONCURRENTLY interrompido (o IF NOT EXISTS o consideraria pronto).
+        """
+        if self.dialect != "postgresql":
+            return
+        with self.autocommit() as conn:
+            invalid = conn.execute(
+                text(
+                    "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = :name AND NOT i.indisvalid"
+                ),
+                {"name": name},
+            ).first()
+            if invalid:
+                self.log(f"🧹 Removendo índice inválido {name}")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+    def create_index(self, index: Index):
+        """
+        Cria o índice se não existir. No PostgreSQL usa CREATE INDEX
+        CONCURRENTLY: a tabela continua aceitando escritas durante a
+        construção.
+        """
+        table = index.table.name
+        if self.dialect != "postgresql":
+            if self.has_index(table, index.name):
+                self.log(f"✔️  Índice {index.name} já existe")
+                return
+            with self.transaction() as conn:
+                index.create(conn)
+            self.log(f"📇 Índice {index.name} criado")
+            return
+        self.drop_invalid_index(index.name)
+        if self.has_index(table, index.name):
+            self.log(f"✔️  Índice {index.name} já existe")
+            return
+        ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=self.engine.dialect))
+        self.run_concurrently([_CREATE_INDEX.sub(r"CREATE \1INDEX CONCURRENTLY ", ddl)])
+        self.log(f"📇 Índice {index.name} criado (CONCURRENTLY)")
+
+    def drop_index(self, table: str, name: str):
+        """
+        Remove o índice se existir (DROP INDEX CONCURRENTLY no PostgreSQL,
+        sem bloquear leituras e escritas na tabela).
+        """
+        if not self.has_index(table, name):
+            return
+        if self.dialect == "postgresql":
+            self.run_concurrently([f"DROP INDEX CONCURRENTLY IF EXISTS {name}"])
+        else:
+            with self.transaction() as conn:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        self.log(f"🗑️  Índice {name} removido")
+
+    def run_concurrently(self, statements: Sequence[str]):
+        """Executa comandos que não podem rodar numa transação, um a um."""
+        with self.autocommit() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+
+    # Dados
+
+    def backfill(
+        self,
+        step: str,
+        table: str,
+        columns: Sequence[str],
+        apply: Callable[[Connection, list], None],
+        where: Optional[str] = None,
+        batch_size: int = None,
+    ) -> int:
+        """
+        Percorre `table` em lotes por id crescente e chama
+        apply(conn, rows) para cada lote. Cada lote roda numa transação que
+        também grava o último id processado em migrationprogress, então o
+        passo continua de onde parou se for interrompido; um passo
+        concluído não roda de novo.
+
+        `columns` são as colunas lidas (além de id) e `where` (SQL) filtra
+        as linhas que ainda precisam ser atualizadas.
+        """
+        batch_size = batch_size or MIGRATION_BATCH_SIZE
+        progress = self._progress(step)
+        if progress and progress.done:
+            self.log(f"✔️  {step}: concluído ({progress.rows} linhas)")
+            return progress.rows
+        exists = progress is not None
+        last_id = progress.last_id if exists else 0
+        total = progress.rows if exists else 0
+        if last_id:
+            self.log(f"↪️  {step}: retomando após o id {last_id}")
+
+        selected = ", ".join(["id", *columns])
+        condition = f" AND ({where})" if where else ""
+        query = text(f"SELECT {selected} FROM {table} WHERE id > :last_id{condition} ORDER BY id LIMIT :limit")
+        while True:
+            with self.transaction() as conn:
+                rows = conn.execute(query, {"last_id": last_id, "limit": batch_size}).all()
+                if rows:
+                    apply(conn, rows)
+                    last_id = rows[-1].id
+                    total += len(rows)
+                done = len(rows) < batch_size
+                self._save_progress(conn, step, last_id, total, done, exists)
+            exists = True
+            if done:
+                break
+            self.log(f"   {step}: {total} linhas...")
+        self.log(f"✅ {step}: {total} linhas")
+        return total
+
+    def _progress(self, step: str):
+        table = MigrationProgress.__table__
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(table).where(table.c.version == self.migration.version, table.c.step == step)
+            ).first()
+
+    def _save_progress(self, conn: Connection, step: str, last_id: int, rows: int, done: bool, exists: bool):
+        table = MigrationProgress.__table__
+        values = {"last_id": last_id, "rows": rows, "done": done, "updated_at": datetime.utcnow()}
+        if exists:
+            conn.execute(
+                update(table)
+                .where(table.c.version == self.migration.version, table.c.step == step)
+                .values(**values)
+            )
+        else:
+            conn.execute(insert(table).values(version=self.migration.version, step=step, **values))
+
+def _ensure_tables(engine: Engine):
+    for table in (SchemaMigration.__table__, MigrationProgress.__table__):
+        table.create(engine, checkfirst=True)
+
+def applied_versions(engine: Engine) -> Dict[str, object]:
+    """Versões registradas em schemamigration -> linha (applied_at, duração)."""
+    if not inspect(engine).has_table(SchemaMigration.__tablename__):
+        return {}
+    table = SchemaMigration.__table__
+    with engine.connect() as conn:
+        return {row.version: row for row in conn.execute(select(table).order_by(table.c.version))}
+
+def _up_to(migrations: List[Migration], target: Optional[str]) -> List[Migration]:
+    if target is None:
+        return migrations
+    if target not in {m.version for m in migrations}:
+        raise MigrationError(f"Versão desconhecida: {target}")
+    return [m for m in migrations if m.version <= target]
+
+def _record(conn: Connection, migration: Migration, duration: float):
+    conn.execute(insert(SchemaMigration.__table__).values(
+        version=migration.version,
+        name=migration.name,
+        applied_at=datetime.utcnow(),
+        duration_seconds=round(duration, 3),
+    ))
+
+@contextmanager
+def _migration_lock(engine: Engine):
+    """
+    PostgreSQL: advisory lock de sessão durante toda a execução, para que
+    dois processos (ex.: dois deploys) não apliquem migrações juntos.
+    """
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        locked = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY}).scalar()
+        if not locked:
+            raise MigrationError("Outra execução de migrações está em andamento")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+
+def pending(engine: Engine, target: Optional[str] = None) -> List[Migration]:
+    """Migrações ainda não aplicadas (até `target`, inclusive)."""
+    applied = applied_versions(engine)
+    return [m for m in _up_to(discover(), target) if m.version not in applied]
+
+def upgrade(engine: Engine, target: Optional[str] = None, log: Callable[[str], None] = print) -> List[Migration]:
+    """
+    Aplica as migrações pendentes até `target` (padrão: a última). Uma
+    falha interrompe a execução com MigrationError; as migrações anteriores
+    a ela continuam registradas.
+    """
+    _ensure_tables(engine)
+    with _migration_lock(engine):
+        migrations = pending(engine, target)
+        for migration in migrations:
+            log(f"⬆️  {migration.version} - {migration.description}")
+            start = time.perf_counter()
+            try:
+                migration.upgrade(MigrationContext(engine, migration, log))
+            except Exception as e:
+                raise MigrationError(f"Migração {migration.name} falhou: {e}") from e
+            with engine.begin() as conn:
+                _record(conn, migration, time.perf_counter() - start)
+        return migrations
+
+def stamp(engine: Engine, target: Optional[str] = None) -> List[Migration]:
+    """
+    Registra as migrações até `target` como aplicadas, sem executá-las
+    (banco criado do zero com o esquema atual).
+    """
+    _ensure_tables(engine)
+    with _migration_lock(engine):
+        migrations = pending(engine, target)
+        with engine.begin() as conn:
+            for migration in migrations:
+                _record(conn, migration, 0.0)
+        return migrations
@@ -0,0 +1,65 @@
+"""Tabelas principais (usuários, clientes, imóveis, visitas, negociações)
+
+Bancos antigos podem não ter alguma delas; as que faltam são criadas no
+formato de antes das migrações (datas das visitas como texto, sem versão
+nem imobiliária), e as migrações seguintes as levam ao formato atual
+como fazem com as tabelas que já existiam.
+"""
+from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, MetaData, String, Table
+
+metadata = MetaData()
+
+USER = Table(
+    "user", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("username", String, nullable=False, index=True, unique=True),
+    Column("email", String, nullable=False, index=True, unique=True),
+    Column("hashed_password", String, nullable=False),
+    Column("is_active", Boolean, nullable=False),
+)
+CLIENT = Table(
+    "client", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("phone", String, nullable=False),
+    Column("email", String, nullable=False),
+    Column("interest_type", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("preferences", String),
+)
+PROPERTY = Table(
+    "property", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("type", String, nullable=False),
+    Column("location", String, nullable=False),
+    Column("value", Float, nullable=False),
+    Column("description", String),
+    Column("status", String, nullable=False),
+)
+VISIT = Table(
+    "visit", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("client_id", Integer, ForeignKey("client.id"), nullable=False),
+    Column("property_id", Integer, ForeignKey("property.id"), nullable=False),
+    Column("scheduled_datetime", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("notes", String),
+    Column("created_at", String, nullable=False),
+    Column("updated_at", String),
+    Column("duration_minutes", Integer),
+    Column("agent_notes", String),
+    Column("client_feedback", String),
+)
+NEGOTIATION = Table(
+    "negotiation", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("client_id", Integer, ForeignKey("client.id"), nullable=False),
+    Column("property_id", Integer, ForeignKey("property.id"), nullable=False),
+    Column("status", String, nullable=False),
+    Column("created_at", String, nullable=False),
+    Column("updated_at", String),
+)
+
+def upgrade(ctx):
+    for table in (USER, CLIENT, PROPERTY, VISIT, NEGOTIATION):
+        ctx.create_table(table)
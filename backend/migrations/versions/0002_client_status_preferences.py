@@ -0,0 +1,18 @@
+"""Status e preferências dos clientes
+
+Substitui migrate_client.py. Os clientes sem status passam a "Lead", em
+lotes por id.
+"""
+from sqlalchemy import text
+
+def upgrade(ctx):
+    ctx.add_column("client", "status", "VARCHAR DEFAULT 'Lead'")
+    ctx.add_column("client", "preferences", "VARCHAR")
+
+    def set_lead(conn, rows):
+        conn.execute(
+            text("UPDATE client SET status = 'Lead' WHERE id = :id"),
+            [{"id": row.id} for row in rows],
+        )
+
+    ctx.backfill("client_status", "client", [], set_lead, where="status IS NULL OR status = ''")
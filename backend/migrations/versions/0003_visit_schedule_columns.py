@@ -0,0 +1,29 @@
+"""Colunas de agendamento das visitas
+
+Substitui migrate_visits.py: em vez de recriar a tabela visit numa única
+transação, renomeia datetime para scheduled_datetime (só o catálogo),
+adiciona as colunas que faltam e preenche created_at em lotes.
+"""
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, text
+
+def upgrade(ctx):
+    timestamp = ctx.sql_type(DateTime())
+    ctx.rename_column("visit", "datetime", "scheduled_datetime")
+    ctx.add_column("visit", "status", "VARCHAR DEFAULT 'Agendada'")
+    ctx.add_column("visit", "created_at", timestamp)
+    ctx.add_column("visit", "updated_at", timestamp)
+    ctx.add_column("visit", "duration_minutes", "INTEGER DEFAULT 60")
+    ctx.add_column("visit", "agent_notes", "VARCHAR")
+    ctx.add_column("visit", "client_feedback", "VARCHAR")
+
+    now = datetime.now()
+    update = text("UPDATE visit SET created_at = :created_at WHERE id = :id").bindparams(
+        bindparam("created_at", type_=DateTime())
+    )
+
+    def set_created_at(conn, rows):
+        conn.execute(update, [{"id": row.id, "created_at": now} for row in rows])
+
+    ctx.backfill("visit_created_at", "visit", [], set_created_at, where="created_at IS NULL")
@@ -0,0 +1,77 @@
+"""Datas nativas e índices de agenda das visitas
+
+Substitui migrate_visit_datetimes.py.
+
+- PostgreSQL: colunas de texto viram TIMESTAMP (ALTER ... TYPE reescreve
+  a tabela; só acontece em bancos que ainda guardam as datas como texto)
+- SQLite: os valores ("YYYY-MM-DD HH:MM", ISO com "T", isoformat com
+  microssegundos) são regravados no formato de DateTime do SQLAlchemy, em
+  lotes por id
+- Índices compostos da agenda, com CREATE INDEX CONCURRENTLY no PostgreSQL
+"""
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, text
+
+DATETIME_COLUMNS = ["scheduled_datetime", "created_at", "updated_at"]
+
+# Índices da agenda nesta versão (os com agency_id à frente vêm na 0010)
+VISIT_INDEXES = {
+    "ix_visit_scheduled_datetime_id": ["scheduled_datetime", "id"],
+    "ix_visit_status_scheduled_datetime": ["status", "scheduled_datetime"],
+    "ix_visit_client_id_scheduled_datetime": ["client_id", "scheduled_datetime"],
+    "ix_visit_property_id_scheduled_datetime": ["property_id", "scheduled_datetime"],
+}
+
+def parse_legacy_datetime(value):
+    """
+    Converte os formatos de texto usados até agora para datetime.
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('T', ' '))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def _convert_postgres(ctx):
+    columns = ctx.columns("visit")
+    for column in DATETIME_COLUMNS:
+        if isinstance(columns[column], DateTime):
+            ctx.log(f"✔️  visit.{column} já é TIMESTAMP")
+            continue
+        ctx.execute(
+            f"ALTER TABLE visit ALTER COLUMN {column} TYPE TIMESTAMP "
+            f"USING NULLIF({column}, '')::timestamp"
+        )
+        ctx.log(f"🔄 visit.{column} convertida para TIMESTAMP")
+
+def _normalize_sqlite(ctx):
+    update = text(
+        "UPDATE visit SET scheduled_datetime = :scheduled_datetime, "
+        "created_at = :created_at, updated_at = :updated_at WHERE id = :id"
+    ).bindparams(*(bindparam(column, type_=DateTime()) for column in DATETIME_COLUMNS))
+
+    def normalize(conn, rows):
+        conn.execute(update, [
+            {
+                "id": row.id,
+                "scheduled_datetime": parse_legacy_datetime(row.scheduled_datetime),
+                "created_at": parse_legacy_datetime(row.created_at) or datetime.now(),
+                "updated_at": parse_legacy_datetime(row.updated_at),
+            }
+            for row in rows
+        ])
+
+    ctx.backfill("visit_datetimes", "visit", DATETIME_COLUMNS, normalize)
+
+def upgrade(ctx):
+    if ctx.dialect == "postgresql":
+        _convert_postgres(ctx)
+    else:
+        _normalize_sqlite(ctx)
+    for name, columns in VISIT_INDEXES.items():
+        ctx.create_index(ctx.index(name, "visit", *columns))
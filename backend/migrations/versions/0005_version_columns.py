@@ -0,0 +1,11 @@
+"""Colunas de versão para concorrência otimista
+
+Substitui migrate_version_columns.py. ADD COLUMN com DEFAULT constante
+não reescreve a tabela (PostgreSQL 11+ e SQLite); os registros
+existentes começam na versão 1.
+"""
+VERSIONED_TABLES = ["client", "property", "negotiation"]
+
+def upgrade(ctx):
+    for table in VERSIONED_TABLES:
+        ctx.add_column(table, "version", "INTEGER NOT NULL DEFAULT 1")
@@ -0,0 +1,20 @@
+"""Rollup de valores dos imóveis (/properties/analytics)
+
+Substitui migrate_property_rollup.py: cria a tabela propertyvaluerollup
+no formato desta versão. O histograma é calculado a partir dos imóveis
+existentes na 0010, que recria a tabela com a imobiliária na chave. Para
+recalcular depois, use services.property_analytics.rebuild_property_rollup.
+"""
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table
+
+PROPERTY_VALUE_ROLLUP = Table(
+    "propertyvaluerollup", MetaData(),
+    Column("dimension", String, primary_key=True),
+    Column("group_value", String, primary_key=True),
+    Column("bucket", Integer, primary_key=True),
+    Column("listings", Integer, nullable=False),
+    Column("total_value", Float, nullable=False),
+)
+
+def upgrade(ctx):
+    ctx.create_table(PROPERTY_VALUE_ROLLUP)
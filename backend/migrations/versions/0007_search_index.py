@@ -0,0 +1,20 @@
+"""Índice de busca textual de clientes e imóveis (/search)
+
+Substitui migrate_search_index.py.
+
+- SQLite: tabelas FTS5 e triggers, populadas a partir dos registros
+- PostgreSQL: extensão unaccent, função crm_unaccent e índices GIN,
+  construídos com CREATE INDEX CONCURRENTLY
+"""
+from services.search import POSTGRES_DOCUMENTS, create_search_index, postgres_search_ddl, rebuild_search_index
+
+def upgrade(ctx):
+    if ctx.dialect == "postgresql":
+        for table in POSTGRES_DOCUMENTS:
+            ctx.drop_invalid_index(f"ix_{table}_search")
+        ctx.run_concurrently(postgres_search_ddl(concurrently=True))
+        ctx.log("📇 Índices GIN de busca garantidos")
+        return
+    create_search_index(ctx.engine)
+    rebuild_search_index(ctx.engine)
+    ctx.log("📇 Tabelas FTS5 criadas e populadas")
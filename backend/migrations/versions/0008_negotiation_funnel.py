@@ -0,0 +1,67 @@
+"""Histórico de status e funil das negociações (/negotiations/funnel)
+
+Substitui migrate_negotiation_funnel.py. A transição inicial das
+negociações sem histórico é gravada em lotes. Os agregados do funil são
+recalculados a partir do histórico na 0010, que recria as tabelas com a
+imobiliária na chave.
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Float, Index, Integer, MetaData, String, Table, insert
+
+metadata = MetaData()
+
+# Tabelas no formato desta versão
+NEGOTIATION_TRANSITION = Table(
+    "negotiationtransition", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("negotiation_id", Integer, nullable=False),
+    Column("from_status", String),
+    Column("to_status", String, nullable=False),
+    Column("changed_at", DateTime, nullable=False),
+    Column("seconds_in_previous", Float),
+    Index("ix_negotiationtransition_negotiation_id_id", "negotiation_id", "id"),
+)
+NEGOTIATION_STAGE_STATS = Table(
+    "negotiationstagestats", metadata,
+    Column("stage", String, primary_key=True),
+    Column("current", Integer, nullable=False),
+    Column("reached", Integer, nullable=False),
+    Column("exits", Integer, nullable=False),
+    Column("total_seconds", Float, nullable=False),
+)
+NEGOTIATION_STAGE_DURATION = Table(
+    "negotiationstageduration", metadata,
+    Column("stage", String, primary_key=True),
+    Column("bucket", Integer, primary_key=True),
+    Column("exits", Integer, nullable=False),
+)
+
+def _parse_timestamp(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def upgrade(ctx):
+    for table in (NEGOTIATION_TRANSITION, NEGOTIATION_STAGE_STATS, NEGOTIATION_STAGE_DURATION):
+        ctx.create_table(table)
+
+    def add_initial_transitions(conn, rows):
+        conn.execute(insert(NEGOTIATION_TRANSITION), [
+            {
+                "negotiation_id": row.id,
+                "from_status": None,
+                "to_status": row.status,
+                "changed_at": _parse_timestamp(row.created_at) or datetime.utcnow(),
+                "seconds_in_previous": None,
+            }
+            for row in rows
+        ])
+
+    ctx.backfill(
+        "initial_transitions", "negotiation", ["status", "created_at"], add_initial_transitions,
+        where="NOT EXISTS (SELECT 1 FROM negotiationtransition t WHERE t.negotiation_id = negotiation.id)",
+    )
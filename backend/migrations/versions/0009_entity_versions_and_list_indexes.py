@@ -0,0 +1,32 @@
+"""Contadores dos ETags e índices compostos das listagens
+
+Cria a tabela entityversion e os índices terminados em id usados pela
+paginação por cursor e pelos filtros (CREATE INDEX CONCURRENTLY no
+PostgreSQL).
+"""
+from sqlalchemy import Column, Integer, MetaData, String, Table
+
+# Tabela e índices no formato desta versão (a 0010 os refaz com agency_id)
+ENTITY_VERSION = Table(
+    "entityversion", MetaData(),
+    Column("entity", String, primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+LIST_INDEXES = [
+    ("client", "ix_client_status_id", ["status", "id"], {}),
+    ("client", "ix_client_interest_type_id", ["interest_type", "id"], {}),
+    ("property", "ix_property_type_id", ["type", "id"], {}),
+    ("property", "ix_property_status_id", ["status", "id"], {}),
+    ("property", "ix_property_value", ["value"], {}),
+    ("property", "ix_property_location_prefix", ["location"], {"postgresql_ops": {"location": "text_pattern_ops"}}),
+    ("negotiation", "ix_negotiation_status_id", ["status", "id"], {}),
+    ("negotiation", "ix_negotiation_client_id", ["client_id"], {}),
+    ("negotiation", "ix_negotiation_property_id", ["property_id"], {}),
+    ("negotiationtransition", "ix_negotiationtransition_negotiation_id_id", ["negotiation_id", "id"], {}),
+]
+
+def upgrade(ctx):
+    ctx.create_table(ENTITY_VERSION)
+    for table, name, columns, options in LIST_INDEXES:
+        ctx.create_index(ctx.index(name, table, *columns, **options))
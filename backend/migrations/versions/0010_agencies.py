@@ -0,0 +1,330 @@
+"""Imobiliárias (multi-tenant): agency_id nos usuários e registros do CRM
+
+- Cria a tabela agency com a imobiliária 1, dona de todos os registros
+  existentes
+- ADD COLUMN agency_id NOT NULL DEFAULT 1, que não reescreve a tabela
+  (PostgreSQL 11+ e SQLite). No PostgreSQL o DEFAULT é removido em
+  seguida e a foreign key entra como NOT VALID e é validada depois
+  (VALIDATE CONSTRAINT não bloqueia escritas); no SQLite, onde as foreign
+  keys não são verificadas, o DEFAULT fica
+- Tabelas derivadas (rollup de valores, funil, versões dos ETags) são
+  recriadas com a imobiliária na chave e recalculadas
+- Índices compostos passam a começar por agency_id (CONCURRENTLY no
+  PostgreSQL); os antigos são removidos depois que os novos existem
+"""
+import math
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, DateTime, Float, Integer, MetaData, String, Table, case, cast, delete, func, insert, literal, select,
+    text, union_all,
+)
+
+DEFAULT_AGENCY_ID = 1
+DEFAULT_AGENCY_NAME = "Imobiliária principal"
+
+TENANT_TABLES = ["user", "client", "property", "visit", "negotiation", "negotiationtransition"]
+
+# Etapas do funil e faixas logarítmicas nesta versão
+FUNNEL_STAGES = ["Novo", "Em contato", "Visita", "Proposta", "Fechado"]
+PROPERTY_BUCKET_RATIO = 1.05
+DURATION_BUCKET_RATIO = 1.1
+
+metadata = MetaData()
+
+# Tabelas no formato desta versão (só as colunas lidas nas de origem)
+AGENCY = Table(
+    "agency", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+PROPERTY = Table(
+    "property", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("agency_id", Integer),
+    Column("type", String),
+    Column("location", String),
+    Column("value", Float),
+    Column("status", String),
+)
+NEGOTIATION = Table(
+    "negotiation", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("agency_id", Integer),
+    Column("status", String),
+    Column("created_at", String),
+)
+NEGOTIATION_TRANSITION = Table(
+    "negotiationtransition", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("agency_id", Integer),
+    Column("negotiation_id", Integer),
+    Column("from_status", String),
+    Column("to_status", String),
+    Column("changed_at", DateTime),
+    Column("seconds_in_previous", Float),
+)
+PROPERTY_VALUE_ROLLUP = Table(
+    "propertyvaluerollup", metadata,
+    Column("agency_id", Integer, primary_key=True),
+    Column("dimension", String, primary_key=True),
+    Column("group_value", String, primary_key=True),
+    Column("bucket", Integer, primary_key=True),
+    Column("listings", Integer, nullable=False),
+    Column("total_value", Float, nullable=False),
+)
+NEGOTIATION_STAGE_STATS = Table(
+    "negotiationstagestats", metadata,
+    Column("agency_id", Integer, primary_key=True),
+    Column("stage", String, primary_key=True),
+    Column("current", Integer, nullable=False),
+    Column("reached", Integer, nullable=False),
+    Column("exits", Integer, nullable=False),
+    Column("total_seconds", Float, nullable=False),
+)
+NEGOTIATION_STAGE_DURATION = Table(
+    "negotiationstageduration", metadata,
+    Column("agency_id", Integer, primary_key=True),
+    Column("stage", String, primary_key=True),
+    Column("bucket", Integer, primary_key=True),
+    Column("exits", Integer, nullable=False),
+)
+ENTITY_VERSION = Table(
+    "entityversion", metadata,
+    Column("agency_id", Integer, primary_key=True),
+    Column("entity", String, primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+DERIVED_TABLES = [PROPERTY_VALUE_ROLLUP, NEGOTIATION_STAGE_STATS, NEGOTIATION_STAGE_DURATION, ENTITY_VERSION]
+
+NEW_INDEXES = [
+    ("client", "ix_client_agency_id_id", ["agency_id", "id"], {}),
+    ("client", "ix_client_agency_id_status_id", ["agency_id", "status", "id"], {}),
+    ("client", "ix_client_agency_id_interest_type_id", ["agency_id", "interest_type", "id"], {}),
+    ("property", "ix_property_agency_id_id", ["agency_id", "id"], {}),
+    ("property", "ix_property_agency_id_type_id", ["agency_id", "type", "id"], {}),
+    ("property", "ix_property_agency_id_status_id", ["agency_id", "status", "id"], {}),
+    ("property", "ix_property_agency_id_value", ["agency_id", "value"], {}),
+    (
+        "property", "ix_property_agency_id_location_prefix", ["agency_id", "location"],
+        {"postgresql_ops": {"location": "text_pattern_ops"}},
+    ),
+    ("visit", "ix_visit_agency_id_scheduled_datetime_id", ["agency_id", "scheduled_datetime", "id"], {}),
+    ("visit", "ix_visit_agency_id_status_scheduled_datetime", ["agency_id", "status", "scheduled_datetime"], {}),
+    ("negotiation", "ix_negotiation_agency_id_id", ["agency_id", "id"], {}),
+    ("negotiation", "ix_negotiation_agency_id_status_id", ["agency_id", "status", "id"], {}),
+]
+
+# Substituídos pelos índices acima
+OLD_INDEXES = [
+    ("client", "ix_client_status_id"),
+    ("client", "ix_client_interest_type_id"),
+    ("property", "ix_property_type_id"),
+    ("property", "ix_property_status_id"),
+    ("property", "ix_property_value"),
+    ("property", "ix_property_location_prefix"),
+    ("visit", "ix_visit_scheduled_datetime_id"),
+    ("visit", "ix_visit_status_scheduled_datetime"),
+    ("negotiation", "ix_negotiation_status_id"),
+]
+
+def _create_default_agency(ctx):
+    ctx.create_table(AGENCY)
+    with ctx.transaction() as conn:
+        exists = conn.execute(text("SELECT 1 FROM agency WHERE id = :id"), {"id": DEFAULT_AGENCY_ID}).first()
+        if exists:
+            return
+        conn.execute(
+            text("INSERT INTO agency (id, name, created_at) VALUES (:id, :name, CURRENT_TIMESTAMP)"),
+            {"id": DEFAULT_AGENCY_ID, "name": DEFAULT_AGENCY_NAME},
+        )
+        if ctx.dialect == "postgresql":
+            conn.execute(text("SELECT setval(pg_get_serial_sequence('agency', 'id'), (SELECT max(id) FROM agency))"))
+    ctx.log(f"🏢 Imobiliária {DEFAULT_AGENCY_ID} ({DEFAULT_AGENCY_NAME}) criada")
+
+def _add_postgres_foreign_key(ctx, table: str):
+    quoted = ctx.quote(table)
+    constraint = f"{table}_agency_id_fkey"
+    with ctx.transaction() as conn:
+        conn.execute(text(f"ALTER TABLE {quoted} ALTER COLUMN agency_id DROP DEFAULT"))
+        exists = conn.execute(text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": constraint}).first()
+        if not exists:
+            conn.execute(text(
+                f"ALTER TABLE {quoted} ADD CONSTRAINT {constraint} "
+                f"FOREIGN KEY (agency_id) REFERENCES agency (id) NOT VALID"
+            ))
+    with ctx.transaction() as conn:
+        conn.execute(text(f"ALTER TABLE {quoted} VALIDATE CONSTRAINT {constraint}"))
+    ctx.log(f"🔗 Foreign key {constraint} validada")
+
+def _parse_timestamp(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def _add_missing_transitions(ctx):
+    """Transição inicial das negociações criadas sem histórico, em lotes."""
+    def add(conn, rows):
+        conn.execute(insert(NEGOTIATION_TRANSITION), [
+            {
+                "agency_id": row.agency_id,
+                "negotiation_id": row.id,
+                "from_status": None,
+                "to_status": row.status,
+                "changed_at": _parse_timestamp(row.created_at) or datetime.utcnow(),
+                "seconds_in_previous": None,
+            }
+            for row in rows
+        ])
+
+    ctx.backfill(
+        "initial_transitions_by_agency", "negotiation", ["agency_id", "status", "created_at"], add,
+        where="NOT EXISTS (SELECT 1 FROM negotiationtransition t WHERE t.negotiation_id = negotiation.id)",
+    )
+
+def _use_python_math(conn):
+    # Nem todo SQLite é compilado com ln()/floor(); as do Python dão as
+    # mesmas faixas de services/rollups.log_bucket
+    if conn.dialect.name == "sqlite":
+        dbapi_connection = conn.connection.driver_connection
+        dbapi_connection.create_function("ln", 1, math.log, deterministic=True)
+        dbapi_connection.create_function("floor", 1, math.floor, deterministic=True)
+
+def _log_bucket(conn, column, ratio: float):
+    """floor(log(max(valor, 1)) / log(ratio)) em SQL."""
+    value = func.coalesce(column, 0.0)
+    clamped = func.greatest(value, 1.0) if conn.dialect.name == "postgresql" else func.max(value, 1.0)
+    return cast(func.floor(func.ln(clamped) / math.log(ratio)), Integer)
+
+def _rebuild_property_rollup(conn):
+    p = PROPERTY
+    rows = select(
+        p.c.agency_id,
+        func.coalesce(p.c.location, "").label("location"),
+        func.coalesce(p.c.type, "").label("type"),
+        func.coalesce(p.c.status, "").label("status"),
+        func.coalesce(p.c.value, 0.0).label("value"),
+        _log_bucket(conn, p.c.value, PROPERTY_BUCKET_RATIO).label("bucket"),
+    ).subquery()
+    groups = [
+        ("location", rows.c.location), ("type", rows.c.type), ("status", rows.c.status), ("all", None),
+    ]
+    selects = []
+    for dimension, group in groups:
+        keys = [rows.c.agency_id, rows.c.bucket] + ([group] if group is not None else [])
+        selects.append(
+            select(
+                rows.c.agency_id,
+                literal(dimension, String).label("dimension"),
+                (group if group is not None else literal("", String)).label("group_value"),
+                rows.c.bucket,
+                func.count().label("listings"),
+                func.sum(rows.c.value).label("total_value"),
+            ).group_by(*keys)
+        )
+    rollup = PROPERTY_VALUE_ROLLUP
+    conn.execute(delete(rollup))
+    conn.execute(insert(rollup).from_select(
+        ["agency_id", "dimension", "group_value", "bucket", "listings", "total_value"], union_all(*selects),
+    ))
+
+def _stage_counts(agency_id, stage, current=0, reached=0, exits=0, total_seconds=0.0):
+    """Linha de contribuição para os agregados de uma etapa (0 nos contadores omitidos)."""
+    values = {"current": current, "reached": reached, "exits": exits, "total_seconds": total_seconds}
+    counters = [
+        (literal(value, Float if name == "total_seconds" else Integer) if isinstance(value, (int, float)) else value)
+        .label(name)
+        for name, value in values.items()
+    ]
+    return select(agency_id.label("agency_id"), stage.label("stage"), *counters)
+
+def _rebuild_pipeline_stats(conn):
+    """
+    Mesmos agregados de services/negotiation_pipeline.rebuild_pipeline_stats:
+    chegar a uma etapa do funil conta como ter passado pelas anteriores;
+    status fora do funil contam uma vez por negociação.
+    """
+    t, n = NEGOTIATION_TRANSITION, NEGOTIATION
+    rank = case({stage: i for i, stage in enumerate(FUNNEL_STAGES)}, value=t.c.to_status)
+    best = (
+        select(t.c.agency_id, t.c.negotiation_id, func.max(rank).label("best"))
+        .group_by(t.c.agency_id, t.c.negotiation_id)
+        .subquery()
+    )
+    contributions = [
+        _stage_counts(n.c.agency_id, n.c.status, current=func.count())
+        .group_by(n.c.agency_id, n.c.status),
+        _stage_counts(t.c.agency_id, t.c.to_status, reached=func.count(t.c.negotiation_id.distinct()))
+        .where(t.c.to_status.not_in(FUNNEL_STAGES))
+        .group_by(t.c.agency_id, t.c.to_status),
+        _stage_counts(
+            t.c.agency_id, t.c.from_status, exits=func.count(), total_seconds=func.sum(t.c.seconds_in_previous),
+        )
+        .where(t.c.from_status.is_not(None), t.c.seconds_in_previous.is_not(None))
+        .group_by(t.c.agency_id, t.c.from_status),
+    ]
+    for i, stage in enumerate(FUNNEL_STAGES):
+        contributions.append(
+            _stage_counts(best.c.agency_id, literal(stage, String), reached=func.count())
+            .where(best.c.best >= i)
+            .group_by(best.c.agency_id)
+        )
+    u = union_all(*contributions).subquery()
+    stats = NEGOTIATION_STAGE_STATS
+    conn.execute(delete(stats))
+    conn.execute(insert(stats).from_select(
+        ["agency_id", "stage", "current", "reached", "exits", "total_seconds"],
+        select(
+            u.c.agency_id, u.c.stage,
+            func.sum(u.c.current), func.sum(u.c.reached), func.sum(u.c.exits), func.sum(u.c.total_seconds),
+        ).group_by(u.c.agency_id, u.c.stage),
+    ))
+
+    exits = (
+        select(
+            t.c.agency_id, t.c.from_status.label("stage"),
+            _log_bucket(conn, t.c.seconds_in_previous, DURATION_BUCKET_RATIO).label("bucket"),
+        )
+        .where(t.c.from_status.is_not(None), t.c.seconds_in_previous.is_not(None))
+        .subquery()
+    )
+    durations = NEGOTIATION_STAGE_DURATION
+    conn.execute(delete(durations))
+    conn.execute(insert(durations).from_select(
+        ["agency_id", "stage", "bucket", "exits"],
+        select(exits.c.agency_id, exits.c.stage, exits.c.bucket, func.count())
+        .group_by(exits.c.agency_id, exits.c.stage, exits.c.bucket),
+    ))
+
+def _recreate_derived_tables(ctx):
+    for table in DERIVED_TABLES:
+        if ctx.has_table(table.name) and not ctx.has_column(table.name, "agency_id"):
+            ctx.drop_table(table.name)
+        ctx.create_table(table)
+    _add_missing_transitions(ctx)
+    with ctx.transaction() as conn:
+        _use_python_math(conn)
+        _rebuild_property_rollup(conn)
+        _rebuild_pipeline_stats(conn)
+    ctx.log("📊 Rollup de valores e funil recalculados por imobiliária")
+
+def upgrade(ctx):
+    _create_default_agency(ctx)
+    definition = f"INTEGER NOT NULL DEFAULT {DEFAULT_AGENCY_ID}"
+    if ctx.dialect != "postgresql":
+        definition += " REFERENCES agency (id)"
+    for table in TENANT_TABLES:
+        ctx.add_column(table, "agency_id", definition)
+        if ctx.dialect == "postgresql":
+            _add_postgres_foreign_key(ctx, table)
+
+    _recreate_derived_tables(ctx)
+
+    for table, name, columns, options in NEW_INDEXES:
+        ctx.create_index(ctx.index(name, table, *columns, **options))
+    for table, name in OLD_INDEXES:
+        ctx.drop_index(table, name)
@@ -0,0 +1,41 @@
+"""Row-level security por imobiliária (PostgreSQL)
+
+Segunda barreira ao filtro da sessão (services/tenancy.py): cada tabela
+com agency_id ganha a política agency_isolation, que só deixa ler e
+gravar linhas da imobiliária em app.agency_id, também para o dono da
+tabela (FORCE ROW LEVEL SECURITY).
+
+Sem app.agency_id definido (scripts, migrações, DB_ROW_LEVEL_SECURITY
+desligado) a política libera todas as linhas, então aplicar esta
+migração não muda nada até a aplicação passar a definir a variável.
+No SQLite não há row-level security e a migração não faz nada.
+"""
+POLICY = "agency_isolation"
+POLICY_CONDITION = (
+    "coalesce(current_setting('app.agency_id', true), '') = '' "
+    "OR agency_id = current_setting('app.agency_id', true)::integer"
+)
+
+# Tabelas com agency_id nesta versão
+TENANT_TABLES = [
+    "client", "property", "visit", "negotiation", "negotiationtransition",
+    "propertyvaluerollup", "negotiationstagestats", "negotiationstageduration", "entityversion",
+]
+
+def _policy_ddl(table: str):
+    return [
+        f"DROP POLICY IF EXISTS {POLICY} ON {table}",
+        f"CREATE POLICY {POLICY} ON {table} USING ({POLICY_CONDITION}) WITH CHECK ({POLICY_CONDITION})",
+        f"ALTER TABLE {table} ENABLE ROW LEVEL SECURITY",
+        f"ALTER TABLE {table} FORCE ROW LEVEL SECURITY",
+    ]
+
+def upgrade(ctx):
+    if ctx.dialect != "postgresql":
+        ctx.log("✔️  Row-level security só existe no PostgreSQL")
+        return
+    for table in TENANT_TABLES:
+        with ctx.transaction() as conn:
+            for statement in _policy_ddl(table):
+                conn.exec_driver_sql(statement)
+        ctx.log(f"🔒 Política {POLICY} em {table}")
@@ -0,0 +1,16 @@
+"""Heartbeat das réplicas de leitura
+
+Tabela replicaheartbeat, com uma linha gravada no primário pela
+verificação das réplicas (services/read_replicas.py); a primeira
+verificação insere a linha.
+"""
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table
+
+REPLICA_HEARTBEAT = Table(
+    "replicaheartbeat", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("beat_at", DateTime, nullable=False),
+)
+
+def upgrade(ctx):
+    ctx.create_table(REPLICA_HEARTBEAT)
@@ -0,0 +1,32 @@
+"""Feed de alterações (SSE e WebSocket)
+
+Tabelas changefeedhead (posição atual do feed por imobiliária) e
+changeevent (eventos gravados na transação de cada escrita em clientes,
+imóveis, visitas e negociações; services/change_feed.py). O feed começa
+vazio: só as escritas feitas depois da migração geram eventos.
+"""
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table
+
+metadata = MetaData()
+
+CHANGE_FEED_HEAD = Table(
+    "changefeedhead", metadata,
+    Column("agency_id", Integer, primary_key=True),
+    Column("seq", Integer, nullable=False),
+)
+CHANGE_EVENT = Table(
+    "changeevent", metadata,
+    Column("agency_id", Integer, primary_key=True),
+    Column("seq", Integer, primary_key=True),
+    Column("entity", String, nullable=False),
+    Column("action", String, nullable=False),
+    Column("entity_id", Integer),
+    Column("user_id", Integer),
+    Column("data", String),
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_changeevent_created_at", "created_at"),
+)
+
+def upgrade(ctx):
+    ctx.create_table(CHANGE_FEED_HEAD)
+    ctx.create_table(CHANGE_EVENT)
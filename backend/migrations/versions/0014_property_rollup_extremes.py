@@ -0,0 +1,89 @@
+"""Mínimo e máximo exatos no rollup de valores dos imóveis
+
+Colunas min_value e max_value em propertyvaluerollup, mantidas pelas
+escritas em property (services/property_analytics.py). O rollup é
+recalculado para preencher os extremos das faixas existentes.
+"""
+import math
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, cast, delete, func, insert, literal, select
+
+BUCKET_RATIO = 1.05
+
+metadata = MetaData()
+
+# Tabelas no formato desta versão (só as colunas lidas em property)
+PROPERTY = Table(
+    "property", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("agency_id", Integer),
+    Column("type", String),
+    Column("location", String),
+    Column("value", Float),
+    Column("status", String),
+)
+PROPERTY_VALUE_ROLLUP = Table(
+    "propertyvaluerollup", metadata,
+    Column("agency_id", Integer, primary_key=True),
+    Column("dimension", String, primary_key=True),
+    Column("group_value", String, primary_key=True),
+    Column("bucket", Integer, primary_key=True),
+    Column("listings", Integer, nullable=False),
+    Column("total_value", Float, nullable=False),
+    Column("min_value", Float),
+    Column("max_value", Float),
+)
+
+def _use_python_math(conn):
+    # Nem todo SQLite é compilado com ln()/floor(); as do Python dão as
+    # mesmas faixas de services/rollups.log_bucket
+    if conn.dialect.name == "sqlite":
+        dbapi_connection = conn.connection.driver_connection
+        dbapi_connection.create_function("ln", 1, math.log, deterministic=True)
+        dbapi_connection.create_function("floor", 1, math.floor, deterministic=True)
+
+def _rebuild_rollup(conn):
+    """Recalcula o rollup (com os extremos) em um INSERT ... SELECT."""
+    p = PROPERTY
+    value = func.coalesce(p.c.value, 0.0)
+    clamped = func.greatest(value, 1.0) if conn.dialect.name == "postgresql" else func.max(value, 1.0)
+    rows = select(
+        p.c.agency_id,
+        func.coalesce(p.c.location, "").label("location"),
+        func.coalesce(p.c.type, "").label("type"),
+        func.coalesce(p.c.status, "").label("status"),
+        value.label("value"),
+        cast(func.floor(func.ln(clamped) / math.log(BUCKET_RATIO)), Integer).label("bucket"),
+    ).subquery()
+    groups = [
+        ("location", rows.c.location), ("type", rows.c.type), ("status", rows.c.status), ("all", None),
+    ]
+    selects = []
+    for dimension, group in groups:
+        keys = [rows.c.agency_id, rows.c.bucket] + ([group] if group is not None else [])
+        selects.append(
+            select(
+                rows.c.agency_id,
+                literal(dimension, String).label("dimension"),
+                (group if group is not None else literal("", String)).label("group_value"),
+                rows.c.bucket,
+                func.count().label("listings"),
+                func.sum(rows.c.value).label("total_value"),
+                func.min(rows.c.value).label("min_value"),
+                func.max(rows.c.value).label("max_value"),
+            ).group_by(*keys)
+        )
+    rollup = PROPERTY_VALUE_ROLLUP
+    conn.execute(delete(rollup))
+    conn.execute(insert(rollup).from_select(
+        ["agency_id", "dimension", "group_value", "bucket", "listings", "total_value", "min_value", "max_value"],
+        selects[0].union_all(*selects[1:]),
+    ))
+
+def upgrade(ctx):
+    ctx.add_column("propertyvaluerollup", "min_value", "FLOAT")
+    ctx.add_column("propertyvaluerollup", "max_value", "FLOAT")
+    with ctx.transaction() as conn:
+        _use_python_math(conn)
+        _rebuild_rollup(conn)
+    ctx.log("📊 Rollup de valores recalculado com mínimo e máximo por faixa")
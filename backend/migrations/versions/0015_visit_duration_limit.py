@@ -0,0 +1,68 @@
+"""Duração máxima das visitas no banco (480 minutos)
+
+A detecção de conflitos (services/visit_schedule.py) só procura visitas
+que começaram até 480 minutos antes da nova; uma visita antiga mais
+longa passaria despercebida. A migração garante o limite no banco:
+
+- PostgreSQL: CHECK ck_visit_duration_minutes_max, criada NOT VALID (vale
+  para as escritas a partir daí sem varrer a tabela) e validada depois
+  (VALIDATE CONSTRAINT não bloqueia escritas)
+- SQLite, que não aceita ADD CONSTRAINT: triggers que rejeitam INSERT e
+  UPDATE acima do limite (bancos novos têm a CHECK na própria tabela)
+
+Os registros existentes não são alterados: se alguma visita passa do
+limite, a migração falha listando os ids e continua pendente até que
+elas sejam corrigidas (a duração certa só quem agendou sabe).
+"""
+from sqlalchemy import text
+
+from migrations.runner import MigrationError
+
+MAX_DURATION_MINUTES = 480
+# Ids listados na mensagem de erro
+MAX_REPORTED_IDS = 50
+CONSTRAINT = "ck_visit_duration_minutes_max"
+CONDITION = f"duration_minutes IS NULL OR duration_minutes <= {MAX_DURATION_MINUTES}"
+
+def _sqlite_triggers():
+    message = f"visit.duration_minutes acima de {MAX_DURATION_MINUTES}"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {CONSTRAINT}_{event.split()[0].lower()} "
+        f"BEFORE {event} ON visit WHEN NEW.duration_minutes > {MAX_DURATION_MINUTES} "
+        f"BEGIN SELECT RAISE(ABORT, '{message}'); END"
+        for event in ("INSERT", "UPDATE OF duration_minutes")
+    ]
+
+def _check_existing_visits(ctx):
+    with ctx.transaction() as conn:
+        too_long = conn.execute(
+            text(f"SELECT id FROM visit WHERE duration_minutes > {MAX_DURATION_MINUTES} ORDER BY id")
+        ).scalars().all()
+    if not too_long:
+        return
+    ids = ", ".join(str(visit_id) for visit_id in too_long[:MAX_REPORTED_IDS])
+    if len(too_long) > MAX_REPORTED_IDS:
+        ids += f" e mais {len(too_long) - MAX_REPORTED_IDS}"
+    raise MigrationError(
+        f"{len(too_long)} visita(s) com duração acima de {MAX_DURATION_MINUTES} minutos (ids {ids}); "
+        f"corrija a duração ou divida a visita e execute as migrações de novo"
+    )
+
+def upgrade(ctx):
+    if ctx.dialect == "postgresql":
+        with ctx.transaction() as conn:
+            exists = conn.execute(text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": CONSTRAINT}).first()
+            if not exists:
+                conn.execute(text(f"ALTER TABLE visit ADD CONSTRAINT {CONSTRAINT} CHECK ({CONDITION}) NOT VALID"))
+    else:
+        with ctx.transaction() as conn:
+            for statement in _sqlite_triggers():
+                conn.execute(text(statement))
+    ctx.log(f"🔒 Escritas com duração acima de {MAX_DURATION_MINUTES} minutos rejeitadas")
+
+    _check_existing_visits(ctx)
+
+    if ctx.dialect == "postgresql":
+        with ctx.transaction() as conn:
+            conn.execute(text(f"ALTER TABLE visit VALIDATE CONSTRAINT {CONSTRAINT}"))
+        ctx.log(f"🔗 Constraint {CONSTRAINT} validada")
@@ -0,0 +1 @@
+# Uma migração por módulo: NNNN_descricao.py com upgrade(ctx)
@@ -1,17 +1,226 @@
 from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from contextlib import contextmanager
+import logging
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./crm.db")
-engine = create_engine(DATABASE_URL, echo=True)
+# Modo assíncrono: rotas de CRUD usam AsyncSession (aiosqlite/asyncpg)
+DB_ASYNC = _env_bool("DB_ASYNC", False)
+
+# Configuração do engine (variáveis de ambiente)
+DB_ECHO = _env_bool("DB_ECHO", False)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+slow_query_logger = logging.getLogger("crm.sql.slow")
+
+def _configure_sqlite(engine, in_memory: bool):
+    """
+    WAL permite leituras concorrentes com um escritor; synchronous=NORMAL
+    é seguro com WAL; busy_timeout faz escritores esperarem o lock em vez
+    de falhar com "database is locked".
+    """
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+def _log_slow_queries(engine, threshold_ms: float):
+    """
+    Registra no logger crm.sql.slow os comandos acima do limite.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _check_duration(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+        if elapsed_ms >= threshold_ms:
+            slow_query_logger.warning("Consulta lenta (%.1f ms): %s", elapsed_ms, statement)
+
+def _engine_kwargs(url, echo: bool = None, is_async: bool = False) -> dict:
+    backend = url.get_backend_name()
+    kwargs = {"echo": DB_ECHO if echo is None else echo}
+    if backend != "sqlite":
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    if backend == "postgresql" and DB_STATEMENT_TIMEOUT_MS > 0:
+        if is_async:
+            kwargs["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            kwargs["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return kwargs
+
+def _configure_engine_events(engine, url, name: str):
+    from services.metrics import instrument_engine
+    from services.profiling import profile_engine
+
+    if url.get_backend_name() == "sqlite":
+        _configure_sqlite(engine, in_memory=not url.database or url.database == ":memory:")
+    if DB_SLOW_QUERY_MS > 0:
+        _log_slow_queries(engine, DB_SLOW_QUERY_MS)
+    # Contagem e tempo de SQL e espera no pool para /metrics
+    instrument_engine(engine, name)
+    # SQL das requisições perfiladas (/admin/profiles)
+    profile_engine(engine, name)
+
+def create_db_engine(url: str = None, echo: bool = None, name: str = "sync"):
+    """
+    Cria o engine conforme o banco e as variáveis de ambiente. `name`
+    identifica o engine nas métricas e nos perfis (ex.: "replica1").
+
+    - PostgreSQL/MySQL: pool com tamanho, overflow, timeout, recycle e
+      pre-ping configuráveis; no PostgreSQL, statement_timeout por conexão
+    - SQLite: WAL, synchronous=NORMAL e busy_timeout
+    - Todos: echo desligado por padrão, log de consultas lentas e métricas
+    """
+    url = make_url(url or DATABASE_URL)
+    engine = create_engine(url, **_engine_kwargs(url, echo))
+    _configure_engine_events(engine, url, name)
+    return engine
+
+engine = create_db_engine()
+
+# Engine assíncrono
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def to_async_url(url: str):
+    """Troca o driver da URL pelo equivalente assíncrono (aiosqlite/asyncpg)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Banco sem driver assíncrono configurado: {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+def create_async_db_engine(url: str = None, echo: bool = None, name: str = "async"):
+    """
+    Versão assíncrona de create_db_engine, com as mesmas configurações.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = to_async_url(url or DATABASE_URL)
+    async_engine = create_async_engine(url, **_engine_kwargs(url, echo, is_async=True))
+    _configure_engine_events(async_engine.sync_engine, url, name)
+    return async_engine
+
+_async_engine = None
+
+def get_async_engine():
+    """Engine assíncrono, criado no primeiro uso (só exige aiosqlite/asyncpg no modo assíncrono)."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_db_engine()
+    return _async_engine
 
 # Função para criar as tabelas
 def create_db_and_tables():
+    """
+    Banco vazio: cria as tabelas no formato atual e registra todas as
+    migrações como aplicadas. Banco existente: aplica as migrações
+    pendentes de migrations/versions (ver migrate.py).
+    """
+    from migrations.runner import stamp, upgrade
+
+    if inspect(engine).get_table_names():
+        upgrade(engine)
+        return
     SQLModel.metadata.create_all(engine)
+    # Índice de busca textual (FTS5 no SQLite, tsvector no PostgreSQL)
+    from services.search import create_search_index
+    create_search_index(engine)
+    # Políticas de row-level security por imobiliária (PostgreSQL)
+    from services.tenancy import create_row_level_security
+    create_row_level_security(engine)
+    stamp(engine)
 
 # Função para obter sessão
+# expire_on_commit=False: depois do commit os objetos continuam com os
+# valores já conhecidos (o id vem do INSERT ... RETURNING), então as rotas
+# devolvem o objeto sem um SELECT de refresh. A sessão só enxerga os dados
+# da imobiliária do usuário autenticado (services/tenancy.py) e, nos GETs,
+# pode ler de uma réplica (services/read_replicas.py)
 def get_session():
-    with Session(engine) as session:
+    from services.read_replicas import read_engine
+    from services.tenancy import require_agency
+
+    with Session(read_engine(), expire_on_commit=False) as session:
+        require_agency(session)
+        yield session
+
+# Função para obter sessão assíncrona
+async def get_async_session():
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    from services.read_replicas import read_async_engine
+    from services.tenancy import require_agency
+
+    async with AsyncSession(read_async_engine(), expire_on_commit=False) as session:
+        require_agency(session)
         yield session
+
+# Contagem de consultas (para testes de regressão de N+1)
+class QueryCounter:
+    """Acumula os comandos SQL executados enquanto estiver registrado no engine."""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+@contextmanager
+def count_queries(bind=None):
+    """
+    Conta os comandos SQL executados dentro do bloco.
+
+    Exemplo:
+        with count_queries() as counter:
+            client.get("/visits/")
+        print(counter.count)
+    """
+    bind = bind or engine
+    counter = QueryCounter()
+    event.listen(bind, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(bind, "before_cursor_execute", counter)
+
+@contextmanager
+def assert_num_queries(expected: int, bind=None):
+    """
+    Falha com AssertionError se o bloco não executar exatamente `expected` consultas.
+    """
+    with count_queries(bind) as counter:
+        yield counter
+    if counter.count != expected:
+        executed = "\n".join(counter.statements)
+        raise AssertionError(f"Esperadas {expected} consultas, executadas {counter.count}:\n{executed}")
@@ -1,30 +1,97 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import CheckConstraint, Index, DateTime
+from sqlalchemy.orm import declared_attr
 from typing import Optional
 from datetime import datetime
 
+def _version_field():
+    # Concorrência otimista: cada UPDATE do ORM exige a versão carregada e a incrementa
+    return Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+def _agency_field():
+    # Imobiliária dona do registro; preenchida pela sessão (services/tenancy.py)
+    return Field(foreign_key="agency.id")
+
+class VersionedMixin:
+    @declared_attr
+    def __mapper_args__(cls):
+        return {"version_id_col": cls.__table__.c.version}
+
+class Agency(SQLModel, table=True):
+    # Imobiliária (tenant): usuários e registros do CRM pertencem a uma só
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    created_at: datetime = Field(default_factory=datetime.utcnow, sa_type=DateTime)
+
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str = Field(index=True, unique=True)
     email: str = Field(index=True, unique=True)
     hashed_password: str
     is_active: bool = Field(default=True)
+    agency_id: int = _agency_field()
+
+class Property(VersionedMixin, SQLModel, table=True):
+    # Índices compostos começam pela imobiliária (toda consulta filtra por
+    # ela) e terminam em id para servir a paginação por cursor
+    __table_args__ = (
+        Index("ix_property_agency_id_id", "agency_id", "id"),
+        Index("ix_property_agency_id_type_id", "agency_id", "type", "id"),
+        Index("ix_property_agency_id_status_id", "agency_id", "status", "id"),
+        Index("ix_property_agency_id_value", "agency_id", "value"),
+        Index(
+            "ix_property_agency_id_location_prefix", "agency_id", "location",
+            postgresql_ops={"location": "text_pattern_ops"},
+        ),
+    )
 
-class Property(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    agency_id: int = _agency_field()
     type: str
     location: str
     value: float
     description: Optional[str] = None
     status: str
+    version: int = _version_field()
+
+class PropertyValueRollup(SQLModel, table=True):
+    # Histograma de valores dos imóveis por localização, tipo e status
+    # (dimension = "location" | "type" | "status" | "all"), mantido a cada
+    # escrita em Property por services/property_analytics.py
+    agency_id: int = Field(primary_key=True)
+    dimension: str = Field(primary_key=True)
+    group_value: str = Field(primary_key=True)
+    bucket: int = Field(primary_key=True)  # floor(log(valor) / log(BUCKET_RATIO))
+    listings: int = Field(default=0)
+    total_value: float = Field(default=0.0)
+    # Menor e maior valor exatos da faixa (None com a faixa vazia)
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+
+class EntityVersion(SQLModel, table=True):
+    # Contador de escritas por tabela (client, property, visit, negotiation),
+    # incrementado na mesma transação da escrita; base dos ETags em
+    # services/http_cache.py
+    agency_id: int = Field(primary_key=True)
+    entity: str = Field(primary_key=True)
+    version: int = Field(default=0)
+
+class Client(VersionedMixin, SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_client_agency_id_id", "agency_id", "id"),
+        Index("ix_client_agency_id_status_id", "agency_id", "status", "id"),
+        Index("ix_client_agency_id_interest_type_id", "agency_id", "interest_type", "id"),
+    )
 
-class Client(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    agency_id: int = _agency_field()
     name: str
     phone: str
     email: str
     interest_type: str
     status: str = Field(default="Lead")
     preferences: Optional[str] = None
+    version: int = _version_field()
 
 class Visit(SQLModel, table=True):
     """
@@ -33,24 +100,119 @@ class Visit(SQLModel, table=True):
     Representa o agendamento de uma visita entre um cliente e um imóvel,
     incluindo data/hora, status da visita e observações.
     """
+    __table_args__ = (
+        Index("ix_visit_agency_id_scheduled_datetime_id", "agency_id", "scheduled_datetime", "id"),
+        Index("ix_visit_agency_id_status_scheduled_datetime", "agency_id", "status", "scheduled_datetime"),
+        # Cliente e imóvel já são de uma só imobiliária
+        Index("ix_visit_client_id_scheduled_datetime", "client_id", "scheduled_datetime"),
+        Index("ix_visit_property_id_scheduled_datetime", "property_id", "scheduled_datetime"),
+        # Limite de services/visit_schedule.MAX_DURATION_MINUTES, do qual
+        # depende a janela da detecção de conflitos
+        CheckConstraint("duration_minutes IS NULL OR duration_minutes <= 480", name="ck_visit_duration_minutes_max"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    agency_id: int = _agency_field()
     client_id: int = Field(foreign_key="client.id", description="ID do cliente que fará a visita")
     property_id: int = Field(foreign_key="property.id", description="ID do imóvel a ser visitado")
-    scheduled_datetime: str = Field(description="Data e hora agendada para a visita (YYYY-MM-DD HH:MM)")
+    # Datas sem fuso (horário local), como o restante do sistema
+    scheduled_datetime: datetime = Field(sa_type=DateTime, description="Data e hora agendada para a visita")
     status: str = Field(default="Agendada", description="Status da visita: Agendada, Realizada, Cancelada, Reagendada")
     notes: Optional[str] = Field(default=None, description="Observações sobre a visita")
-    created_at: str = Field(default_factory=lambda: datetime.now().isoformat(), description="Data de criação do agendamento")
-    updated_at: Optional[str] = Field(default=None, description="Data da última atualização")
+    created_at: datetime = Field(default_factory=datetime.now, sa_type=DateTime, description="Data de criação do agendamento")
+    updated_at: Optional[datetime] = Field(default=None, sa_type=DateTime, description="Data da última atualização")
     
     # Campos opcionais para melhor controle
     duration_minutes: Optional[int] = Field(default=60, description="Duração estimada da visita em minutos")
     agent_notes: Optional[str] = Field(default=None, description="Notas internas do corretor")
     client_feedback: Optional[str] = Field(default=None, description="Feedback do cliente após a visita")
 
-class Negotiation(SQLModel, table=True):
+class Negotiation(VersionedMixin, SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_negotiation_agency_id_id", "agency_id", "id"),
+        Index("ix_negotiation_agency_id_status_id", "agency_id", "status", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    client_id: int = Field(foreign_key="client.id")
-    property_id: int = Field(foreign_key="property.id")
+    agency_id: int = _agency_field()
+    client_id: int = Field(foreign_key="client.id", index=True)
+    property_id: int = Field(foreign_key="property.id", index=True)
     status: str # Novo, Em contato, Visita, Proposta, Fechado, Perdido
     created_at: str
     updated_at: Optional[str] = None
+    version: int = _version_field()
+
+class NegotiationTransition(SQLModel, table=True):
+    # Histórico de mudanças de status (somente inserção). Sem foreign key
+    # para o histórico continuar disponível depois de excluir a negociação.
+    __table_args__ = (
+        Index("ix_negotiationtransition_negotiation_id_id", "negotiation_id", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    agency_id: int = _agency_field()
+    negotiation_id: int
+    from_status: Optional[str] = None  # None na criação
+    to_status: str
+    changed_at: datetime = Field(sa_type=DateTime)  # UTC, como Negotiation.created_at
+    seconds_in_previous: Optional[float] = None
+
+class NegotiationStageStats(SQLModel, table=True):
+    # Agregados do funil por imobiliária e status, mantidos a cada transição
+    agency_id: int = Field(primary_key=True)
+    stage: str = Field(primary_key=True)
+    current: int = Field(default=0)  # negociações hoje neste status
+    reached: int = Field(default=0)  # negociações que já chegaram a este status
+    exits: int = Field(default=0)  # saídas deste status
+    total_seconds: float = Field(default=0.0)  # tempo somado das saídas
+
+class NegotiationStageDuration(SQLModel, table=True):
+    # Histograma do tempo no status (faixas logarítmicas de segundos)
+    agency_id: int = Field(primary_key=True)
+    stage: str = Field(primary_key=True)
+    bucket: int = Field(primary_key=True)
+    exits: int = Field(default=0)
+
+class SchemaMigration(SQLModel, table=True):
+    # Migrações aplicadas (migrations/versions), gravadas pelo runner
+    version: str = Field(primary_key=True)  # "0001", "0002", ...
+    name: str
+    applied_at: datetime = Field(sa_type=DateTime)  # UTC
+    duration_seconds: float = Field(default=0.0)
+
+class MigrationProgress(SQLModel, table=True):
+    # Ponto de parada dos backfills em lote: o último id processado é
+    # gravado na mesma transação de cada lote, para retomar dali
+    version: str = Field(primary_key=True)
+    step: str = Field(primary_key=True)
+    last_id: int = Field(default=0)
+    rows: int = Field(default=0)
+    done: bool = Field(default=False)
+    updated_at: datetime = Field(sa_type=DateTime)  # UTC
+
+class ReplicaHeartbeat(SQLModel, table=True):
+    # Linha única gravada no primário pela verificação das réplicas; o
+    # valor que cada réplica enxerga mede o atraso dela (services/read_replicas.py)
+    id: int = Field(primary_key=True)
+    beat_at: datetime = Field(sa_type=DateTime)  # UTC
+
+class ChangeFeedHead(SQLModel, table=True):
+    # Última posição do feed de alterações de cada imobiliária. O UPSERT que
+    # a incrementa trava a linha até o commit, então as posições de uma
+    # imobiliária são gravadas em ordem e sem buracos (services/change_feed.py)
+    agency_id: int = Field(primary_key=True)
+    seq: int = Field(default=0)
+
+class ChangeEvent(SQLModel, table=True):
+    # Evento do feed de alterações, gravado na transação da escrita
+    __table_args__ = (
+        Index("ix_changeevent_created_at", "created_at"),  # limpeza pela retenção
+    )
+    agency_id: int = Field(primary_key=True)
+    seq: int = Field(primary_key=True)  # posição no feed da imobiliária
+    entity: str  # client, property, visit, negotiation
+    action: str  # created, updated, deleted, imported
+    entity_id: Optional[int] = None
+    user_id: Optional[int] = None  # autor da escrita, quando feita por uma rota
+    data: Optional[str] = None  # JSON do registro (created/updated) ou resumo (imported)
+    created_at: datetime = Field(sa_type=DateTime)  # UTC
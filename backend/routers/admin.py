@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from auth.auth import get_current_admin
+from services.profiling import profile_buffer
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(get_current_admin)])
+
+@router.get("/profiles")
+def list_profiles(
+    route: Optional[str] = Query(None, description="Filtrar pela rota (ex.: /visits/)"),
+    min_duration_ms: float = Query(0, ge=0, description="Duração mínima"),
+    limit: int = Query(50, ge=1, le=500, description="Máximo de perfis"),
+):
+    """Perfis guardados, do mais recente ao mais antigo."""
+    profiles = [
+        p for p in profile_buffer.list()
+        if (route is None or p.route == route) and p.duration_ms >= min_duration_ms
+    ]
+    return [p.summary() for p in profiles[:limit]]
+
+@router.get("/profiles/{profile_id}")
+def read_profile(profile_id: int):
+    """Comandos SQL (com parâmetros, tempos e planos), repetições e pilha Python."""
+    profile = profile_buffer.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return profile.detail()
+
+@router.delete("/profiles", status_code=204)
+def clear_profiles():
+    profile_buffer.clear()
@@ -0,0 +1,79 @@
+"""
+Versões assíncronas dos routers de clientes, imóveis, negociações e visitas.
+
+Usadas quando DB_ASYNC está ativo. Cada rota é gerada a partir da rota
+síncrona equivalente, com a mesma URL, os mesmos parâmetros e o mesmo
+response_model. A sessão passa a ser uma AsyncSession (aiosqlite/asyncpg)
+e a autenticação usa get_current_user_async. O corpo da rota síncrona
+roda via AsyncSession.run_sync: a lógica (filtros, paginação,
+enriquecimento, conflitos de agenda) é a mesma nos dois modos, e o I/O
+do banco roda no event loop sem ocupar o threadpool.
+"""
+import inspect
+
+from fastapi import APIRouter, Depends, UploadFile
+from fastapi.routing import APIRoute
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from auth.auth import get_current_user_async
+from models.database import get_async_session
+
+def _asyncify(endpoint):
+    """
+    Cria a rota assíncrona que executa `endpoint` com a sessão síncrona de run_sync.
+    """
+    signature = inspect.signature(endpoint)
+    parameters = []
+    for parameter in signature.parameters.values():
+        if parameter.name == "session":
+            parameter = parameter.replace(annotation=AsyncSession, default=Depends(get_async_session))
+        elif parameter.name == "user":
+            parameter = parameter.replace(default=Depends(get_current_user_async))
+        parameters.append(parameter)
+
+    async def async_endpoint(**kwargs):
+        async_session = kwargs.pop("session")
+        return await async_session.run_sync(lambda session: endpoint(session=session, **kwargs))
+
+    # Não usa functools.wraps: o FastAPI segue __wrapped__ e trataria a rota como síncrona
+    async_endpoint.__name__ = endpoint.__name__
+    async_endpoint.__doc__ = endpoint.__doc__
+    async_endpoint.__signature__ = signature.replace(parameters=parameters)
+    return async_endpoint
+
+def _reads_upload(endpoint) -> bool:
+    return any(p.annotation is UploadFile for p in inspect.signature(endpoint).parameters.values())
+
+def make_async_router(sync_router: APIRouter, exclude=()) -> APIRouter:
+    """
+    Gera o router assíncrono a partir do síncrono.
+
+    Rotas já assíncronas, sem parâmetro `session`, que leem arquivos
+    enviados (a leitura bloquearia o event loop) ou listadas em `exclude`
+    (pelo nome da função) são copiadas sem alteração, então o router
+    gerado substitui o síncrono por inteiro.
+    """
+    router = APIRouter()
+    for route in sync_router.routes:
+        convertible = (
+            isinstance(route, APIRoute)
+            and route.name not in exclude
+            and not inspect.iscoroutinefunction(route.endpoint)
+            and "session" in inspect.signature(route.endpoint).parameters
+            and not _reads_upload(route.endpoint)
+        )
+        if not convertible:
+            router.routes.append(route)
+            continue
+        router.add_api_route(
+            route.path,
+            _asyncify(route.endpoint),
+            methods=list(route.methods),
+            response_model=route.response_model,
+            status_code=route.status_code,
+            tags=route.tags,
+            summary=route.summary,
+            description=route.description,
+            name=route.name,
+        )
+    return router
@@ -0,0 +1,171 @@
+from fastapi import APIRouter, Header, HTTPException, Query, WebSocket, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from auth.auth import authenticate_token
+from services.change_feed import AUTHORS, change_feed, parse_topics
+import asyncio
+import json
+import os
+import time
+
+router = APIRouter(prefix="/changes", tags=["Changes"])
+
+# Duração máxima de uma conexão: o cliente reconecta a partir da última
+# posição recebida e o token é verificado de novo
+CHANGE_FEED_MAX_STREAM_SECONDS = float(os.getenv("CHANGE_FEED_MAX_STREAM_SECONDS", "300"))
+# Intervalo das mensagens de ping sem eventos (mantém proxies e balanceadores com a conexão aberta)
+CHANGE_FEED_HEARTBEAT_SECONDS = float(os.getenv("CHANGE_FEED_HEARTBEAT_SECONDS", "15"))
+# Espera sugerida ao EventSource antes de reconectar
+SSE_RETRY_MS = 2000
+
+AUTHOR_PATTERN = "^(" + "|".join(AUTHORS) + ")$"
+
+async def _authenticate(authorization: Optional[str], access_token: Optional[str]):
+    """Usuário do cabeçalho Authorization ou, para EventSource/WebSocket, do parâmetro access_token."""
+    scheme, _, token = (authorization or "").partition(" ")
+    token = token if scheme.lower() == "bearer" and token else access_token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await run_in_threadpool(authenticate_token, token)
+
+def _stream_deadline(timeout: Optional[float]) -> float:
+    seconds = CHANGE_FEED_MAX_STREAM_SECONDS if timeout is None else min(timeout, CHANGE_FEED_MAX_STREAM_SECONDS)
+    return time.monotonic() + seconds
+
+async def _read(subscription, deadline: float):
+    """Próximos eventos, ou lista vazia no ping ou no fim do tempo (deadline já passou)."""
+    wait = min(CHANGE_FEED_HEARTBEAT_SECONDS, max(0.0, deadline - time.monotonic()))
+    return await change_feed.read(subscription, wait)
+
+class _FeedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que devolve a vaga do feed ao terminar. O corpo
+    também a devolve, mas não roda se o cliente desconectar antes do
+    início do envio.
+    """
+
+    def __init__(self, slot, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+@router.get("/stream")
+async def stream_changes(
+    since: Optional[int] = Query(None, ge=0, description="Retomar depois desta posição (padrão: Last-Event-ID ou só eventos novos)"),
+    topics: Optional[str] = Query(None, description="Entidades ou registros, separados por vírgula (ex.: visit,negotiation:12)"),
+    author: str = Query("any", pattern=AUTHOR_PATTERN, description="any, me (só as minhas escritas) ou others"),
+    timeout: Optional[float] = Query(None, ge=0, description="Encerrar depois de N segundos (0: só os eventos pendentes)"),
+    access_token: Optional[str] = Query(None, description="Token de acesso (EventSource não envia cabeçalhos)"),
+    authorization: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Alterações de clientes, imóveis, visitas e negociações da imobiliária
+    por Server-Sent Events: eventos `change` (id = posição no feed) e
+    `reset` (eventos perdidos: recarregar os dados). A conexão é encerrada
+    depois de CHANGE_FEED_MAX_STREAM_SECONDS e o EventSource reconecta
+    sozinho a partir do Last-Event-ID.
+    """
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    user = await _authenticate(authorization, access_token)
+    parse_topics(topics)
+    slot = change_feed.admit()
+    deadline = _stream_deadline(timeout)
+
+    async def events():
+        subscription = None
+        try:
+            subscription = await change_feed.subscribe(user.agency_id, user.id, since, topics, author)
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                batch = await _read(subscription, deadline)
+                if batch:
+                    yield "".join(f"id: {e.seq}\nevent: {e.type}\ndata: {e.payload}\n\n" for e in batch)
+                elif time.monotonic() >= deadline:
+                    break
+                else:
+                    # id sem dados avança o Last-Event-ID sem disparar evento (eventos filtrados)
+                    yield f"id: {subscription.cursor}\n: ping\n\n"
+        finally:
+            if subscription is not None:
+                change_feed.unsubscribe(subscription)
+            slot.release()
+
+    return _FeedStreamingResponse(
+        slot,
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/ws")
+async def changes_websocket(
+    websocket: WebSocket,
+    since: Optional[int] = Query(None, ge=0),
+    topics: Optional[str] = Query(None),
+    author: str = Query("any", pattern=AUTHOR_PATTERN),
+    access_token: Optional[str] = Query(None),
+):
+    """
+    O mesmo feed por WebSocket: mensagens JSON com type change, reset ou
+    ping (ping traz a posição atual). Ao fim de CHANGE_FEED_MAX_STREAM_SECONDS
+    a conexão é fechada (1000) e o cliente reconecta com since.
+    """
+    try:
+        user = await _authenticate(websocket.headers.get("authorization"), access_token)
+        parse_topics(topics)
+        slot = change_feed.admit()
+    except HTTPException as e:
+        code = status.WS_1013_TRY_AGAIN_LATER if e.status_code == 503 else status.WS_1008_POLICY_VIOLATION
+        await websocket.close(code=code, reason=str(e.detail))
+        return
+    subscription = None
+    try:
+        await websocket.accept()
+        subscription = await change_feed.subscribe(user.agency_id, user.id, since, topics, author)
+        await _serve_websocket(websocket, subscription)
+    finally:
+        if subscription is not None:
+            change_feed.unsubscribe(subscription)
+        slot.release()
+
+async def _serve_websocket(websocket: WebSocket, subscription):
+    """Envia os eventos até o tempo máximo ou a desconexão do cliente."""
+    deadline = _stream_deadline(None)
+
+    async def send_events():
+        while True:
+            batch = await _read(subscription, deadline)
+            if batch:
+                for e in batch:
+                    await websocket.send_text(e.payload)
+            elif time.monotonic() >= deadline:
+                return
+            else:
+                await websocket.send_text(json.dumps({"type": "ping", "offset": subscription.cursor}))
+
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    sender = asyncio.create_task(send_events())
+    receiver = asyncio.create_task(wait_disconnect())
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sender.cancel()
+        receiver.cancel()
+    # Tempo máximo atingido (o envio terminou sem erro): fecha normalmente
+    if sender.done() and not sender.cancelled() and sender.exception() is None and not receiver.done():
+        await websocket.close()
@@ -1,23 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile
 from sqlmodel import Session, select
+from typing import Optional
 from models.models import Client
-from schemas.schemas import ClientCreate, ClientRead
+from schemas.schemas import BulkImportReport, ClientCreate, ClientMatches, ClientRead, ClientUpdate
 from models.database import get_session
 from auth.auth import get_current_user
+from services.matching import match_properties
+from services.bulk_import import DEFAULT_CHUNK_SIZE, IMPORT_FORMATS, bulk_import, detect_format
+from services.pagination import keyset_paginate
+from services.partial_update import patch_row
 
 router = APIRouter(prefix="/clients", tags=["Clients"])
 
 @router.post("/", response_model=ClientRead)
 def create_client(client: ClientCreate, session: Session = Depends(get_session), user=Depends(get_current_user)):
-    new_client = Client(**client.dict())
+    new_client = Client(**client.model_dump())
     session.add(new_client)
     session.commit()
-    session.refresh(new_client)
     return new_client
 
+@router.post("/bulk", response_model=BulkImportReport)
+def import_clients(
+    file: UploadFile = File(..., description="Arquivo CSV (com cabeçalho) ou NDJSON"),
+    format: Optional[str] = Query(None, pattern="^(" + "|".join(IMPORT_FORMATS) + ")$", description="Formato do arquivo (padrão: pela extensão)"),
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, ge=1, le=10000, description="Linhas por transação"),
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    file_format = format or detect_format(file.filename, file.content_type)
+    return bulk_import(session, file.file, file_format, ClientCreate, Client, chunk_size)
+
+def filter_clients(status: Optional[str] = None, interest_type: Optional[str] = None):
+    """Consulta de clientes com os filtros da listagem (também usada na exportação)."""
+    query = select(Client)
+    if status:
+        query = query.where(Client.status == status)
+    if interest_type:
+        query = query.where(Client.interest_type == interest_type)
+    return query
+
 @router.get("/", response_model=list[ClientRead])
-def list_clients(session: Session = Depends(get_session), user=Depends(get_current_user)):
-    return session.exec(select(Client)).all()
+def list_clients(
+    response: Response,
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    interest_type: Optional[str] = Query(None, description="Filtrar por tipo de interesse"),
+    limit: int = Query(100, ge=1, le=1000, description="Limite de resultados"),
+    after: Optional[str] = Query(None, description="Cursor da próxima página (cabeçalho X-Next-Cursor)"),
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    query = filter_clients(status, interest_type)
+    return keyset_paginate(session, query, response, [Client.id], limit, after)
 
 @router.get("/{client_id}", response_model=ClientRead)
 def get_client(client_id: int, session: Session = Depends(get_session), user=Depends(get_current_user)):
@@ -26,17 +59,46 @@ def get_client(client_id: int, session: Session = Depends(get_session), user=Dep
         raise HTTPException(status_code=404, detail="Client not found")
     return client
 
+@router.get("/{client_id}/matches", response_model=ClientMatches)
+def get_client_matches(
+    client_id: int,
+    limit: int = Query(10, ge=1, le=100, description="Quantidade de imóveis sugeridos"),
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    """
+    Imóveis disponíveis mais aderentes às preferências do cliente
+    (tipo, localização e faixa de valor), com a nota de cada um.
+    """
+    client = session.get(Client, client_id)
+    if not client:
+        raise HTTPException(status_code=404, detail="Client not found")
+    return match_properties(session, client, limit)
+
 @router.put("/{client_id}", response_model=ClientRead)
 def update_client(client_id: int, client: ClientCreate, session: Session = Depends(get_session), user=Depends(get_current_user)):
     db_client = session.get(Client, client_id)
     if not db_client:
         raise HTTPException(status_code=404, detail="Client not found")
-    for key, value in client.dict().items():
+    for key, value in client.model_dump().items():
         setattr(db_client, key, value)
     session.commit()
-    session.refresh(db_client)
     return db_client
 
+@router.patch("/{client_id}", response_model=ClientRead)
+def patch_client(client_id: int, client: ClientUpdate, session: Session = Depends(get_session), user=Depends(get_current_user)):
+    """
+    Atualiza só os campos enviados, num único UPDATE ... RETURNING.
+
+    Com `version`, a atualização só é feita se o cliente não mudou desde
+    a leitura (senão 409).
+    """
+    changes = client.model_dump(exclude_unset=True)
+    expected_version = changes.pop("version", None)
+    _, updated = patch_row(session, Client, client_id, changes, expected_version, not_found="Client not found")
+    session.commit()
+    return updated
+
 @router.delete("/{client_id}")
 def delete_client(client_id: int, session: Session = Depends(get_session), user=Depends(get_current_user)):
     db_client = session.get(Client, client_id)
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+from datetime import date
+from models.models import Client, Negotiation, Property, Visit
+from auth.auth import get_current_user
+from routers.client import filter_clients
+from routers.negotiation import filter_negotiations
+from routers.properties import filter_properties
+from routers.visit import filter_visits
+from services.export import EXPORT_FORMATS, export_response
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+FORMAT_PATTERN = "^(" + "|".join(EXPORT_FORMATS) + ")$"
+
+@router.get("/clients")
+def export_clients(
+    format: str = Query("csv", pattern=FORMAT_PATTERN, description="csv ou ndjson"),
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    interest_type: Optional[str] = Query(None, description="Filtrar por tipo de interesse"),
+    user=Depends(get_current_user)
+):
+    return export_response(filter_clients(status, interest_type), Client, user.agency_id, format, "clients")
+
+@router.get("/properties")
+def export_properties(
+    format: str = Query("csv", pattern=FORMAT_PATTERN, description="csv ou ndjson"),
+    type: Optional[str] = Query(None, description="Filtrar por tipo"),
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    min_value: Optional[float] = Query(None, ge=0, description="Valor mínimo"),
+    max_value: Optional[float] = Query(None, ge=0, description="Valor máximo"),
+    location: Optional[str] = Query(None, description="Prefixo da localização"),
+    user=Depends(get_current_user)
+):
+    query = filter_properties(type, status, min_value, max_value, location)
+    return export_response(query, Property, user.agency_id, format, "properties")
+
+@router.get("/visits")
+def export_visits(
+    format: str = Query("csv", pattern=FORMAT_PATTERN, description="csv ou ndjson"),
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    client_id: Optional[int] = Query(None, description="Filtrar por ID do cliente"),
+    property_id: Optional[int] = Query(None, description="Filtrar por ID do imóvel"),
+    date_from: Optional[date] = Query(None, description="Data início (YYYY-MM-DD)"),
+    date_to: Optional[date] = Query(None, description="Data fim (YYYY-MM-DD)"),
+    user=Depends(get_current_user)
+):
+    query = filter_visits(status, client_id, property_id, date_from, date_to)
+    return export_response(query, Visit, user.agency_id, format, "visits")
+
+@router.get("/negotiations")
+def export_negotiations(
+    format: str = Query("csv", pattern=FORMAT_PATTERN, description="csv ou ndjson"),
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    client_id: Optional[int] = Query(None, description="Filtrar por ID do cliente"),
+    property_id: Optional[int] = Query(None, description="Filtrar por ID do imóvel"),
+    user=Depends(get_current_user)
+):
+    query = filter_negotiations(status, client_id, property_id)
+    return export_response(query, Negotiation, user.agency_id, format, "negotiations")
@@ -1,24 +1,70 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlmodel import Session, select
-from models.models import Negotiation
-from schemas.schemas import NegotiationCreate, NegotiationRead
+from typing import Optional
+from models.models import Client, Negotiation, NegotiationTransition, Property
+from schemas.schemas import NegotiationCreate, NegotiationRead, NegotiationUpdate, NegotiationFunnel, NegotiationTransitionRead
 from models.database import get_session
 from auth.auth import get_current_user
+from services.pagination import keyset_paginate
+from services.partial_update import patch_row
+from services.negotiation_pipeline import funnel_summary, record_created, record_deleted, record_status_change
 from datetime import datetime
 
 router = APIRouter(prefix="/negotiations", tags=["Negotiations"])
 
+def check_references(session: Session, client_id: Optional[int], property_id: Optional[int]):
+    """
+    Cliente e imóvel precisam existir na imobiliária do usuário (os das
+    outras imobiliárias não são visíveis na sessão).
+    """
+    if client_id is not None and not session.get(Client, client_id):
+        raise HTTPException(status_code=404, detail="Client not found")
+    if property_id is not None and not session.get(Property, property_id):
+        raise HTTPException(status_code=404, detail="Property not found")
+
 @router.post("/", response_model=NegotiationRead)
 def create_negotiation(negotiation: NegotiationCreate, session: Session = Depends(get_session), user=Depends(get_current_user)):
-    new_negotiation = Negotiation(**negotiation.dict(), created_at=datetime.utcnow().isoformat(), status=negotiation.status)
+    check_references(session, negotiation.client_id, negotiation.property_id)
+    new_negotiation = Negotiation(**negotiation.model_dump(), created_at=datetime.utcnow().isoformat())
     session.add(new_negotiation)
+    session.flush()
+    record_created(session, new_negotiation)
     session.commit()
-    session.refresh(new_negotiation)
     return new_negotiation
 
+def filter_negotiations(
+    status: Optional[str] = None,
+    client_id: Optional[int] = None,
+    property_id: Optional[int] = None,
+):
+    """Consulta de negociações com os filtros da listagem (também usada na exportação)."""
+    query = select(Negotiation)
+    if status:
+        query = query.where(Negotiation.status == status)
+    if client_id:
+        query = query.where(Negotiation.client_id == client_id)
+    if property_id:
+        query = query.where(Negotiation.property_id == property_id)
+    return query
+
 @router.get("/", response_model=list[NegotiationRead])
-def list_negotiations(session: Session = Depends(get_session), user=Depends(get_current_user)):
-    return session.exec(select(Negotiation)).all()
+def list_negotiations(
+    response: Response,
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    client_id: Optional[int] = Query(None, description="Filtrar por ID do cliente"),
+    property_id: Optional[int] = Query(None, description="Filtrar por ID do imóvel"),
+    limit: int = Query(100, ge=1, le=1000, description="Limite de resultados"),
+    after: Optional[str] = Query(None, description="Cursor da próxima página (cabeçalho X-Next-Cursor)"),
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    query = filter_negotiations(status, client_id, property_id)
+    return keyset_paginate(session, query, response, [Negotiation.id], limit, after)
+
+@router.get("/funnel", response_model=NegotiationFunnel)
+def get_negotiation_funnel(session: Session = Depends(get_session), user=Depends(get_current_user)):
+    """Funil de negociações: contagem por etapa, conversão e tempo em cada status."""
+    return funnel_summary(session)
 
 @router.get("/{negotiation_id}", response_model=NegotiationRead)
 def get_negotiation(negotiation_id: int, session: Session = Depends(get_session), user=Depends(get_current_user)):
@@ -32,18 +78,69 @@ def update_negotiation(negotiation_id: int, negotiation: NegotiationCreate, sess
     db_negotiation = session.get(Negotiation, negotiation_id)
     if not db_negotiation:
         raise HTTPException(status_code=404, detail="Negotiation not found")
-    for key, value in negotiation.dict().items():
+    check_references(
+        session,
+        negotiation.client_id if negotiation.client_id != db_negotiation.client_id else None,
+        negotiation.property_id if negotiation.property_id != db_negotiation.property_id else None,
+    )
+    old_status = db_negotiation.status
+    now = datetime.utcnow()
+    for key, value in negotiation.model_dump().items():
         setattr(db_negotiation, key, value)
-    db_negotiation.updated_at = datetime.utcnow().isoformat()
+    db_negotiation.updated_at = now.isoformat()
+    if db_negotiation.status != old_status:
+        record_status_change(
+            session, db_negotiation.id, db_negotiation.agency_id, db_negotiation.created_at,
+            old_status, db_negotiation.status, now,
+        )
     session.commit()
-    session.refresh(db_negotiation)
     return db_negotiation
 
+@router.patch("/{negotiation_id}", response_model=NegotiationRead)
+def patch_negotiation(negotiation_id: int, negotiation: NegotiationUpdate, session: Session = Depends(get_session), user=Depends(get_current_user)):
+    """
+    Atualiza só os campos enviados, num único UPDATE ... RETURNING.
+
+    Com `version`, a atualização só é feita se a negociação não mudou
+    desde a leitura (senão 409). Mudança de status lê antes o status
+    anterior para registrar a transição no funil.
+    """
+    changes = negotiation.model_dump(exclude_unset=True)
+    expected_version = changes.pop("version", None)
+    check_references(session, changes.get("client_id"), changes.get("property_id"))
+    now = datetime.utcnow()
+    if changes:
+        changes["updated_at"] = now.isoformat()
+    old, updated = patch_row(
+        session, Negotiation, negotiation_id, changes, expected_version,
+        old_columns=("status",), not_found="Negotiation not found",
+    )
+    if old is not None and old["status"] != updated["status"]:
+        record_status_change(
+            session, updated["id"], updated["agency_id"], updated["created_at"],
+            old["status"], updated["status"], now,
+        )
+    session.commit()
+    return updated
+
 @router.delete("/{negotiation_id}")
 def delete_negotiation(negotiation_id: int, session: Session = Depends(get_session), user=Depends(get_current_user)):
     db_negotiation = session.get(Negotiation, negotiation_id)
     if not db_negotiation:
         raise HTTPException(status_code=404, detail="Negotiation not found")
+    record_deleted(session, db_negotiation)
     session.delete(db_negotiation)
     session.commit()
     return {"ok": True}
+
+@router.get("/{negotiation_id}/history", response_model=list[NegotiationTransitionRead])
+def get_negotiation_history(negotiation_id: int, session: Session = Depends(get_session), user=Depends(get_current_user)):
+    """Mudanças de status da negociação, da mais antiga para a mais recente."""
+    if not session.get(Negotiation, negotiation_id):
+        raise HTTPException(status_code=404, detail="Negotiation not found")
+    query = (
+        select(NegotiationTransition)
+        .where(NegotiationTransition.negotiation_id == negotiation_id)
+        .order_by(NegotiationTransition.id)
+    )
+    return session.exec(query).all()
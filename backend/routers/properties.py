@@ -1,23 +1,90 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile
 from sqlmodel import Session, select
+from typing import Optional
 from models.models import Property
-from schemas.schemas import PropertyCreate, PropertyRead
+from schemas.schemas import BulkImportReport, PropertyAnalytics, PropertyCreate, PropertyRead, PropertyUpdate
 from models.database import get_session
 from auth.auth import get_current_user
+from services.bulk_import import DEFAULT_CHUNK_SIZE, IMPORT_FORMATS, bulk_import, detect_format
+from services.matching import match_index
+from services.pagination import keyset_paginate
+from services.partial_update import patch_row
+from services.property_analytics import (
+    GROUP_BY_OPTIONS, ROLLUP_COLUMNS, property_value_analytics, record_inserted_properties, record_updated_property,
+)
 
 router = APIRouter(prefix="/properties", tags=["Properties"])
 
 @router.post("/", response_model=PropertyRead)
 def create_property(property: PropertyCreate, session: Session = Depends(get_session), user=Depends(get_current_user)):
-    new_property = Property(**property.dict())
+    new_property = Property(**property.model_dump())
     session.add(new_property)
     session.commit()
-    session.refresh(new_property)
     return new_property
 
+@router.post("/bulk", response_model=BulkImportReport)
+def import_properties(
+    file: UploadFile = File(..., description="Arquivo CSV (com cabeçalho) ou NDJSON"),
+    format: Optional[str] = Query(None, pattern="^(" + "|".join(IMPORT_FORMATS) + ")$", description="Formato do arquivo (padrão: pela extensão)"),
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, ge=1, le=10000, description="Linhas por transação"),
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    file_format = format or detect_format(file.filename, file.content_type)
+    return bulk_import(
+        session, file.file, file_format, PropertyCreate, Property, chunk_size,
+        on_insert=record_inserted_properties,
+    )
+
+def filter_properties(
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+    location: Optional[str] = None,
+):
+    """Consulta de imóveis com os filtros da listagem (também usada na exportação)."""
+    query = select(Property)
+    if type:
+        query = query.where(Property.type == type)
+    if status:
+        query = query.where(Property.status == status)
+    if min_value is not None:
+        query = query.where(Property.value >= min_value)
+    if max_value is not None:
+        query = query.where(Property.value <= max_value)
+    if location:
+        query = query.where(Property.location.startswith(location, autoescape=True))
+    return query
+
 @router.get("/", response_model=list[PropertyRead])
-def list_properties(session: Session = Depends(get_session), user=Depends(get_current_user)):
-    return session.exec(select(Property)).all()
+def list_properties(
+    response: Response,
+    type: Optional[str] = Query(None, description="Filtrar por tipo"),
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    min_value: Optional[float] = Query(None, ge=0, description="Valor mínimo"),
+    max_value: Optional[float] = Query(None, ge=0, description="Valor máximo"),
+    location: Optional[str] = Query(None, description="Prefixo da localização"),
+    limit: int = Query(100, ge=1, le=1000, description="Limite de resultados"),
+    after: Optional[str] = Query(None, description="Cursor da próxima página (cabeçalho X-Next-Cursor)"),
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    query = filter_properties(type, status, min_value, max_value, location)
+    return keyset_paginate(session, query, response, [Property.id], limit, after)
+
+@router.get("/analytics", response_model=PropertyAnalytics)
+def get_property_analytics(
+    group_by: str = Query("type", pattern="^(" + "|".join(GROUP_BY_OPTIONS) + ")$", description="Agrupar por: " + ", ".join(GROUP_BY_OPTIONS)),
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    """
+    Quantidade, média, mínimo, máximo, mediana e percentis dos valores dos
+    imóveis por localização, tipo ou status, calculados a partir do rollup
+    (sem varrer a tabela de imóveis).
+    """
+    return property_value_analytics(session, group_by)
 
 @router.get("/{property_id}", response_model=PropertyRead)
 def get_property(property_id: int, session: Session = Depends(get_session), user=Depends(get_current_user)):
@@ -31,12 +98,32 @@ def update_property(property_id: int, property: PropertyCreate, session: Session
     db_property = session.get(Property, property_id)
     if not db_property:
         raise HTTPException(status_code=404, detail="Property not found")
-    for key, value in property.dict().items():
+    for key, value in property.model_dump().items():
         setattr(db_property, key, value)
     session.commit()
-    session.refresh(db_property)
     return db_property
 
+@router.patch("/{property_id}", response_model=PropertyRead)
+def patch_property(property_id: int, property: PropertyUpdate, session: Session = Depends(get_session), user=Depends(get_current_user)):
+    """
+    Atualiza só os campos enviados, num único UPDATE ... RETURNING.
+
+    Com `version`, a atualização só é feita se o imóvel não mudou desde a
+    leitura (senão 409). Mudanças em localização, tipo, status ou valor
+    leem antes os valores antigos para ajustar o rollup de /analytics.
+    """
+    changes = property.model_dump(exclude_unset=True)
+    expected_version = changes.pop("version", None)
+    old, updated = patch_row(
+        session, Property, property_id, changes, expected_version,
+        old_columns=ROLLUP_COLUMNS, not_found="Property not found",
+    )
+    if old is not None:
+        record_updated_property(session.connection(), old, updated)
+    session.commit()
+    match_index.mark_dirty(updated["agency_id"], property_id)
+    return updated
+
 @router.delete("/{property_id}")
 def delete_property(property_id: int, session: Session = Depends(get_session), user=Depends(get_current_user)):
     db_property = session.get(Property, property_id)
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+from schemas.schemas import SearchResults
+from models.database import get_session
+from auth.auth import get_current_user
+from services.search import SEARCH_TYPES, search_clients, search_properties
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+@router.get("/", response_model=SearchResults)
+def search(
+    q: str = Query(..., min_length=1, max_length=200, description="Termos da busca (por prefixo, sem diferenciar acentos)"),
+    type: str = Query("all", pattern="^(" + "|".join(SEARCH_TYPES) + ")$", description="all, clients ou properties"),
+    limit: int = Query(20, ge=1, le=100, description="Máximo de resultados por tipo"),
+    session: Session = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    """
+    Busca clientes por nome, e-mail ou telefone e imóveis por localização
+    ou descrição, ordenados por relevância.
+    """
+    return {
+        "clients": search_clients(session, q, limit) if type in ("all", "clients") else [],
+        "properties": search_properties(session, q, limit) if type in ("all", "properties") else [],
+    }
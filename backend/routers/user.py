@@ -1,29 +1,70 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import Session, select
-from models.models import User
+from models.models import Agency, User
 from schemas.schemas import UserCreate, UserRead, UserLogin, Token
 from models.database import get_session
-from auth.auth import get_password_hash, verify_password, create_access_token
+from auth.auth import (
+    get_current_user, get_password_hash_async, verify_and_update_password_async,
+    create_access_token, user_token_claims,
+)
 from fastapi.security import OAuth2PasswordRequestForm
+from services.read_replicas import replica_router
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
-@router.post("/register", response_model=UserRead)
-def register(user: UserCreate, session: Session = Depends(get_session)):
-    db_user = session.exec(select(User).where(User.username == user.username)).first()
+# As rotas são async para que o bcrypt rode no executor dedicado sem
+# ocupar o threadpool; o acesso ao banco (síncrono) vai para o threadpool.
+
+def get_user_by_username(session: Session, username: str):
+    return session.exec(select(User).where(User.username == username)).first()
+
+def save_user(session: Session, user: User, agency: Agency = None):
+    if agency is not None:
+        session.add(agency)
+        session.flush()
+        user.agency_id = agency.id
+    session.add(user)
+    session.commit()
+    return user
+
+async def _new_user(session: Session, user: UserCreate, agency_id: int = None) -> User:
+    db_user = await run_in_threadpool(get_user_by_username, session, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(user.password)
-    new_user = User(username=user.username, email=user.email, hashed_password=hashed_password)
-    session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
-    return new_user
+    hashed_password = await get_password_hash_async(user.password)
+    return User(username=user.username, email=user.email, hashed_password=hashed_password, agency_id=agency_id)
+
+@router.post("/register", response_model=UserRead)
+async def register(user: UserCreate, session: Session = Depends(get_session)):
+    """Cadastro público: cria o usuário numa nova imobiliária."""
+    new_user = await _new_user(session, user)
+    agency = Agency(name=user.agency_name or f"Imobiliária de {user.username}")
+    saved = await run_in_threadpool(save_user, session, new_user, agency)
+    # Sem token, o middleware das réplicas não sabe quem escreveu
+    replica_router.record_write(saved.id)
+    return saved
+
+@router.post("/", response_model=UserRead)
+async def create_agency_user(user: UserCreate, session: Session = Depends(get_session), current_user=Depends(get_current_user)):
+    """Cadastra um usuário na imobiliária do usuário autenticado (agency_name é ignorado)."""
+    new_user = await _new_user(session, user, current_user.agency_id)
+    return await run_in_threadpool(save_user, session, new_user)
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
-    user = session.exec(select(User).where(User.username == form_data.username)).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
+    user = await run_in_threadpool(get_user_by_username, session, form_data.username)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
+    valid, new_hash = await verify_and_update_password_async(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
-    access_token = create_access_token(data={"sub": user.username})
+    if new_hash:
+        # Custo do bcrypt mudou: regrava o hash de forma transparente
+        user.hashed_password = new_hash
+        await run_in_threadpool(save_user, session, user)
+    # Os primeiros GETs com o token novo leem o usuário no primário (ele
+    # pode ter acabado de se cadastrar, ainda sem cópia nas réplicas)
+    replica_router.record_write(user.id)
+    access_token = create_access_token(data=user_token_claims(user))
     return {"access_token": access_token, "token_type": "bearer"}
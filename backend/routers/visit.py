@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlmodel import Session, select, and_, or_
 from typing import Optional, List
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from models.models import Visit, Client, Property
 from schemas.schemas import VisitCreate, VisitRead, VisitUpdate
 from models.database import get_session
 from auth.auth import get_current_user
+from services.pagination import keyset_paginate
+from services.visit_statistics import GROUP_BY_OPTIONS, summarize_visits
+from services.visit_schedule import (
+    ACTIVE_STATUSES, active_visits_between, conflict_message, day_bounds,
+    find_conflicting_visit, month_bounds,
+)
 
 router = APIRouter(prefix="/visits", tags=["Visits"])
 
@@ -31,55 +37,38 @@ def create_visit(
     if not property_obj:
         raise HTTPException(status_code=404, detail="Imóvel não encontrado")
     
-    # Verifica conflitos de horário (opcional - para evitar duplo agendamento)
-    existing_visit = session.exec(
-        select(Visit).where(
-            and_(
-                Visit.scheduled_datetime == visit.scheduled_datetime,
-                Visit.status.in_(["Agendada", "Reagendada"])
-            )
-        )
-    ).first()
-    
-    if existing_visit:
-        raise HTTPException(
-            status_code=400, 
-            detail="Já existe uma visita agendada para este horário"
+    # Verifica sobreposição com visitas do mesmo imóvel ou do mesmo cliente
+    if visit.status in ACTIVE_STATUSES:
+        conflict = find_conflicting_visit(
+            session, visit.client_id, visit.property_id,
+            visit.scheduled_datetime, visit.duration_minutes
         )
+        if conflict:
+            raise HTTPException(status_code=400, detail=conflict_message(conflict, visit.property_id))
     
     # Cria a visita
-    visit_data = visit.dict()
-    visit_data["created_at"] = datetime.now().isoformat()
+    visit_data = visit.model_dump()
+    visit_data["created_at"] = datetime.now()
     
     new_visit = Visit(**visit_data)
     session.add(new_visit)
     session.commit()
-    session.refresh(new_visit)
     
-    # Retorna com dados enriquecidos
-    return enrich_visit_data(new_visit, session)
+    # Retorna com os dados do cliente e do imóvel já carregados na validação
+    return build_visit_read(new_visit, client, property_obj)
 
-@router.get("/", response_model=List[VisitRead])
-def list_visits(
-    status: Optional[str] = Query(None, description="Filtrar por status: Agendada, Realizada, Cancelada, Reagendada"),
-    client_id: Optional[int] = Query(None, description="Filtrar por ID do cliente"),
-    property_id: Optional[int] = Query(None, description="Filtrar por ID do imóvel"),
-    date_from: Optional[str] = Query(None, description="Data início (YYYY-MM-DD)"),
-    date_to: Optional[str] = Query(None, description="Data fim (YYYY-MM-DD)"),
-    limit: int = Query(100, ge=1, le=1000, description="Limite de resultados"),
-    offset: int = Query(0, ge=0, description="Offset para paginação"),
-    session: Session = Depends(get_session), 
-    user=Depends(get_current_user)
+def filter_visits(
+    status: Optional[str] = None,
+    client_id: Optional[int] = None,
+    property_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
 ):
     """
-    Lista visitas com filtros opcionais.
-    
-    Permite filtrar por status, cliente, imóvel, período de datas.
-    Suporta paginação com limit e offset.
+    Consulta de visitas com os filtros da listagem (também usada na exportação).
     """
     query = select(Visit)
     
-    # Aplica filtros
     if status:
         query = query.where(Visit.status == status)
     
@@ -90,28 +79,51 @@ def list_visits(
         query = query.where(Visit.property_id == property_id)
     
     if date_from:
-        query = query.where(Visit.scheduled_datetime >= date_from)
+        query = query.where(Visit.scheduled_datetime >= day_bounds(date_from)[0])
     
     if date_to:
-        # Adiciona 23:59:59 para incluir o dia todo
-        end_date = f"{date_to} 23:59:59"
-        query = query.where(Visit.scheduled_datetime <= end_date)
+        # Limite exclusivo no início do dia seguinte para incluir o dia todo
+        query = query.where(Visit.scheduled_datetime < day_bounds(date_to)[1])
     
-    # Ordena por data agendada (mais recentes primeiro)
-    query = query.order_by(Visit.scheduled_datetime.desc())
+    return query
+
+@router.get("/", response_model=List[VisitRead])
+def list_visits(
+    response: Response,
+    status: Optional[str] = Query(None, description="Filtrar por status: Agendada, Realizada, Cancelada, Reagendada"),
+    client_id: Optional[int] = Query(None, description="Filtrar por ID do cliente"),
+    property_id: Optional[int] = Query(None, description="Filtrar por ID do imóvel"),
+    date_from: Optional[date] = Query(None, description="Data início (YYYY-MM-DD)"),
+    date_to: Optional[date] = Query(None, description="Data fim (YYYY-MM-DD)"),
+    limit: int = Query(100, ge=1, le=1000, description="Limite de resultados"),
+    after: Optional[str] = Query(None, description="Cursor da próxima página (cabeçalho X-Next-Cursor)"),
+    session: Session = Depends(get_session), 
+    user=Depends(get_current_user)
+):
+    """
+    Lista visitas com filtros opcionais.
     
-    # Aplica paginação
-    query = query.offset(offset).limit(limit)
+    Permite filtrar por status, cliente, imóvel, período de datas.
+    Paginação por cursor: o cabeçalho X-Next-Cursor traz o valor de `after`
+    para a próxima página.
+    """
+    query = filter_visits(status, client_id, property_id, date_from, date_to)
     
-    visits = session.exec(query).all()
+    # Ordena por data agendada (mais recentes primeiro) e pagina por cursor
+    visits = keyset_paginate(
+        session, query, response,
+        [Visit.scheduled_datetime, Visit.id], limit, after, descending=True
+    )
     
-    # Enriquece com dados relacionados
-    return [enrich_visit_data(visit, session) for visit in visits]
+    # Enriquece com dados relacionados (consultas em lote)
+    return enrich_visits(visits, session)
 
 @router.get("/calendar", response_model=List[VisitRead])
 def get_calendar_visits(
     month: int = Query(..., ge=1, le=12, description="Mês (1-12)"),
     year: int = Query(..., ge=2020, le=2030, description="Ano"),
+    client_id: Optional[int] = Query(None, description="Filtrar por ID do cliente"),
+    property_id: Optional[int] = Query(None, description="Filtrar por ID do imóvel"),
     session: Session = Depends(get_session), 
     user=Depends(get_current_user)
 ):
@@ -119,25 +131,15 @@ def get_calendar_visits(
     Retorna visitas de um mês específico para exibição em calendário.
     
     Útil para criar visualizações de calendário no frontend.
+    Pode ser restrito à agenda de um cliente ou de um imóvel.
     """
-    # Calcula primeiro e último dia do mês
-    first_day = f"{year}-{month:02d}-01 00:00:00"
-    
-    if month == 12:
-        next_month = f"{year+1}-01-01 00:00:00"
-    else:
-        next_month = f"{year}-{month+1:02d}-01 00:00:00"
-    
-    query = select(Visit).where(
-        and_(
-            Visit.scheduled_datetime >= first_day,
-            Visit.scheduled_datetime < next_month,
-            Visit.status.in_(["Agendada", "Reagendada"])  # Apenas visitas ativas
-        )
-    ).order_by(Visit.scheduled_datetime)
+    first_day, next_month = month_bounds(year, month)
+    
+    # Apenas visitas ativas
+    query = active_visits_between(first_day, next_month, client_id=client_id, property_id=property_id)
     
     visits = session.exec(query).all()
-    return [enrich_visit_data(visit, session) for visit in visits]
+    return enrich_visits(visits, session)
 
 @router.get("/today", response_model=List[VisitRead])
 def get_today_visits(
@@ -149,20 +151,12 @@ def get_today_visits(
     
     Útil para dashboard e visualização rápida do dia.
     """
-    today = datetime.now().date()
-    start_of_day = f"{today} 00:00:00"
-    end_of_day = f"{today} 23:59:59"
-    
-    query = select(Visit).where(
-        and_(
-            Visit.scheduled_datetime >= start_of_day,
-            Visit.scheduled_datetime <= end_of_day,
-            Visit.status.in_(["Agendada", "Reagendada"])
-        )
-    ).order_by(Visit.scheduled_datetime)
+    start_of_day, end_of_day = day_bounds(datetime.now().date())
+    
+    query = active_visits_between(start_of_day, end_of_day)
     
     visits = session.exec(query).all()
-    return [enrich_visit_data(visit, session) for visit in visits]
+    return enrich_visits(visits, session)
 
 @router.get("/{visit_id}", response_model=VisitRead)
 def get_visit(
@@ -194,23 +188,39 @@ def update_visit(
     Permite atualizar qualquer campo exceto IDs de cliente e imóvel.
     Atualiza timestamp de modificação automaticamente.
     """
-    db_visit = session.get(Visit, visit_id)
-    if not db_visit:
+    # Visita com os dados do cliente e do imóvel da resposta, em uma consulta
+    row = session.exec(
+        select(Visit, Client.name, Client.phone, Property.location, Property.type)
+        .outerjoin(Client, Client.id == Visit.client_id)
+        .outerjoin(Property, Property.id == Visit.property_id)
+        .where(Visit.id == visit_id)
+    ).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Visita não encontrada")
+    db_visit = row[0]
     
     # Atualiza apenas campos fornecidos
-    update_data = visit_update.dict(exclude_unset=True)
+    update_data = visit_update.model_dump(exclude_unset=True)
+    
+    # Reagendamento, mudança de duração ou reativação: verifica sobreposição
+    if {"scheduled_datetime", "duration_minutes", "status"} & update_data.keys():
+        check_schedule_conflict(
+            session, db_visit,
+            update_data.get("scheduled_datetime") or db_visit.scheduled_datetime,
+            update_data.get("duration_minutes", db_visit.duration_minutes),
+            update_data.get("status") or db_visit.status,
+        )
     
     for key, value in update_data.items():
         setattr(db_visit, key, value)
     
     # Atualiza timestamp
-    db_visit.updated_at = datetime.now().isoformat()
+    db_visit.updated_at = datetime.now()
     
     session.commit()
-    session.refresh(db_visit)
     
-    return enrich_visit_data(db_visit, session)
+    # A linha traz name/phone do cliente e location/type do imóvel
+    return build_visit_read(db_visit, row, row)
 
 @router.patch("/{visit_id}/status")
 def update_visit_status(
@@ -235,8 +245,11 @@ def update_visit_status(
     if not db_visit:
         raise HTTPException(status_code=404, detail="Visita não encontrada")
     
+    if db_visit.status not in ACTIVE_STATUSES:
+        check_schedule_conflict(session, db_visit, db_visit.scheduled_datetime, db_visit.duration_minutes, status)
+    
     db_visit.status = status
-    db_visit.updated_at = datetime.now().isoformat()
+    db_visit.updated_at = datetime.now()
     
     session.commit()
     
@@ -264,43 +277,67 @@ def delete_visit(
 
 @router.get("/statistics/summary")
 def get_visit_statistics(
+    date_from: Optional[date] = Query(None, description="Data início (YYYY-MM-DD)"),
+    date_to: Optional[date] = Query(None, description="Data fim (YYYY-MM-DD)"),
+    group_by: Optional[str] = Query(
+        None,
+        pattern=f"^({'|'.join(GROUP_BY_OPTIONS)})$",
+        description="Agrupar série por: day, week, month, property_type, client_status"
+    ),
     session: Session = Depends(get_session), 
     user=Depends(get_current_user)
 ):
     """
     Retorna estatísticas resumidas das visitas.
     
-    Útil para dashboards e relatórios.
+    Útil para dashboards e relatórios. As contagens são agregadas no banco;
+    com `group_by` a resposta inclui `series` com uma linha por grupo.
+    """
+    return summarize_visits(session, date_from, date_to, group_by)
+
+def check_schedule_conflict(session: Session, db_visit: Visit, start: datetime, duration_minutes: Optional[int], status: str):
+    """
+    Levanta HTTP 400 se a visita, com o novo horário/duração/status,
+    se sobrepuser a outra visita ativa do mesmo imóvel ou cliente.
+    """
+    if status not in ACTIVE_STATUSES:
+        return
+    conflict = find_conflicting_visit(
+        session, db_visit.client_id, db_visit.property_id,
+        start, duration_minutes, exclude_visit_id=db_visit.id
+    )
+    if conflict:
+        raise HTTPException(status_code=400, detail=conflict_message(conflict, db_visit.property_id))
+
+def enrich_visits(visits: List[Visit], session: Session) -> List[VisitRead]:
     """
-    total_visits = len(session.exec(select(Visit)).all())
-    
-    # Visitas por status
-    agendadas = len(session.exec(select(Visit).where(Visit.status == "Agendada")).all())
-    realizadas = len(session.exec(select(Visit).where(Visit.status == "Realizada")).all())
-    canceladas = len(session.exec(select(Visit).where(Visit.status == "Cancelada")).all())
-    
-    # Visitas hoje
-    today = datetime.now().date()
-    start_of_day = f"{today} 00:00:00"
-    end_of_day = f"{today} 23:59:59"
-    
-    hoje = len(session.exec(
-        select(Visit).where(
-            and_(
-                Visit.scheduled_datetime >= start_of_day,
-                Visit.scheduled_datetime <= end_of_day
+    Enriquece uma lista de visitas com dados do cliente e do imóvel.
+
+    Busca todos os clientes e imóveis da página em duas consultas com IN,
+    em vez de duas consultas por visita (N+1).
+    """
+    client_ids = {visit.client_id for visit in visits}
+    property_ids = {visit.property_id for visit in visits}
+
+    clients = {}
+    if client_ids:
+        clients = {
+            row.id: row
+            for row in session.exec(
+                select(Client.id, Client.name, Client.phone).where(Client.id.in_(client_ids))
             )
-        )
-    ).all())
-    
-    return {
-        "total_visitas": total_visits,
-        "agendadas": agendadas,
-        "realizadas": realizadas,
-        "canceladas": canceladas,
-        "visitas_hoje": hoje,
-        "taxa_realizacao": round((realizadas / total_visits * 100), 2) if total_visits > 0 else 0
-    }
+        }
+
+    properties = {}
+    if property_ids:
+        properties = {
+            row.id: row
+            for row in session.exec(
+                select(Property.id, Property.location, Property.type).where(Property.id.in_(property_ids))
+            )
+        }
+
+    return [build_visit_read(visit, clients.get(visit.client_id), properties.get(visit.property_id)) for visit in visits]
 
 def enrich_visit_data(visit: Visit, session: Session) -> VisitRead:
     """
@@ -308,13 +345,12 @@ def enrich_visit_data(visit: Visit, session: Session) -> VisitRead:
     
     Adiciona nome do cliente, telefone e dados do imóvel.
     """
-    # Busca dados do cliente
-    client = session.get(Client, visit.client_id)
-    
-    # Busca dados do imóvel
-    property_obj = session.get(Property, visit.property_id)
-    
-    # Cria o objeto de resposta
+    return enrich_visits([visit], session)[0]
+
+def build_visit_read(visit: Visit, client, property_obj) -> VisitRead:
+    """
+    Monta o VisitRead a partir da visita e das linhas já carregadas de cliente e imóvel.
+    """
     visit_data = {
         "id": visit.id,
         "client_id": visit.client_id,
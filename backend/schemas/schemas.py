@@ -6,12 +6,15 @@ class UserCreate(BaseModel):
     username: str
     email: EmailStr
     password: str
+    # Cadastro público: nome da nova imobiliária (padrão: a partir do usuário)
+    agency_name: Optional[str] = None
 
 class UserRead(BaseModel):
     id: int
     username: str
     email: EmailStr
     is_active: bool
+    agency_id: int
 
 class UserLogin(BaseModel):
     username: str
@@ -35,6 +38,28 @@ class PropertyRead(BaseModel):
     value: float
     description: Optional[str]
     status: str
+    version: int
+
+def _reject_null(v):
+    # PATCH: omitir o campo mantém o valor; null explícito só onde a coluna aceita
+    if v is None:
+        raise ValueError("Campo não pode ser nulo")
+    return v
+
+class PropertyUpdate(BaseModel):
+    """
+    Atualização parcial de imóvel: só os campos enviados são alterados.
+
+    `version`, se informada, precisa ser a versão atual (senão 409).
+    """
+    type: Optional[str] = None
+    location: Optional[str] = None
+    value: Optional[float] = None
+    description: Optional[str] = None
+    status: Optional[str] = None
+    version: Optional[int] = None
+
+    _not_null = validator('type', 'location', 'value', 'status', allow_reuse=True)(_reject_null)
 
 class ClientCreate(BaseModel):
     name: str
@@ -52,6 +77,41 @@ class ClientRead(BaseModel):
     interest_type: str
     status: str
     preferences: Optional[str]
+    version: int
+
+class ClientUpdate(BaseModel):
+    """
+    Atualização parcial de cliente: só os campos enviados são alterados.
+
+    `version`, se informada, precisa ser a versão atual (senão 409).
+    """
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[EmailStr] = None
+    interest_type: Optional[str] = None
+    status: Optional[str] = None
+    preferences: Optional[str] = None
+    version: Optional[int] = None
+
+    _not_null = validator('name', 'phone', 'email', 'interest_type', 'status', allow_reuse=True)(_reject_null)
+
+def parse_visit_datetime(v):
+    """
+    Converte a data/hora da visita para datetime.
+
+    Aceita "YYYY-MM-DD HH:MM" ou ISO 8601 com separador "T"; horários com
+    fuso são convertidos para o horário local sem fuso, como no banco.
+    """
+    if isinstance(v, datetime):
+        parsed = v
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(v).replace('T', ' '))
+        except ValueError:
+            raise ValueError("Formato de data inválido. Use: YYYY-MM-DD HH:MM")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
 
 class VisitCreate(BaseModel):
     """
@@ -62,31 +122,24 @@ class VisitCreate(BaseModel):
     """
     client_id: int
     property_id: int
-    scheduled_datetime: str  # Formato: "YYYY-MM-DD HH:MM"
+    scheduled_datetime: datetime  # Entrada: "YYYY-MM-DD HH:MM" ou ISO 8601
     status: str = "Agendada"
     notes: Optional[str] = None
     duration_minutes: Optional[int] = 60
     agent_notes: Optional[str] = None
     
-    @validator('scheduled_datetime')
+    @validator('scheduled_datetime', pre=True)
     def validate_datetime_format(cls, v):
         """
         Valida se a data/hora está no formato correto e é futura.
         """
-        try:
-            # Tenta converter para datetime para validar formato
-            scheduled_dt = datetime.fromisoformat(v.replace('T', ' '))
-            
-            # Verifica se a data é futura (pelo menos 1 hora a partir de agora)
-            now = datetime.now()
-            if scheduled_dt <= now:
-                raise ValueError("Data da visita deve ser futura")
-                
-            return v
-        except ValueError as e:
-            if "Data da visita deve ser futura" in str(e):
-                raise e
-            raise ValueError("Formato de data inválido. Use: YYYY-MM-DD HH:MM")
+        scheduled_dt = parse_visit_datetime(v)
+        
+        # Verifica se a data é futura
+        if scheduled_dt <= datetime.now():
+            raise ValueError("Data da visita deve ser futura")
+        
+        return scheduled_dt
     
     @validator('status')
     def validate_status(cls, v):
@@ -117,11 +170,11 @@ class VisitRead(BaseModel):
     id: int
     client_id: int
     property_id: int
-    scheduled_datetime: str
+    scheduled_datetime: datetime
     status: str
     notes: Optional[str]
-    created_at: str
-    updated_at: Optional[str]
+    created_at: datetime
+    updated_at: Optional[datetime]
     duration_minutes: Optional[int]
     agent_notes: Optional[str]
     client_feedback: Optional[str]
@@ -138,21 +191,23 @@ class VisitUpdate(BaseModel):
     
     Permite atualizar todos os campos exceto IDs de cliente e imóvel.
     """
-    scheduled_datetime: Optional[str] = None
+    scheduled_datetime: Optional[datetime] = None
     status: Optional[str] = None
     notes: Optional[str] = None
     duration_minutes: Optional[int] = None
     agent_notes: Optional[str] = None
     client_feedback: Optional[str] = None
     
-    @validator('scheduled_datetime')
+    @validator('scheduled_datetime', pre=True)
     def validate_datetime_format(cls, v):
         if v is not None:
-            try:
-                datetime.fromisoformat(v.replace('T', ' '))
-                return v
-            except ValueError:
-                raise ValueError("Formato de data inválido. Use: YYYY-MM-DD HH:MM")
+            return parse_visit_datetime(v)
+        return v
+    
+    @validator('duration_minutes')
+    def validate_duration(cls, v):
+        if v is not None and (v < 15 or v > 480):  # 15 min a 8 horas
+            raise ValueError("Duração deve estar entre 15 minutos e 8 horas")
         return v
     
     @validator('status')
@@ -175,3 +230,89 @@ class NegotiationRead(BaseModel):
     status: str
     created_at: str
     updated_at: Optional[str]
+    version: int
+
+class NegotiationUpdate(BaseModel):
+    """
+    Atualização parcial de negociação: só os campos enviados são alterados.
+
+    `version`, se informada, precisa ser a versão atual (senão 409).
+    """
+    client_id: Optional[int] = None
+    property_id: Optional[int] = None
+    status: Optional[str] = None
+    version: Optional[int] = None
+
+    _not_null = validator('client_id', 'property_id', 'status', allow_reuse=True)(_reject_null)
+
+class BulkImportRowError(BaseModel):
+    row: int
+    errors: list[str]
+
+class BulkImportReport(BaseModel):
+    total_rows: int
+    inserted: int
+    failed: int
+    errors: list[BulkImportRowError]
+    errors_truncated: bool
+
+class SearchResults(BaseModel):
+    clients: list[ClientRead]
+    properties: list[PropertyRead]
+
+class MatchCriteriaRead(BaseModel):
+    types: list[str]
+    locations: list[str]
+    min_value: Optional[float]
+    max_value: Optional[float]
+
+class PropertyMatch(BaseModel):
+    property: PropertyRead
+    score: float
+
+class ClientMatches(BaseModel):
+    client_id: int
+    criteria: MatchCriteriaRead
+    matches: list[PropertyMatch]
+
+class PropertyValueStats(BaseModel):
+    group: Optional[str] = None
+    count: int
+    avg_value: float
+    min_value: float
+    p25: float
+    median: float
+    p75: float
+    p90: float
+    max_value: float
+    # p25, median, p75 e p90 vêm do histograma do rollup (mínimo e máximo são exatos)
+    percentiles_approximate: bool = True
+
+class PropertyAnalytics(BaseModel):
+    group_by: str
+    total: Optional[PropertyValueStats]
+    groups: list[PropertyValueStats]
+
+class FunnelStage(BaseModel):
+    stage: str
+    current: int
+    reached: int
+    conversion_rate: Optional[float]
+    exits: int
+    avg_hours: Optional[float]
+    median_hours: Optional[float]
+
+class NegotiationFunnel(BaseModel):
+    stages: list[FunnelStage]
+    total: int
+    won: int
+    lost: int
+    win_rate: Optional[float]
+
+class NegotiationTransitionRead(BaseModel):
+    id: int
+    negotiation_id: int
+    from_status: Optional[str]
+    to_status: str
+    changed_at: datetime
+    seconds_in_previous: Optional[float]
@@ -0,0 +1,136 @@
+"""
+Importação em lote de clientes e imóveis a partir de CSV ou NDJSON.
+
+O arquivo é lido em streaming (o Starlette guarda uploads grandes em
+disco), validado em blocos de `chunk_size` linhas com o schema de criação
+e gravado com um INSERT de várias linhas por bloco, cada bloco na sua
+própria transação, na imobiliária da sessão. A memória usada depende do
+tamanho do bloco, não do arquivo. Linhas inválidas não interrompem a importação: entram no
+relatório de erros com o número da linha.
+"""
+import codecs
+import csv
+import json
+from itertools import islice
+from typing import IO, Callable, Iterator, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from services.change_feed import change_event, publish_session_events
+from services.http_cache import bump_versions
+from services.tenancy import session_agency, session_user
+
+IMPORT_FORMATS = ["csv", "ndjson"]
+DEFAULT_CHUNK_SIZE = 1000
+# Limite de erros detalhados no relatório (os demais são apenas contados)
+MAX_REPORTED_ERRORS = 1000
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    """Deduz o formato pelo nome do arquivo ou pelo content-type."""
+    name = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    if name.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    raise HTTPException(status_code=400, detail="Formato do arquivo não reconhecido, informe format=csv ou format=ndjson")
+
+def iter_csv(stream: IO[bytes]) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Percorre o CSV (UTF-8, cabeçalho na primeira linha).
+
+    Gera (linha, registro, erro); colunas vazias viram None.
+    """
+    reader = csv.DictReader(codecs.iterdecode(stream, "utf-8-sig"))
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except (csv.Error, UnicodeDecodeError) as e:
+            yield reader.line_num, None, f"Linha inválida: {e}"
+            continue
+        if None in row:
+            yield reader.line_num, None, "Linha com mais colunas que o cabeçalho"
+            continue
+        yield reader.line_num, {k: (v if v != "" else None) for k, v in row.items()}, None
+
+def iter_ndjson(stream: IO[bytes]) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Percorre o NDJSON (um objeto JSON por linha; linhas vazias são ignoradas)."""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except (ValueError, UnicodeDecodeError) as e:
+            yield line_number, None, f"JSON inválido: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Cada linha deve ser um objeto JSON"
+            continue
+        yield line_number, record, None
+
+def _validation_messages(error: ValidationError) -> list[str]:
+    return [f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors()]
+
+def bulk_import(
+    session: Session,
+    stream: IO[bytes],
+    file_format: str,
+    schema: type[BaseModel],
+    model,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    on_insert: Optional[Callable[[Session, list], None]] = None,
+) -> dict:
+    """
+    Valida `stream` com `schema` e insere as linhas válidas na tabela de `model`.
+
+    `on_insert(session, linhas)` roda na transação de cada bloco, para
+    manter estruturas derivadas que os eventos do ORM não alcançam.
+
+    Retorna o relatório com total de linhas, inseridas, com falha e os erros
+    por linha (até MAX_REPORTED_ERRORS).
+    """
+    records = iter_ndjson(stream) if file_format == "ndjson" else iter_csv(stream)
+    table = model.__table__
+    # INSERT direto não passa pelo ORM, que preencheria a imobiliária
+    agency_id = session_agency(session)
+    report = {"total_rows": 0, "inserted": 0, "failed": 0, "errors": [], "errors_truncated": False}
+
+    def add_error(line: int, messages: list[str]):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": line, "errors": messages})
+        else:
+            report["errors_truncated"] = True
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        rows = []
+        for line, record, parse_error in chunk:
+            report["total_rows"] += 1
+            if parse_error:
+                add_error(line, [parse_error])
+                continue
+            try:
+                rows.append({**schema(**record).model_dump(), "agency_id": agency_id})
+            except ValidationError as e:
+                add_error(line, _validation_messages(e))
+        if rows:
+            session.execute(insert(table), rows)
+            # INSERT direto não passa pelo after_flush que versiona as tabelas
+            bump_versions(session.connection(), agency_id, [table.name])
+            # Um evento por bloco no feed de alterações: os assinantes recarregam a lista
+            publish_session_events(session, agency_id, [
+                change_event(table.name, "imported", data={"count": len(rows)}, user_id=session_user(session)),
+            ])
+            if on_insert:
+                on_insert(session, rows)
+            session.commit()
+            report["inserted"] += len(rows)
+    return report
@@ -0,0 +1,465 @@
+"""
+Feed de alterações em tempo real (SSE e WebSocket, routers/changes.py).
+
+Publicação: cada escrita em clientes, imóveis, visitas e negociações
+grava um evento em changeevent na mesma transação (evento after_flush da
+sessão; o PATCH e a importação em lote, que não passam pelo ORM, chamam
+publish_session_events). A posição (offset) do evento vem de um contador
+por imobiliária em changefeedhead, incrementado por UPSERT: a linha fica
+travada até o commit, então as posições de uma imobiliária são gravadas
+em ordem, sem buracos, e um evento só é visível depois do commit da
+escrita. O custo é serializar as escritas concorrentes de uma mesma
+imobiliária entre o primeiro flush e o commit.
+
+Entrega: cada processo tem um ChangeFeed com uma tarefa no event loop
+que, enquanto há assinantes, lê do primário a posição atual das
+imobiliárias assinadas e os eventos novos, guardados num buffer por
+imobiliária (CHANGE_FEED_BUFFER_SIZE). O commit de uma escrita no mesmo
+processo acorda a tarefa na hora; escritas de outros workers aparecem em
+até CHANGE_FEED_POLL_SECONDS. O JSON de cada evento é montado uma vez e
+enviado a todos os assinantes.
+
+Cada assinante tem o próprio cursor e puxa os eventos no ritmo em que
+consegue enviá-los (a escrita no socket espera o cliente), então um
+cliente lento não acumula fila no servidor: ele só fica para trás. Quem
+está atrás do buffer (ou retoma de uma posição antiga) lê do banco em
+blocos de CHANGE_FEED_BATCH_SIZE; se os eventos já foram removidos pela
+retenção (CHANGE_FEED_RETENTION_HOURS), recebe um evento "reset" com a
+posição atual e deve recarregar os dados. Acima de
+CHANGE_FEED_MAX_SUBSCRIBERS conexões no processo, novas assinaturas
+recebem 503.
+
+Filtros: o assinante só recebe eventos da própria imobiliária; `topics`
+restringe a entidades ("visit") ou registros ("negotiation:12") e
+`author` aos eventos do próprio usuário ("me") ou dos demais ("others").
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, event, inspect as sa_inspect, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session as OrmSession
+from starlette.concurrency import run_in_threadpool
+
+from models.database import DB_ASYNC, engine, get_async_engine
+from models.models import ChangeEvent, ChangeFeedHead
+from services.rollups import increment_rows
+from services.tenancy import session_user
+
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "1"))
+CHANGE_FEED_BUFFER_SIZE = int(os.getenv("CHANGE_FEED_BUFFER_SIZE", "1000"))
+CHANGE_FEED_BATCH_SIZE = int(os.getenv("CHANGE_FEED_BATCH_SIZE", "500"))
+CHANGE_FEED_RETENTION_HOURS = float(os.getenv("CHANGE_FEED_RETENTION_HOURS", "24"))
+CHANGE_FEED_PRUNE_INTERVAL_SECONDS = float(os.getenv("CHANGE_FEED_PRUNE_INTERVAL_SECONDS", "3600"))
+CHANGE_FEED_MAX_SUBSCRIBERS = int(os.getenv("CHANGE_FEED_MAX_SUBSCRIBERS", "1000"))
+
+TRACKED_TABLES = {"client", "property", "visit", "negotiation"}
+AUTHORS = ("any", "me", "others")
+
+# Chave em Session.info: a transação gravou eventos (acorda o feed no commit)
+_PENDING = "change_feed_pending"
+
+logger = logging.getLogger("crm.change_feed")
+
+# Publicação
+
+def change_event(entity: str, action: str, entity_id: Optional[int] = None, data=None, user_id: Optional[int] = None) -> dict:
+    """Evento para publish; `data` é convertido para JSON (registro ou resumo)."""
+    return {
+        "entity": entity,
+        "action": action,
+        "entity_id": entity_id,
+        "user_id": user_id,
+        "data": json.dumps(jsonable_encoder(data)) if data is not None else None,
+    }
+
+def publish(connection, agency_id: int, events: List[dict]):
+    """Grava `events` (change_event) no feed da imobiliária, na transação de `connection`."""
+    if not events:
+        return
+    head = ChangeFeedHead.__table__
+    last = increment_rows(
+        connection, head, ["agency_id"], [{"agency_id": agency_id, "seq": len(events)}], returning=["seq"],
+    ).scalar_one()
+    first = last - len(events) + 1
+    now = datetime.utcnow()
+    connection.execute(insert(ChangeEvent.__table__), [
+        {**e, "agency_id": agency_id, "seq": first + i, "created_at": now} for i, e in enumerate(events)
+    ])
+
+def publish_session_events(session, agency_id: int, events: List[dict]):
+    """publish na transação da sessão; o feed é avisado no commit."""
+    publish(session.connection(), agency_id, events)
+    session.info[_PENDING] = True
+
+@event.listens_for(OrmSession, "after_flush")
+def _publish_flushed_changes(session, flush_context):
+    changes = chain(
+        (("created", obj) for obj in session.new),
+        (("updated", obj) for obj in session.dirty if session.is_modified(obj)),
+        (("deleted", obj) for obj in session.deleted),
+    )
+    user_id = session_user(session)
+    by_agency: Dict[int, List[dict]] = {}
+    for action, obj in changes:
+        table = sa_inspect(obj).mapper.local_table.name
+        if table in TRACKED_TABLES:
+            data = obj if action != "deleted" else None
+            by_agency.setdefault(obj.agency_id, []).append(change_event(table, action, obj.id, data, user_id))
+    for agency_id, events in by_agency.items():
+        publish_session_events(session, agency_id, events)
+
+@event.listens_for(OrmSession, "after_commit")
+def _notify_committed(session):
+    if session.info.pop(_PENDING, False):
+        change_feed.notify()
+
+@event.listens_for(OrmSession, "after_soft_rollback")
+def _discard_pending(session, previous_transaction):
+    session.info.pop(_PENDING, None)
+
+# Entrega
+
+class FeedEvent(NamedTuple):
+    seq: int
+    type: str  # change | reset
+    entity: Optional[str]
+    entity_id: Optional[int]
+    user_id: Optional[int]
+    payload: str  # JSON enviado aos assinantes
+
+def _feed_event(row) -> FeedEvent:
+    payload = json.dumps({
+        "type": "change",
+        "offset": row.seq,
+        "entity": row.entity,
+        "action": row.action,
+        "id": row.entity_id,
+        "user_id": row.user_id,
+        "at": row.created_at.isoformat() + "Z",
+        "data": json.loads(row.data) if row.data else None,
+    })
+    return FeedEvent(row.seq, "change", row.entity, row.entity_id, row.user_id, payload)
+
+def _reset_event(seq: int) -> FeedEvent:
+    return FeedEvent(seq, "reset", None, None, None, json.dumps({"type": "reset", "offset": seq}))
+
+def parse_topics(topics: Optional[str]) -> Tuple[FrozenSet[str], FrozenSet[Tuple[str, int]]]:
+    """'visit,negotiation:12' -> ({'visit'}, {('negotiation', 12)}); vazio: tudo."""
+    entities, records = set(), set()
+    for topic in filter(None, (t.strip() for t in (topics or "").split(","))):
+        entity, _, entity_id = topic.partition(":")
+        if entity not in TRACKED_TABLES or (entity_id and not entity_id.isdigit()):
+            raise HTTPException(
+                status_code=422,
+                detail=f"Tópico inválido: {topic} (use {', '.join(sorted(TRACKED_TABLES))} ou entidade:id)",
+            )
+        if entity_id:
+            records.add((entity, int(entity_id)))
+        else:
+            entities.add(entity)
+    return frozenset(entities), frozenset(records)
+
+class Subscription:
+    """Um assinante: imobiliária, filtros e a última posição entregue (cursor)."""
+
+    def __init__(self, agency_id: int, user_id: int, cursor: int, topics: Optional[str], author: str):
+        self.agency_id = agency_id
+        self.user_id = user_id
+        self.cursor = cursor
+        self.entities, self.records = parse_topics(topics)
+        self.author = author
+        self.wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+
+    def wake(self):
+        if self._loop is asyncio.get_running_loop():
+            self.wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self.wakeup.set)
+
+    def matches(self, feed_event: FeedEvent) -> bool:
+        if feed_event.type != "change":
+            return True
+        if self.author == "me" and feed_event.user_id != self.user_id:
+            return False
+        if self.author == "others" and feed_event.user_id == self.user_id:
+            return False
+        if not self.entities and not self.records:
+            return True
+        return feed_event.entity in self.entities or (feed_event.entity, feed_event.entity_id) in self.records
+
+class FeedSlot:
+    """Vaga de conexão reservada por ChangeFeed.admit(); release() pode ser chamado mais de uma vez."""
+
+    def __init__(self, feed: "ChangeFeed"):
+        self._feed = feed
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._feed._release()
+
+class ChangeFeed:
+    """Leitura do feed e distribuição aos assinantes do processo (ver o docstring do módulo)."""
+
+    def __init__(self, poll_interval: float, buffer_size: int, batch_size: int,
+                 retention_hours: float, prune_interval: float, max_subscribers: int):
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.retention_hours = retention_hours
+        self.prune_interval = prune_interval
+        self.max_subscribers = max_subscribers
+        self._heads: Dict[int, int] = {}
+        self._buffers: Dict[int, deque] = {}
+        self._subscriptions: Dict[int, set] = {}
+        self._loop = None
+        self._wake = None
+        self._poller = None
+        self._pruner = None
+        self._lock = threading.Lock()
+        # Vagas reservadas por admit() (conexões abertas ou abrindo)
+        self._admitted = 0
+        # Contadores (atualizados só no event loop)
+        self.stats = {"delivered": 0, "catchup_reads": 0, "resets": 0, "rejected": 0}
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    # Banco (sempre o primário: o feed não pode ficar atrás das escritas)
+
+    @staticmethod
+    def _heads_query(agency_ids):
+        head = ChangeFeedHead.__table__
+        return select(head.c.agency_id, head.c.seq).where(head.c.agency_id.in_(agency_ids))
+
+    @staticmethod
+    def _events_query(agency_id: int, after: int, until: int, limit: int):
+        table = ChangeEvent.__table__
+        return (
+            select(table).where(table.c.agency_id == agency_id, table.c.seq > after, table.c.seq <= until)
+            .order_by(table.c.seq).limit(limit)
+        )
+
+    @staticmethod
+    def _fetch_sync(statement) -> list:
+        with engine.connect() as connection:
+            return connection.execute(statement).all()
+
+    async def _fetch(self, statement) -> list:
+        if DB_ASYNC:
+            async with get_async_engine().connect() as connection:
+                return (await connection.execute(statement)).all()
+        return await run_in_threadpool(self._fetch_sync, statement)
+
+    async def _read_heads(self, agency_ids) -> Dict[int, int]:
+        return dict(await self._fetch(self._heads_query(agency_ids)))
+
+    # Assinaturas
+
+    def admit(self) -> "FeedSlot":
+        """
+        Reserva a vaga da conexão, ou recusa com HTTP 503 acima de
+        CHANGE_FEED_MAX_SUBSCRIBERS. Verificação e reserva acontecem juntas
+        sob o lock: conexões simultâneas não passam todas pela verificação
+        antes de assinar. A vaga é devolvida com FeedSlot.release().
+        """
+        with self._lock:
+            if self._admitted >= self.max_subscribers:
+                self.stats["rejected"] += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Limite de conexões do feed de alterações atingido, tente novamente",
+                    headers={"Retry-After": "5"},
+                )
+            self._admitted += 1
+        return FeedSlot(self)
+
+    def _release(self):
+        with self._lock:
+            self._admitted -= 1
+
+    async def subscribe(self, agency_id: int, user_id: int, since: Optional[int] = None,
+                        topics: Optional[str] = None, author: str = "any") -> Subscription:
+        """Nova assinatura a partir de `since` (None: só eventos futuros); encerrar com unsubscribe."""
+        known = self._heads.get(agency_id)
+        if known is None or (since is not None and since > known):
+            # Posição atual do banco: a de um cliente que retoma pode estar à frente da conhecida
+            head = (await self._read_heads([agency_id])).get(agency_id, 0)
+            known = max(head, self._heads.get(agency_id, 0))
+        subscription = Subscription(agency_id, user_id, known if since is None else since, topics, author)
+        self._heads[agency_id] = known
+        self._buffers.setdefault(agency_id, deque(maxlen=self.buffer_size))
+        self._subscriptions.setdefault(agency_id, set()).add(subscription)
+        self._ensure_poller()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.agency_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.agency_id]
+            self._heads.pop(subscription.agency_id, None)
+            self._buffers.pop(subscription.agency_id, None)
+
+    async def read(self, subscription: Subscription, timeout: float) -> List[FeedEvent]:
+        """
+        Próximos eventos do assinante (já filtrados), em ordem; lista vazia
+        se nada chegar em `timeout` segundos.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            subscription.wakeup.clear()
+            head = self._heads.get(subscription.agency_id, 0)
+            if subscription.cursor > head:
+                # Posição que o banco não tem (ex.: banco recriado)
+                return self._reset(subscription, head)
+            if subscription.cursor < head:
+                events = await self._events_after(subscription, head)
+                matched = [e for e in events if subscription.matches(e)]
+                if matched:
+                    self.stats["delivered"] += len(matched)
+                    return matched
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            try:
+                await asyncio.wait_for(subscription.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                return []
+
+    def _reset(self, subscription: Subscription, head: int) -> List[FeedEvent]:
+        self.stats["resets"] += 1
+        subscription.cursor = head
+        return [_reset_event(head)]
+
+    async def _events_after(self, subscription: Subscription, head: int) -> List[FeedEvent]:
+        start = subscription.cursor + 1
+        buffer = self._buffers.get(subscription.agency_id)
+        if buffer and buffer[0].seq <= start:
+            index = start - buffer[0].seq
+            events = list(islice(buffer, index, index + self.batch_size))
+        else:
+            # Atrás do buffer: lê do banco
+            self.stats["catchup_reads"] += 1
+            # Até a posição conhecida: o cursor nunca passa dela
+            query = self._events_query(subscription.agency_id, subscription.cursor, head, self.batch_size)
+            rows = await self._fetch(query)
+            if not rows or rows[0].seq != start:
+                # Eventos já removidos pela retenção: o cliente recarrega os dados
+                return self._reset(subscription, head)
+            events = [_feed_event(row) for row in rows]
+        subscription.cursor = events[-1].seq
+        return events
+
+    # Leitura dos eventos novos
+
+    def _ensure_poller(self):
+        loop = asyncio.get_running_loop()
+        if self._poller is not None and not self._poller.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._wake = asyncio.Event()
+        # Contexto vazio: o SQL do feed não entra nas métricas/perfil da requisição que o iniciou
+        self._poller = loop.create_task(self._poll(self._wake), context=contextvars.Context())
+
+    async def _poll(self, wake: asyncio.Event):
+        # Termina sem assinantes ou quando outra tarefa assume (event loop novo)
+        while self._subscriptions and self._poller is asyncio.current_task():
+            wake.clear()
+            try:
+                await self._refresh()
+            except SQLAlchemyError as e:
+                logger.warning("Feed de alterações não lido: %s", e)
+            try:
+                await asyncio.wait_for(wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh(self):
+        heads = await self._read_heads(list(self._subscriptions))
+        for agency_id, head in heads.items():
+            known = self._heads.get(agency_id)
+            if known is None or head <= known:
+                continue
+            after = max(known, head - self.buffer_size)
+            rows = await self._fetch(self._events_query(agency_id, after, head, head - after))
+            buffer = self._buffers.get(agency_id)
+            if buffer is None or head <= self._heads.get(agency_id, 0):
+                continue  # assinaturas encerradas ou posição já atualizada durante a leitura
+            if buffer and (not rows or rows[0].seq != buffer[-1].seq + 1):
+                buffer.clear()  # o buffer guarda só posições consecutivas
+            buffer.extend(_feed_event(row) for row in rows)
+            self._heads[agency_id] = head
+            for subscription in self._subscriptions.get(agency_id, ()):
+                subscription.wake()
+
+    def notify(self):
+        """Acorda a leitura (chamado no commit de escritas com eventos, de qualquer thread)."""
+        self.start_pruning()
+        loop, wake = self._loop, self._wake
+        if loop is None or self._poller is None or self._poller.done():
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # event loop encerrado
+
+    # Retenção
+
+    def start_pruning(self):
+        """Inicia a thread de limpeza (uma vez, na primeira escrita com eventos)."""
+        if self._pruner is not None or self.retention_hours <= 0:
+            return
+        with self._lock:
+            if self._pruner is None:
+                self._pruner = threading.Thread(target=self._run_pruning, name="crm-change-feed-prune", daemon=True)
+                self._pruner.start()
+
+    def _run_pruning(self):
+        while True:
+            try:
+                removed = self.prune()
+                if removed:
+                    logger.info("Feed de alterações: %s eventos antigos removidos", removed)
+            except SQLAlchemyError as e:
+                logger.warning("Limpeza do feed de alterações falhou: %s", e)
+            time.sleep(self.prune_interval)
+
+    def prune(self) -> int:
+        """Remove os eventos mais antigos que a retenção; retorna quantos."""
+        table = ChangeEvent.__table__
+        cutoff = datetime.utcnow() - timedelta(hours=self.retention_hours)
+        with engine.begin() as connection:
+            return connection.execute(delete(table).where(table.c.created_at < cutoff)).rowcount
+
+    def status(self) -> dict:
+        return {
+            "subscribers": self.subscribers,
+            "admitted": self._admitted,
+            "agencies": len(self._subscriptions),
+            "buffered_events": sum(len(buffer) for buffer in self._buffers.values()),
+            **self.stats,
+        }
+
+change_feed = ChangeFeed(
+    CHANGE_FEED_POLL_SECONDS, CHANGE_FEED_BUFFER_SIZE, CHANGE_FEED_BATCH_SIZE,
+    CHANGE_FEED_RETENTION_HOURS, CHANGE_FEED_PRUNE_INTERVAL_SECONDS, CHANGE_FEED_MAX_SUBSCRIBERS,
+)
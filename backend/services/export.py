@@ -0,0 +1,80 @@
+"""
+Exportação em streaming das tabelas do CRM.
+
+Lê as linhas com cursor no servidor (yield_per) em lotes de
+EXPORT_BATCH_SIZE e serializa cada lote assim que chega, então a memória
+não cresce com o número de linhas e o primeiro byte sai logo. Só as
+colunas da tabela são lidas (sem montar objetos ORM), só da imobiliária
+do usuário que pediu a exportação, e da réplica escolhida para a
+requisição, se houver.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Iterator
+
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from models.database import engine
+from services.read_replicas import read_engine
+from services.tenancy import require_agency, set_session_agency, tenant_criteria
+
+EXPORT_FORMATS = ["csv", "ndjson"]
+EXPORT_BATCH_SIZE = 2000
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+def _iter_batches(query, model, agency_id: int, batch_size: int, bind=None):
+    """Executa a consulta em streaming e gera lotes de linhas, ordenados por id."""
+    table = model.__table__
+    with Session(bind or engine) as session:
+        require_agency(session)
+        set_session_agency(session, agency_id)
+        query = query.with_only_columns(*table.columns).where(*tenant_criteria(session, table)).order_by(table.c.id)
+        result = session.execute(query.execution_options(yield_per=batch_size))
+        for batch in result.partitions():
+            yield batch
+
+def iter_csv(query, model, agency_id: int, batch_size: int = EXPORT_BATCH_SIZE, bind=None) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in model.__table__.columns])
+    yield buffer.getvalue()
+    for batch in _iter_batches(query, model, agency_id, batch_size, bind):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+def iter_ndjson(query, model, agency_id: int, batch_size: int = EXPORT_BATCH_SIZE, bind=None) -> Iterator[str]:
+    for batch in _iter_batches(query, model, agency_id, batch_size, bind):
+        yield "".join(
+            json.dumps(dict(row._mapping), default=_json_default, ensure_ascii=False) + "\n"
+            for row in batch
+        )
+
+def export_response(query, model, agency_id: int, file_format: str, filename: str) -> StreamingResponse:
+    """
+    StreamingResponse com as linhas de `query` da imobiliária no formato pedido.
+
+    A consulta roda numa sessão própria, aberta quando o corpo começa a ser
+    enviado e fechada ao final (ou se o cliente desconectar), no banco de
+    leitura da requisição (primário ou réplica).
+    """
+    iterate = iter_ndjson if file_format == "ndjson" else iter_csv
+    rows = iterate(query, model, agency_id, bind=read_engine())
+    return StreamingResponse(
+        rows,
+        media_type=MEDIA_TYPES[file_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{file_format}"'},
+    )
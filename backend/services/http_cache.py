@@ -0,0 +1,326 @@
+"""
+ETags e cache de respostas para os GETs de clientes, imóveis, visitas e
+negociações.
+
+Cada escrita nessas tabelas incrementa um contador por imobiliária e
+tabela em EntityVersion na mesma transação (evento after_flush da sessão;
+a importação em lote chama bump_versions). O ETag de um GET é o hash da
+imobiliária, do caminho, da query string, da data do dia e das versões
+das tabelas de que a rota depende, então muda a cada escrita relevante
+da imobiliária e é o mesmo em todos os workers.
+
+ConditionalGetMiddleware lê só as versões da imobiliária do usuário (uma
+linha por tabela), do mesmo banco que a rota vai ler (primário ou réplica):
+- If-None-Match igual ao ETag: 304 sem executar a rota;
+- RESPONSE_CACHE_URL configurada: devolve o corpo guardado para o ETag
+  (memory:// em processo, redis:// num Redis ou compatível).
+
+ETag e atalhos só valem quando o usuário do token (e com ele a
+imobiliária) é resolvido sem banco (claims ou cache de autenticação);
+caso contrário a requisição segue pela rota normal, que autentica e passa
+a alimentar o cache. A mesma consulta das versões confere o registro do
+usuário: desativado, excluído ou movido para outra imobiliária, ele sai
+do cache de autenticação e a requisição segue pela rota, que o rejeita
+ou usa a imobiliária nova. Alterações feitas direto no banco, fora do
+ORM, não mudam as versões.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import date
+from itertools import chain
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, inspect as sa_inspect, select
+from sqlalchemy.orm import Session as OrmSession
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from auth.auth import resolve_user_without_db, user_cache
+from models.database import DB_ASYNC
+from models.models import EntityVersion, User
+from services.pagination import NEXT_CURSOR_HEADER, TOTAL_ESTIMATE_HEADER
+from services.read_replicas import read_async_engine, read_engine
+from services.rollups import increment_rows
+
+# Cache de respostas: vazio desativa (ficam só os ETags)
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+
+TRACKED_TABLES = {"client", "property", "visit", "negotiation"}
+
+# Rotas com ETag e as tabelas de que a resposta depende (vale a primeira que casar)
+CACHED_ROUTES = [
+    (re.compile(r"^/clients/\d+/matches$"), ("client", "property")),
+    (re.compile(r"^/clients(/|$)"), ("client",)),
+    (re.compile(r"^/properties(/|$)"), ("property",)),
+    (re.compile(r"^/visits(/|$)"), ("visit", "client", "property")),
+    (re.compile(r"^/negotiations(/|$)"), ("negotiation",)),
+]
+
+CACHE_CONTROL = b"private, no-cache"
+# Cabeçalhos da resposta guardados junto com o corpo
+_STORED_HEADERS = {b"content-type", NEXT_CURSOR_HEADER.lower().encode(), TOTAL_ESTIMATE_HEADER.lower().encode()}
+
+# Versões das tabelas
+
+def bump_versions(connection, agency_id: int, tables: Iterable[str]):
+    """Incrementa a versão das tabelas da imobiliária na transação da escrita."""
+    tables = sorted(set(tables))
+    increment_rows(
+        connection, EntityVersion.__table__, ["agency_id", "entity"],
+        [{"agency_id": agency_id, "entity": t, "version": 1} for t in tables],
+    )
+    if response_cache is not None:
+        response_cache.invalidate(agency_id, tables)
+
+@event.listens_for(OrmSession, "after_flush")
+def _bump_flushed_versions(session, flush_context):
+    changed = chain(session.new, session.deleted, (obj for obj in session.dirty if session.is_modified(obj)))
+    by_agency: Dict[int, set] = {}
+    for obj in changed:
+        table = sa_inspect(obj).mapper.local_table.name
+        if table in TRACKED_TABLES:
+            by_agency.setdefault(obj.agency_id, set()).add(table)
+    for agency_id, tables in by_agency.items():
+        bump_versions(session.connection(), agency_id, tables)
+
+def _versions_query(user_id: int):
+    """Situação atual do usuário e as versões da sua imobiliária, numa consulta."""
+    return (
+        select(User.agency_id, User.is_active, EntityVersion.entity, EntityVersion.version)
+        .select_from(User)
+        .outerjoin(EntityVersion, EntityVersion.agency_id == User.agency_id)
+        .where(User.id == user_id)
+    )
+
+def _user_versions(rows, user) -> Optional[Dict[str, int]]:
+    """Versões das tabelas, ou None se o usuário não vale mais como resolvido (ver o docstring do módulo)."""
+    if not rows or any(not row.is_active or row.agency_id != user.agency_id for row in rows):
+        return None
+    return {row.entity: row.version for row in rows if row.entity is not None}
+
+def _read_versions_sync(user) -> Optional[Dict[str, int]]:
+    with read_engine().connect() as connection:
+        return _user_versions(connection.execute(_versions_query(user.id)).all(), user)
+
+async def read_versions(user) -> Optional[Dict[str, int]]:
+    if DB_ASYNC:
+        async with read_async_engine().connect() as connection:
+            return _user_versions((await connection.execute(_versions_query(user.id))).all(), user)
+    return await run_in_threadpool(_read_versions_sync, user)
+
+# ETags
+
+def route_tables(path: str) -> Optional[Sequence[str]]:
+    for pattern, tables in CACHED_ROUTES:
+        if pattern.match(path):
+            return tables
+    return None
+
+def compute_etag(agency_id: int, path: str, query_string: str, tables: Sequence[str], versions: Dict[str, int]) -> str:
+    """ETag forte; inclui a data porque rotas como /visits/today dependem dela."""
+    parts = [str(agency_id), path, query_string, date.today().isoformat()]
+    parts += [f"{table}={versions.get(table, 0)}" for table in tables]
+    return '"' + hashlib.sha1("|".join(parts).encode()).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+# Cache de respostas
+
+class MemoryResponseCache:
+    """
+    Cache LRU com TTL em processo, indexado pelo ETag.
+
+    Guarda também a imobiliária e as tabelas de cada resposta para
+    descartá-las quando uma delas muda (as chaves antigas nunca mais seriam
+    lidas). Thread-safe.
+    """
+    backend = "memory"
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    async def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2], entry[3]
+
+    async def set(self, key: str, agency_id: int, tables: Sequence[str], headers: List[Tuple[bytes, bytes]], body: bytes):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, {(agency_id, t) for t in tables}, headers, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, agency_id: int, tables: Iterable[str]):
+        tables = {(agency_id, t) for t in tables}
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry[1] & tables]:
+                del self._entries[key]
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+class RedisResponseCache:
+    """
+    Cache em Redis (ou servidor compatível), compartilhado entre workers.
+
+    Como a chave já traz as versões, não há invalidação explícita: as
+    entradas antigas deixam de ser lidas e expiram pelo TTL.
+    """
+    backend = "redis"
+    KEY_PREFIX = "crm:response:"
+
+    def __init__(self, url: str, ttl_seconds: int):
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_URL com redis:// exige o pacote redis (pip install redis)")
+        self.ttl_seconds = ttl_seconds
+        self._client = redis_asyncio.Redis.from_url(url)
+
+    async def get(self, key: str):
+        raw = await self._client.get(self.KEY_PREFIX + key)
+        if raw is None:
+            return None
+        header_line, body = raw.split(b"\n", 1)
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(header_line)]
+        return headers, body
+
+    async def set(self, key: str, agency_id: int, tables: Sequence[str], headers: List[Tuple[bytes, bytes]], body: bytes):
+        header_line = json.dumps([(name.decode("latin-1"), value.decode("latin-1")) for name, value in headers])
+        await self._client.set(self.KEY_PREFIX + key, header_line.encode() + b"\n" + body, ex=self.ttl_seconds)
+
+    def invalidate(self, agency_id: int, tables: Iterable[str]):
+        pass
+
+    def size(self) -> Optional[int]:
+        return None
+
+def create_response_cache(url: str):
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisResponseCache(url, RESPONSE_CACHE_TTL_SECONDS)
+    raise ValueError(f"RESPONSE_CACHE_URL não suportada: {url}")
+
+response_cache = create_response_cache(RESPONSE_CACHE_URL)
+
+# Contadores (atualizados só no event loop)
+_stats = {"requests": 0, "not_modified": 0, "cache_hits": 0, "cache_misses": 0, "bypassed": 0}
+
+def http_cache_stats() -> dict:
+    requests = _stats["requests"]
+    lookups = _stats["cache_hits"] + _stats["cache_misses"]
+    return {
+        **_stats,
+        "not_modified_ratio": round(_stats["not_modified"] / requests, 4) if requests else None,
+        "cache_hit_ratio": round(_stats["cache_hits"] / lookups, 4) if lookups else None,
+        "cache_backend": response_cache.backend if response_cache is not None else None,
+        "cache_size": response_cache.size() if response_cache is not None else None,
+    }
+
+def _validator_headers(etag: str) -> List[Tuple[bytes, bytes]]:
+    return [(b"etag", etag.encode()), (b"cache-control", CACHE_CONTROL)]
+
+def _bearer_token(headers: Headers) -> Optional[str]:
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    return token if scheme.lower() == "bearer" and token else None
+
+class ConditionalGetMiddleware:
+    """Middleware ASGI de ETag / If-None-Match e cache de respostas (ver o docstring do módulo)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        tables = route_tables(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        if tables is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        _stats["requests"] += 1
+        token = _bearer_token(headers)
+        user = resolve_user_without_db(token) if token is not None else None
+        if user is None:
+            # Sem a imobiliária não há como saber as versões: rota normal, sem ETag
+            _stats["bypassed"] += 1
+            await self.app(scope, receive, send)
+            return
+
+        versions = await read_versions(user)
+        if versions is None:
+            # Usuário mudou desde que foi resolvido: a rota autentica de novo pelo banco
+            user_cache.invalidate_user(user.id)
+            _stats["bypassed"] += 1
+            await self.app(scope, receive, send)
+            return
+        etag = compute_etag(user.agency_id, scope["path"], scope["query_string"].decode("latin-1"), tables, versions)
+        if_none_match = headers.get("if-none-match")
+        if etag_matches(if_none_match, etag):
+            _stats["not_modified"] += 1
+            await self._send(send, 304, _validator_headers(etag), b"")
+            return
+        elif response_cache is not None:
+            cached = await response_cache.get(etag)
+            if cached is not None:
+                _stats["cache_hits"] += 1
+                stored_headers, body = cached
+                response_headers = [*stored_headers, (b"content-length", str(len(body)).encode())]
+                await self._send(send, 200, response_headers + _validator_headers(etag), body)
+                return
+            _stats["cache_misses"] += 1
+
+        await self._run_route(scope, receive, send, etag, user.agency_id, tables)
+
+    async def _run_route(self, scope, receive, send, etag, agency_id, tables):
+        """Executa a rota; respostas 200 ganham o ETag e vão para o cache."""
+        state = {"ok": False, "headers": []}
+        chunks = []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                if message["status"] == 200:
+                    state["ok"] = True
+                    state["headers"] = [(k, v) for k, v in message["headers"] if k.lower() in _STORED_HEADERS]
+                    message = {**message, "headers": [*message["headers"], *_validator_headers(etag)]}
+                await send(message)
+                return
+
+            if state["ok"] and response_cache is not None:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await response_cache.set(etag, agency_id, tables, state["headers"], b"".join(chunks))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    async def _send(send, status: int, headers, body: bytes):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
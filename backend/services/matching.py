@@ -0,0 +1,447 @@
+"""
+Sugestão de imóveis para clientes a partir de Client.preferences.
+
+O texto livre das preferências ("Apartamento em Moema até 800 mil") é
+convertido em critérios estruturados: tipos de imóvel, localizações e
+faixa de valor. Os imóveis disponíveis ficam num índice em memória com
+arrays NumPy (valor, código do tipo, código da localização). Tipos e
+localizações distintos são os "baldes": cada critério é avaliado uma vez
+por balde e espalhado para os imóveis por indexação vetorizada, então o
+custo por consulta é O(baldes + n) em operações NumPy, sem laço Python
+por imóvel.
+
+Há um índice por imobiliária, carregado pela sessão da rota (que só
+enxerga os imóveis dela). Ele é atualizado de forma incremental:
+INSERT/UPDATE/DELETE de Property pelo ORM marcam o id como sujo quando a
+transação é confirmada (um rollback descarta as marcas), e na consulta
+seguinte só os ids sujos e os ids novos (id > maior id conhecido, o que
+cobre a importação em lote) são relidos do banco. A cada
+MATCHING_RELOAD_SECONDS o índice é recarregado por inteiro, para
+refletir mudanças feitas por outros processos.
+"""
+import os
+import re
+import time
+import unicodedata
+from dataclasses import asdict, dataclass, field
+from threading import Lock
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession, object_session
+from sqlmodel import Session, or_, select
+
+from models.models import Client, Property
+
+MATCHING_RELOAD_SECONDS = float(os.getenv("MATCHING_RELOAD_SECONDS", "600"))
+
+# Só imóveis com este status são sugeridos
+AVAILABLE_STATUS = "Disponível"
+
+# Pesos dos critérios (normalizados entre os critérios informados)
+LOCATION_WEIGHT = 0.6
+VALUE_WEIGHT = 0.4
+# Fora da faixa, a nota do valor cai a zero a esta distância relativa do limite
+VALUE_TOLERANCE = 0.3
+
+# Palavra (sem acento) -> tipo de imóvel
+TYPE_KEYWORDS = {
+    "casa": "casa",
+    "casas": "casa",
+    "apartamento": "apartamento",
+    "apartamentos": "apartamento",
+    "apto": "apartamento",
+    "ap": "apartamento",
+    "terreno": "terreno",
+    "terrenos": "terreno",
+    "lote": "terreno",
+    "comercial": "comercial",
+    "loja": "comercial",
+    "sala": "comercial",
+    "chacara": "chacara",
+    "sitio": "chacara",
+    "sobrado": "sobrado",
+    "sobrados": "sobrado",
+}
+
+STOPWORDS = {"de", "da", "do", "das", "dos", "e", "a", "o", "em", "no", "na"}
+
+_NUMBER = r"(\d+(?:[.,]\d+)*)\s*(milhoes|milhao|mil|mi|k)?\b"
+_MAX_VALUE = re.compile(r"\b(?:ate|maximo|max|abaixo de|menos de|orcamento(?: de)?|budget)\s*(?:r\$\s*)?" + _NUMBER)
+_MIN_VALUE = re.compile(r"\b(?:a partir de|acima de|minimo|min|mais de)\s*(?:r\$\s*)?" + _NUMBER)
+_RANGE = re.compile(r"\bentre\s*(?:r\$\s*)?" + _NUMBER + r"\s*e\s*(?:r\$\s*)?" + _NUMBER)
+# Número seguido de unidade de valor ou de área/cômodos ("800 mil", "120 m2",
+# "3 quartos"): termina a localização. Número solto faz parte do nome
+# ("Vila 25 de Agosto", "Jardim 9 de Julho").
+_UNIT_NUMBER = r"\d+(?:[.,]\d+)*\s*(?:milhoes|milhao|mil|mi|k|m2|metros|quartos?|dormitorios?|suites?|vagas?)\b"
+_LOCATION = re.compile(
+    r"\b(?:em|no|na|nos|nas|bairro|regiao d[aeo]s?|proximo a[o]?|perto d[aeo]s?)\s+"
+    r"([a-z][a-z0-9 ]*?)"
+    r"(?=\s+(?:ate|entre|com|por|acima|abaixo|a partir|ou|e|de r)\b|\s+r\$|\s*[,;.!?(]|\s+" + _UNIT_NUMBER + r"|$)"
+)
+_NOT_LOCATION = {"maximo", "minimo", "valor", "orcamento", "torno", "media"}
+
+def normalize(text: str) -> str:
+    """Minúsculas e sem acentos."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def _tokens(text: str) -> set:
+    return {t for t in re.findall(r"[a-z0-9]+", normalize(text)) if t not in STOPWORDS}
+
+def _parse_number(digits: str, unit: Optional[str]) -> float:
+    if "," in digits:
+        digits = digits.replace(".", "").replace(",", ".")
+    elif re.fullmatch(r"\d{1,3}(\.\d{3})+", digits):
+        digits = digits.replace(".", "")
+    value = float(digits)
+    if unit in ("mil", "k"):
+        value *= 1_000
+    elif unit in ("milhao", "milhoes", "mi"):
+        value *= 1_000_000
+    return value
+
+def _money(digits: str, unit: Optional[str]) -> Optional[float]:
+    # Números pequenos sem unidade ("até 3 quartos") não são valores
+    value = _parse_number(digits, unit)
+    return value if unit or value >= 1000 else None
+
+@dataclass
+class MatchCriteria:
+    """Critérios extraídos das preferências de um cliente."""
+    types: List[str] = field(default_factory=list)
+    locations: List[str] = field(default_factory=list)
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.types or self.locations or self.min_value or self.max_value)
+
+def parse_preferences(preferences: Optional[str]) -> MatchCriteria:
+    """
+    Extrai tipo, localização e faixa de valor do texto de preferências.
+
+    Exemplos (conferidos com ``python -m doctest services/matching.py``):
+
+    >>> parse_preferences("Casa ou sobrado no Jardim Paulista até R$ 1,2 milhão")
+    MatchCriteria(types=['casa', 'sobrado'], locations=['jardim paulista'], min_value=None, max_value=1200000.0)
+    >>> parse_preferences("apartamento em Moema entre 500 mil e 800 mil")
+    MatchCriteria(types=['apartamento'], locations=['moema'], min_value=500000.0, max_value=800000.0)
+
+    Números fazem parte do nome do bairro, a menos que venham com unidade:
+
+    >>> parse_preferences("Apartamento na Vila 25 de Agosto até 500 mil").locations
+    ['vila 25 de agosto']
+    >>> parse_preferences("casa no Jardim 9 de Julho com 3 quartos").locations
+    ['jardim 9 de julho']
+    >>> parse_preferences("sala em Centro 120 m²").locations
+    ['centro']
+    """
+    text = normalize(preferences)
+    criteria = MatchCriteria()
+
+    for word in re.findall(r"[a-z]+", text):
+        kind = TYPE_KEYWORDS.get(word)
+        if kind and kind not in criteria.types:
+            criteria.types.append(kind)
+
+    match = _RANGE.search(text)
+    if match:
+        low, high = _money(*match.group(1, 2)), _money(*match.group(3, 4))
+        if low is not None and high is not None:
+            criteria.min_value, criteria.max_value = min(low, high), max(low, high)
+    if criteria.max_value is None:
+        match = _MAX_VALUE.search(text)
+        if match:
+            criteria.max_value = _money(*match.group(1, 2))
+    if criteria.min_value is None:
+        match = _MIN_VALUE.search(text)
+        if match:
+            criteria.min_value = _money(*match.group(1, 2))
+
+    for match in _LOCATION.finditer(text):
+        phrase = match.group(1).strip()
+        words = phrase.split()
+        if not words or words[0] in _NOT_LOCATION or all(w in TYPE_KEYWORDS for w in words):
+            continue
+        if phrase not in criteria.locations:
+            criteria.locations.append(phrase)
+    return criteria
+
+class PropertyMatchIndex:
+    """
+    Índice em memória dos imóveis disponíveis para o cálculo de sugestões.
+
+    Posições de imóveis removidos ou indisponíveis são apenas desativadas;
+    a recarga completa periódica compacta os arrays.
+    """
+
+    def __init__(self, reload_seconds: float):
+        self.reload_seconds = reload_seconds
+        self._lock = Lock()
+        self._dirty = set()
+        self._loaded_at = None
+        # Incrementado a cada refresh aplicado
+        self._version = 0
+        self._reset()
+
+    def _reset(self):
+        self._max_id = 0
+        self._positions = {}
+        self.ids = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0, dtype=np.float64)
+        self.type_codes = np.empty(0, dtype=np.int32)
+        self.location_codes = np.empty(0, dtype=np.int32)
+        self.active = np.empty(0, dtype=bool)
+        # Baldes: código -> tipo normalizado / tokens da localização
+        self.types = []
+        self._type_codes = {}
+        self.locations = []
+        self._location_codes = {}
+
+    def mark_dirty(self, property_id: Optional[int]):
+        if property_id is not None:
+            with self._lock:
+                self._dirty.add(property_id)
+
+    def invalidate(self):
+        """Força a recarga completa na próxima consulta."""
+        with self._lock:
+            self._loaded_at = None
+
+    def _type_code(self, value: str) -> int:
+        key = normalize(value).strip()
+        if key not in self._type_codes:
+            self._type_codes[key] = len(self.types)
+            self.types.append(key)
+        return self._type_codes[key]
+
+    def _location_code(self, value: str) -> int:
+        key = normalize(value).strip()
+        if key not in self._location_codes:
+            self._location_codes[key] = len(self.locations)
+            self.locations.append(_tokens(key))
+        return self._location_codes[key]
+
+    def _append(self, rows):
+        if not rows:
+            return
+        start = len(self.ids)
+        for offset, row in enumerate(rows):
+            self._positions[row.id] = start + offset
+        self.ids = np.concatenate([self.ids, np.fromiter((r.id for r in rows), np.int64, len(rows))])
+        self.values = np.concatenate([self.values, np.fromiter((r.value for r in rows), np.float64, len(rows))])
+        self.type_codes = np.concatenate(
+            [self.type_codes, np.fromiter((self._type_code(r.type) for r in rows), np.int32, len(rows))]
+        )
+        self.location_codes = np.concatenate(
+            [self.location_codes, np.fromiter((self._location_code(r.location) for r in rows), np.int32, len(rows))]
+        )
+        self.active = np.concatenate([self.active, np.ones(len(rows), dtype=bool)])
+        self._max_id = max(self._max_id, int(self.ids.max()))
+
+    def _columns(self):
+        return select(Property.id, Property.type, Property.location, Property.value, Property.status)
+
+    def refresh(self, session: Session):
+        """
+        Carrega o índice ou aplica as mudanças pendentes.
+
+        A consulta roda sem o lock: no modo DB_ASYNC as rotas são greenlets
+        na thread do loop, e uma delas bloqueada no lock durante o I/O de
+        outra travaria o loop inteiro. O lock só protege a leitura do estado
+        e a aplicação das linhas. Se outro refresh aplicou mudanças no meio
+        tempo, as linhas lidas podem ser mais antigas que as dele: elas são
+        descartadas e os ids sujos voltam para a próxima consulta.
+        """
+        with self._lock:
+            version = self._version
+            expired = self._loaded_at is None or time.monotonic() - self._loaded_at > self.reload_seconds
+            dirty, self._dirty = self._dirty, set()
+            max_id = self._max_id
+        started = time.monotonic()
+
+        try:
+            if expired:
+                query = self._columns().where(Property.status == AVAILABLE_STATUS)
+            elif dirty:
+                query = self._columns().where(or_(Property.id.in_(dirty), Property.id > max_id))
+            else:
+                query = self._columns().where(Property.id > max_id)
+            rows = session.exec(query).all()
+        except BaseException:
+            with self._lock:
+                self._dirty |= dirty
+            raise
+
+        with self._lock:
+            if self._version != version:
+                self._dirty |= dirty
+                return
+            self._version += 1
+            if expired:
+                self._reset()
+                self._append(rows)
+                self._loaded_at = started
+                return
+
+            # Cópias alteradas e trocadas de uma vez: score() guarda
+            # referências aos arrays publicados, que nunca mudam no lugar
+            active, values = self.active.copy(), self.values.copy()
+            type_codes, location_codes = self.type_codes.copy(), self.location_codes.copy()
+            new_rows = []
+            for row in rows:
+                dirty.discard(row.id)
+                position = self._positions.get(row.id)
+                if position is None:
+                    if row.status == AVAILABLE_STATUS:
+                        new_rows.append(row)
+                    else:
+                        self._max_id = max(self._max_id, row.id)
+                    continue
+                active[position] = row.status == AVAILABLE_STATUS
+                values[position] = row.value
+                type_codes[position] = self._type_code(row.type)
+                location_codes[position] = self._location_code(row.location)
+            # Ids sujos que não voltaram da consulta foram removidos
+            for property_id in dirty:
+                position = self._positions.get(property_id)
+                if position is not None:
+                    active[position] = False
+            self.active, self.values = active, values
+            self.type_codes, self.location_codes = type_codes, location_codes
+            self._append(new_rows)
+
+    def score(self, criteria: MatchCriteria, limit: int):
+        """
+        Retorna [(property_id, nota)] dos `limit` imóveis com maior nota.
+
+        O tipo é filtro obrigatório quando informado; localização e valor
+        compõem a nota (0 a 1), ponderados entre os critérios informados.
+        """
+        # Os arrays não mudam depois de publicados (refresh troca por cópias),
+        # então basta ler as referências juntas sob o lock
+        with self._lock:
+            ids, values, active = self.ids, self.values, self.active
+            type_codes, location_codes = self.type_codes, self.location_codes
+            types, locations = list(self.types), list(self.locations)
+
+        if criteria.is_empty or len(ids) == 0:
+            return []
+
+        mask = active
+        if criteria.types:
+            wanted = np.fromiter((t in criteria.types for t in types), bool, len(types))
+            mask = mask & wanted[type_codes]
+
+        total = np.zeros(len(ids), dtype=np.float64)
+        weight = 0.0
+        if criteria.locations:
+            phrases = [_tokens(p) for p in criteria.locations]
+            phrases = [p for p in phrases if p]
+            # Nota por balde de localização: fração dos termos da frase presentes
+            bucket_scores = np.fromiter(
+                (max((len(p & tokens) / len(p) for p in phrases), default=0.0) for tokens in locations),
+                np.float64,
+                len(locations),
+            )
+            total += LOCATION_WEIGHT * bucket_scores[location_codes]
+            weight += LOCATION_WEIGHT
+        if criteria.min_value is not None or criteria.max_value is not None:
+            below = np.zeros(len(ids))
+            above = np.zeros(len(ids))
+            if criteria.min_value:
+                below = np.clip((criteria.min_value - values) / criteria.min_value, 0, None)
+            if criteria.max_value:
+                above = np.clip((values - criteria.max_value) / criteria.max_value, 0, None)
+            total += VALUE_WEIGHT * np.clip(1 - (below + above) / VALUE_TOLERANCE, 0, 1)
+            weight += VALUE_WEIGHT
+
+        scores = total / weight if weight else np.ones(len(ids))
+        scores = np.where(mask, scores, 0.0)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        # Maior nota primeiro; empate pelo menor id
+        order = np.lexsort((ids[candidates], -scores[candidates]))
+        return [(int(ids[i]), round(float(scores[i]), 4)) for i in candidates[order]]
+
+class MatchIndexRegistry:
+    """Um PropertyMatchIndex por imobiliária, criado na primeira consulta."""
+
+    def __init__(self, reload_seconds: float):
+        self.reload_seconds = reload_seconds
+        self._lock = Lock()
+        self._indexes = {}
+
+    def get(self, agency_id: int) -> PropertyMatchIndex:
+        with self._lock:
+            index = self._indexes.get(agency_id)
+            if index is None:
+                index = self._indexes[agency_id] = PropertyMatchIndex(self.reload_seconds)
+            return index
+
+    def mark_dirty(self, agency_id: int, property_id: Optional[int]):
+        with self._lock:
+            index = self._indexes.get(agency_id)
+        # Índice ainda não carregado: a primeira consulta já lê tudo
+        if index is not None:
+            index.mark_dirty(property_id)
+
+    def invalidate(self):
+        """Força a recarga completa de todos os índices na próxima consulta."""
+        with self._lock:
+            indexes = list(self._indexes.values())
+        for index in indexes:
+            index.invalidate()
+
+match_index = MatchIndexRegistry(MATCHING_RELOAD_SECONDS)
+
+# session.info: {(agency_id, property_id)} gravados na transação em curso
+_PENDING = "matching_dirty_properties"
+
+@event.listens_for(Property, "after_insert")
+@event.listens_for(Property, "after_update")
+@event.listens_for(Property, "after_delete")
+def _collect_dirty_property(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING, set()).add((target.agency_id, target.id))
+
+@event.listens_for(OrmSession, "after_commit")
+def _mark_committed_properties_dirty(session):
+    # Só depois do commit: antes disso outra consulta ao índice releria a
+    # linha antiga e descartaria o id sujo
+    for agency_id, property_id in session.info.pop(_PENDING, ()):
+        match_index.mark_dirty(agency_id, property_id)
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_dirty_properties(session):
+    session.info.pop(_PENDING, None)
+
+def match_properties(session: Session, client: Client, limit: int = 10) -> dict:
+    """
+    Critérios extraídos das preferências do cliente e os imóveis mais
+    aderentes, com a nota de cada um.
+    """
+    criteria = parse_preferences(client.preferences)
+    index = match_index.get(client.agency_id)
+    index.refresh(session)
+    ranked = index.score(criteria, limit)
+
+    properties = {}
+    if ranked:
+        ids = [property_id for property_id, _ in ranked]
+        properties = {p.id: p for p in session.exec(select(Property).where(Property.id.in_(ids)))}
+    return {
+        "client_id": client.id,
+        "criteria": asdict(criteria),
+        "matches": [
+            {"property": properties[property_id], "score": score}
+            for property_id, score in ranked
+            if property_id in properties
+        ],
+    }
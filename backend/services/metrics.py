@@ -0,0 +1,314 @@
+"""
+Métricas de desempenho da API no formato de exposição do Prometheus.
+
+- MetricsMiddleware: por rota, contagem de requisições por status,
+  histograma de latência e soma de comandos SQL e do tempo gasto neles;
+  requisições em andamento. Cada resposta leva o cabeçalho Server-Timing
+  com os tempos de banco (db), do restante da aplicação (app) e total.
+- instrument_engine: eventos do SQLAlchemy que medem cada comando SQL e
+  a espera por uma conexão livre no pool.
+- render_metrics: texto servido em /metrics, incluindo os contadores do
+  cache de autenticação, do executor de bcrypt e do cache HTTP.
+
+Os valores ficam em memória, por processo: com vários workers, cada um
+expõe os seus (o Prometheus soma por instância).
+"""
+import os
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, Optional, Sequence
+
+from starlette.routing import Match
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+
+# Limites dos histogramas, em segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+POOL_WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+UNMATCHED_ROUTE = "unmatched"
+
+class Histogram:
+    """Histograma com limites fixos (contagens por faixa, soma e total)."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class RequestTiming:
+    """Comandos SQL e tempo de banco da requisição atual."""
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+# Propaga para o threadpool (rotas síncronas) e para o run_sync do modo assíncrono
+_current_request: ContextVar[Optional[RequestTiming]] = ContextVar("crm_request_timing", default=None)
+
+class MetricsRegistry:
+    """Contadores e histogramas do processo. Thread-safe."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.in_flight = 0
+        self.requests: Dict[tuple, int] = defaultdict(int)
+        self.latency: Dict[tuple, Histogram] = {}
+        self.request_statements: Dict[tuple, int] = defaultdict(int)
+        self.request_db_seconds: Dict[tuple, float] = defaultdict(float)
+        self.sql = Histogram(SQL_BUCKETS)
+        self.pool_wait = Histogram(POOL_WAIT_BUCKETS)
+        self._engines = weakref.WeakKeyDictionary()
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, timing: RequestTiming):
+        key = (method, route)
+        with self._lock:
+            self.requests[(method, route, str(status))] += 1
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            self.request_statements[key] += timing.statements
+            self.request_db_seconds[key] += timing.db_seconds
+
+    def observe_statement(self, seconds: float):
+        with self._lock:
+            self.sql.observe(seconds)
+        timing = _current_request.get()
+        if timing is not None:
+            timing.statements += 1
+            timing.db_seconds += seconds
+
+    def observe_pool_wait(self, seconds: float):
+        with self._lock:
+            self.pool_wait.observe(seconds)
+
+    def register_engine(self, engine, name: str):
+        self._engines[engine] = name
+
+    def pool_status(self) -> Dict[str, dict]:
+        """Conexões em uso e ociosas por engine (somadas quando há mais de um com o mesmo nome)."""
+        status = {}
+        for engine, name in list(self._engines.items()):
+            pool = engine.pool
+            entry = status.setdefault(name, {"checked_out": 0, "idle": 0})
+            entry["checked_out"] += pool.checkedout() if hasattr(pool, "checkedout") else 0
+            entry["idle"] += pool.checkedin() if hasattr(pool, "checkedin") else 0
+        return status
+
+metrics = MetricsRegistry()
+
+def instrument_engine(engine, name: str):
+    """Mede os comandos SQL e a espera por conexão do engine (síncrono ou sync_engine do assíncrono)."""
+    if not METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+
+    metrics.register_engine(engine, name)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_statement(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end_statement(conn, cursor, statement, parameters, context, executemany):
+        metrics.observe_statement(time.perf_counter() - conn.info["metrics_start_time"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _failed_statement(context):
+        starts = context.connection.info.get("metrics_start_time") if context.connection is not None else None
+        if starts:
+            metrics.observe_statement(time.perf_counter() - starts.pop())
+
+    # O pool não tem evento antes da retirada; _do_get é onde a espera acontece
+    pool = engine.pool
+    do_get = pool._do_get
+
+    def _timed_do_get():
+        start = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            metrics.observe_pool_wait(time.perf_counter() - start)
+
+    pool._do_get = _timed_do_get
+
+def _flatten_routes(routes):
+    for route in routes:
+        # Routers incluídos (FastAPI recente) guardam as rotas no router original
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            yield from _flatten_routes(included.routes)
+        else:
+            yield route
+
+_app_routes = weakref.WeakKeyDictionary()
+
+def route_name(scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        # Respostas curtas do ConditionalGetMiddleware (304, cache) não chegam ao roteador
+        app = scope["app"]
+        if app not in _app_routes:
+            _app_routes[app] = list(_flatten_routes(app.router.routes))
+        route = next((r for r in _app_routes[app] if r.matches(scope)[0] == Match.FULL), None)
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+def _server_timing(timing: RequestTiming, elapsed: float) -> bytes:
+    db_ms = timing.db_seconds * 1000
+    total_ms = elapsed * 1000
+    return (
+        f'db;dur={db_ms:.1f};desc="{timing.statements} SQL", '
+        f"app;dur={max(0.0, total_ms - db_ms):.1f}, total;dur={total_ms:.1f}"
+    ).encode()
+
+class MetricsMiddleware:
+    """Middleware ASGI que alimenta o registro e adiciona o Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current_request.set(timing)
+        start = time.perf_counter()
+        status = 500
+        metrics.in_flight += 1
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [*message["headers"], (b"server-timing", _server_timing(timing, time.perf_counter() - start))]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_flight -= 1
+            _current_request.reset(token)
+            metrics.observe_request(scope["method"], route_name(scope), status, time.perf_counter() - start, timing)
+
+# Exposição
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _header(lines: list, name: str, kind: str, help_text: str):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+def _histogram_lines(lines: list, name: str, histogram: Histogram, **labels):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=f'{bound:g}')} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+
+def _simple(lines: list, name: str, kind: str, help_text: str, value):
+    _header(lines, name, kind, help_text)
+    lines.append(f"{name} {value}")
+
+def render_metrics() -> str:
+    from auth.auth import password_executor, user_cache
+    from services.change_feed import change_feed
+    from services.http_cache import http_cache_stats
+    from services.read_replicas import replica_router
+
+    lines = []
+    with metrics._lock:
+        requests = dict(metrics.requests)
+        latency = {key: h for key, h in metrics.latency.items()}
+        statements = dict(metrics.request_statements)
+        db_seconds = dict(metrics.request_db_seconds)
+
+        _header(lines, "crm_http_requests_total", "counter", "Requisições HTTP por rota e status")
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(f"crm_http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+        _header(lines, "crm_http_request_duration_seconds", "histogram", "Latência das requisições por rota")
+        for (method, route), histogram in sorted(latency.items()):
+            _histogram_lines(lines, "crm_http_request_duration_seconds", histogram, method=method, route=route)
+        _header(lines, "crm_http_request_db_statements_total", "counter", "Comandos SQL executados pelas requisições, por rota")
+        for (method, route), count in sorted(statements.items()):
+            lines.append(f"crm_http_request_db_statements_total{_labels(method=method, route=route)} {count}")
+        _header(lines, "crm_http_request_db_seconds_total", "counter", "Tempo de SQL das requisições, por rota")
+        for (method, route), seconds in sorted(db_seconds.items()):
+            lines.append(f"crm_http_request_db_seconds_total{_labels(method=method, route=route)} {seconds:.6f}")
+        _simple(lines, "crm_http_requests_in_flight", "gauge", "Requisições em andamento", metrics.in_flight)
+
+        _header(lines, "crm_db_statement_duration_seconds", "histogram", "Duração de cada comando SQL")
+        _histogram_lines(lines, "crm_db_statement_duration_seconds", metrics.sql)
+        _header(lines, "crm_db_pool_wait_seconds", "histogram", "Espera por uma conexão do pool")
+        _histogram_lines(lines, "crm_db_pool_wait_seconds", metrics.pool_wait)
+
+    pools = metrics.pool_status()
+    _header(lines, "crm_db_pool_connections", "gauge", "Conexões do pool por estado")
+    for name, status in sorted(pools.items()):
+        for state, count in status.items():
+            lines.append(f"crm_db_pool_connections{_labels(engine=name, state=state)} {count}")
+
+    auth = user_cache.stats()
+    _simple(lines, "crm_auth_cache_hits_total", "counter", "Usuários resolvidos pelo cache de autenticação", auth["hits"])
+    _simple(lines, "crm_auth_cache_misses_total", "counter", "Usuários buscados no banco", auth["misses"])
+    _simple(lines, "crm_auth_cache_claims_hits_total", "counter", "Usuários resolvidos pelas claims do token", auth["claims_hits"])
+    _simple(lines, "crm_auth_cache_size", "gauge", "Usuários no cache de autenticação", auth["size"])
+
+    hashing = password_executor.stats()
+    _simple(lines, "crm_password_hash_workers", "gauge", "Threads do executor de bcrypt", hashing["workers"])
+    _simple(lines, "crm_password_hash_in_flight", "gauge", "Hashes de senha em execução", hashing["in_flight"])
+    _simple(lines, "crm_password_hash_queue_depth", "gauge", "Hashes de senha aguardando", hashing["queue_depth"])
+    _simple(lines, "crm_password_hash_completed_total", "counter", "Hashes de senha concluídos", hashing["completed"])
+    _simple(lines, "crm_password_hash_failed_total", "counter", "Hashes de senha que falharam ou foram cancelados", hashing["failed"])
+    _simple(lines, "crm_password_hash_rejected_total", "counter", "Hashes recusados com 503 (fila cheia)", hashing["rejected"])
+
+    cache = http_cache_stats()
+    _simple(lines, "crm_http_cache_requests_total", "counter", "GETs com ETag", cache["requests"])
+    _simple(lines, "crm_http_cache_not_modified_total", "counter", "Respostas 304", cache["not_modified"])
+    _simple(lines, "crm_http_cache_hits_total", "counter", "Respostas servidas pelo cache", cache["cache_hits"])
+    _simple(lines, "crm_http_cache_misses_total", "counter", "Consultas ao cache sem resposta guardada", cache["cache_misses"])
+    _simple(lines, "crm_http_cache_bypassed_total", "counter", "GETs autenticados pelo banco (sem atalho)", cache["bypassed"])
+
+    feed = change_feed.status()
+    _simple(lines, "crm_change_feed_subscribers", "gauge", "Conexões assinando o feed de alterações", feed["subscribers"])
+    _simple(lines, "crm_change_feed_delivered_total", "counter", "Eventos do feed entregues aos assinantes", feed["delivered"])
+    _simple(lines, "crm_change_feed_catchup_reads_total", "counter", "Leituras do feed no banco por assinantes atrás do buffer", feed["catchup_reads"])
+    _simple(lines, "crm_change_feed_resets_total", "counter", "Assinantes que perderam eventos (reset)", feed["resets"])
+    _simple(lines, "crm_change_feed_rejected_total", "counter", "Conexões recusadas com 503 (limite de assinantes)", feed["rejected"])
+
+    if replica_router.enabled:
+        replicas = replica_router.status()
+        _header(lines, "crm_db_replica_healthy", "gauge", "Réplica disponível para leituras (1) ou fora do rodízio (0)")
+        for replica in replicas["replicas"]:
+            lines.append(f"crm_db_replica_healthy{_labels(replica=replica['name'])} {int(replica['healthy'])}")
+        _header(lines, "crm_db_replica_lag_seconds", "gauge", "Atraso da réplica na última verificação")
+        for replica in replicas["replicas"]:
+            if replica["lag_seconds"] is not None:
+                lines.append(f"crm_db_replica_lag_seconds{_labels(replica=replica['name'])} {replica['lag_seconds']}")
+        _header(lines, "crm_db_reads_total", "counter", "GETs por banco de leitura (réplica ou primário e o motivo)")
+        for target, count in sorted(replicas["reads"].items()):
+            lines.append(f"crm_db_reads_total{_labels(target=target)} {count}")
+    return "\n".join(lines) + "\n"
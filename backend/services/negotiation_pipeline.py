@@ -0,0 +1,218 @@
+"""
+Histórico de status das negociações e agregados do funil.
+
+Cada criação ou mudança de status grava uma linha em
+NegotiationTransition e ajusta, na mesma transação, os agregados da
+imobiliária da negociação:
+
+- NegotiationStageStats: quantas negociações estão em cada status
+  (current), quantas já chegaram a ele (reached) e o tempo somado das
+  saídas (exits / total_seconds);
+- NegotiationStageDuration: histograma do tempo em cada status, para a
+  mediana.
+
+Chegar a uma etapa do funil conta como ter passado pelas anteriores
+(uma negociação criada já em "Proposta" conta em Novo, Em contato e
+Visita). "Perdido" e status fora do funil contam só a si mesmos.
+Ganhas e perdidas vêm do status atual (current de Fechado e Perdido),
+não de reached. O endpoint /negotiations/funnel lê apenas esses agregados.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, select
+from sqlmodel import Session
+
+from models.models import (
+    Negotiation, NegotiationStageDuration, NegotiationStageStats, NegotiationTransition,
+)
+from services.rollups import add_delta, histogram_percentile, increment_rows, log_bucket
+
+# Etapas do funil, na ordem
+FUNNEL_STAGES = ["Novo", "Em contato", "Visita", "Proposta", "Fechado"]
+LOST_STATUS = "Perdido"
+PIPELINE_STATUSES = FUNNEL_STAGES + [LOST_STATUS]
+
+# Faixas de 10% para o tempo em cada status
+DURATION_BUCKET_RATIO = 1.1
+
+_RANK = {stage: rank for rank, stage in enumerate(FUNNEL_STAGES)}
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    if isinstance(value, datetime) or value is None:
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def _reached_stages(previous: List[str], status: str) -> List[str]:
+    """Status que passam a contar como alcançados ao entrar em `status`."""
+    if status not in _RANK:
+        return [] if status in previous else [status]
+    best_previous = max((_RANK[s] for s in previous if s in _RANK), default=-1)
+    return FUNNEL_STAGES[best_previous + 1:_RANK[status] + 1]
+
+def _apply(session: Session, stats: Dict[tuple, dict], durations: Dict[tuple, dict]):
+    """
+    Soma os contadores, com chaves (imobiliária, status[, faixa]).
+
+    As linhas são travadas sempre na mesma ordem (tabela, depois chave):
+    duas transições simultâneas da mesma imobiliária esperam uma pela
+    outra em vez de entrar em deadlock.
+    """
+    connection = session.connection()
+    increment_rows(
+        connection, NegotiationStageStats.__table__, ["agency_id", "stage"],
+        [{"agency_id": key[0], "stage": key[1],
+          "current": 0, "reached": 0, "exits": 0, "total_seconds": 0.0, **counters}
+         for key, counters in sorted(stats.items())],
+    )
+    increment_rows(
+        connection, NegotiationStageDuration.__table__, ["agency_id", "stage", "bucket"],
+        [{"agency_id": key[0], "stage": key[1], "bucket": key[2], **counters}
+         for key, counters in sorted(durations.items())],
+    )
+
+def initial_transition(negotiation_id: int, status: str, created_at, agency_id: Optional[int] = None) -> NegotiationTransition:
+    """Transição de criação (sem status anterior), datada de created_at."""
+    return NegotiationTransition(
+        agency_id=agency_id, negotiation_id=negotiation_id, from_status=None, to_status=status,
+        changed_at=_parse_timestamp(created_at) or datetime.utcnow(),
+    )
+
+def record_created(session: Session, negotiation: Negotiation):
+    """Registra o status inicial de uma negociação recém-inserida (já com id)."""
+    agency_id = negotiation.agency_id
+    stats = {}
+    add_delta(stats, (agency_id, negotiation.status), current=1)
+    for stage in _reached_stages([], negotiation.status):
+        add_delta(stats, (agency_id, stage), reached=1)
+    _apply(session, stats, {})
+    session.add(initial_transition(negotiation.id, negotiation.status, negotiation.created_at, agency_id))
+
+def record_status_change(
+    session: Session,
+    negotiation_id: int,
+    agency_id: int,
+    created_at,
+    old_status: str,
+    new_status: str,
+    at: datetime,
+):
+    """
+    Registra a troca de old_status para new_status em `at`. Recebe os
+    valores (e não a negociação) para servir também ao PATCH, que só tem
+    a linha devolvida pelo UPDATE ... RETURNING.
+    """
+    history = session.execute(
+        select(NegotiationTransition.to_status, NegotiationTransition.changed_at)
+        .where(NegotiationTransition.negotiation_id == negotiation_id)
+        .order_by(NegotiationTransition.id)
+    ).all()
+    # Negociações anteriores ao histórico entraram no status atual na criação
+    entered_at = history[-1].changed_at if history else _parse_timestamp(created_at)
+    previous = [row.to_status for row in history] or [old_status]
+    seconds = max(0.0, (at - entered_at).total_seconds()) if entered_at else None
+
+    stats, durations = {}, {}
+    add_delta(stats, (agency_id, old_status), current=-1)
+    add_delta(stats, (agency_id, new_status), current=1)
+    for stage in _reached_stages(previous, new_status):
+        add_delta(stats, (agency_id, stage), reached=1)
+    if seconds is not None:
+        add_delta(stats, (agency_id, old_status), exits=1, total_seconds=seconds)
+        add_delta(durations, (agency_id, old_status, log_bucket(seconds, DURATION_BUCKET_RATIO)), exits=1)
+    _apply(session, stats, durations)
+    session.add(NegotiationTransition(
+        agency_id=agency_id, negotiation_id=negotiation_id, from_status=old_status, to_status=new_status,
+        changed_at=at, seconds_in_previous=seconds,
+    ))
+
+def record_deleted(session: Session, negotiation: Negotiation):
+    """Tira a negociação excluída da contagem do status atual (o histórico fica)."""
+    stats = {}
+    add_delta(stats, (negotiation.agency_id, negotiation.status), current=-1)
+    _apply(session, stats, {})
+
+def rebuild_pipeline_stats(session: Session):
+    """
+    Recalcula os agregados a partir do histórico, criando a transição
+    inicial das negociações que ainda não têm histórico. Numa sessão sem
+    imobiliária (scripts, migrações) recalcula todas; numa sessão de rota,
+    só a da sessão.
+    """
+    with_history = select(NegotiationTransition.negotiation_id).distinct()
+    for negotiation in session.execute(select(Negotiation).where(Negotiation.id.not_in(with_history))).scalars():
+        session.add(initial_transition(negotiation.id, negotiation.status, negotiation.created_at, negotiation.agency_id))
+    session.flush()
+
+    stats, durations = {}, {}
+    visited: Dict[int, List[str]] = {}
+    transitions = session.execute(
+        select(NegotiationTransition).order_by(NegotiationTransition.negotiation_id, NegotiationTransition.id)
+    ).scalars()
+    for transition in transitions:
+        agency_id = transition.agency_id
+        previous = visited.setdefault(transition.negotiation_id, [])
+        for stage in _reached_stages(previous, transition.to_status):
+            add_delta(stats, (agency_id, stage), reached=1)
+        if transition.from_status is not None and transition.seconds_in_previous is not None:
+            add_delta(stats, (agency_id, transition.from_status), exits=1, total_seconds=transition.seconds_in_previous)
+            bucket = log_bucket(transition.seconds_in_previous, DURATION_BUCKET_RATIO)
+            add_delta(durations, (agency_id, transition.from_status, bucket), exits=1)
+        previous.append(transition.to_status)
+    for agency_id, negotiation_status in session.execute(select(Negotiation.agency_id, Negotiation.status)):
+        add_delta(stats, (agency_id, negotiation_status), current=1)
+
+    # DELETE pelo modelo: o filtro da imobiliária da sessão também vale aqui
+    session.execute(delete(NegotiationStageStats))
+    session.execute(delete(NegotiationStageDuration))
+    _apply(session, stats, durations)
+
+def funnel_summary(session: Session) -> dict:
+    """
+    Contagens, conversão entre etapas e tempo em cada status, dos
+    agregados da imobiliária da sessão.
+    """
+    stats = {row.stage: row for row in session.execute(select(NegotiationStageStats)).scalars()}
+    histograms: Dict[str, list] = {}
+    duration_rows = session.execute(
+        select(NegotiationStageDuration.stage, NegotiationStageDuration.bucket, NegotiationStageDuration.exits)
+        .where(NegotiationStageDuration.exits > 0)
+        .order_by(NegotiationStageDuration.stage, NegotiationStageDuration.bucket)
+    )
+    for stage, bucket, exits in duration_rows:
+        histograms.setdefault(stage, []).append((bucket, exits))
+
+    stages = PIPELINE_STATUSES + sorted(s for s in stats if s not in PIPELINE_STATUSES)
+    result = []
+    for index, stage in enumerate(stages):
+        row = stats.get(stage)
+        reached = row.reached if row else 0
+        next_stage = FUNNEL_STAGES[index + 1] if index + 1 < len(FUNNEL_STAGES) else None
+        next_reached = stats[next_stage].reached if next_stage in stats else 0
+        histogram = histograms.get(stage)
+        result.append({
+            "stage": stage,
+            "current": row.current if row else 0,
+            "reached": reached,
+            "conversion_rate": round(next_reached / reached, 4) if next_stage and reached else None,
+            "exits": row.exits if row else 0,
+            "avg_hours": round(row.total_seconds / row.exits / 3600, 2) if row and row.exits else None,
+            "median_hours": (
+                round(histogram_percentile(histogram, 0.5, DURATION_BUCKET_RATIO) / 3600, 2) if histogram else None
+            ),
+        })
+
+    started = stats["Novo"].reached if "Novo" in stats else 0
+    # Resultado pelo status atual: Fechado -> Perdido conta só como perdida
+    won = stats["Fechado"].current if "Fechado" in stats else 0
+    lost = stats[LOST_STATUS].current if LOST_STATUS in stats else 0
+    return {
+        "stages": result,
+        "total": started,
+        "won": won,
+        "lost": lost,
+        "win_rate": round(won / started, 4) if started else None,
+    }
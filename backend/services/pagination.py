@@ -0,0 +1,190 @@
+"""
+Paginação por cursor (keyset) para os endpoints de listagem.
+
+O cursor é um token opaco (JSON em base64) com os valores da chave de
+ordenação do último item entregue. A página seguinte é lida com
+``WHERE (chave) > (cursor)``, que percorre o índice a partir do ponto certo
+e custa o mesmo na primeira ou na milésima página, ao contrário de OFFSET.
+"""
+import base64
+import binascii
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from threading import Lock
+from typing import Optional, Sequence
+
+from fastapi import HTTPException, Response
+from sqlalchemy import func, tuple_
+from sqlalchemy.exc import CompileError
+from sqlmodel import Session, select
+
+from services.tenancy import scoped
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_ESTIMATE_HEADER = "X-Total-Estimate"
+
+# Fora do PostgreSQL a estimativa é um COUNT, guardado por este tempo
+PAGINATION_COUNT_TTL_SECONDS = float(os.getenv("PAGINATION_COUNT_TTL_SECONDS", "30"))
+PAGINATION_COUNT_CACHE_SIZE = int(os.getenv("PAGINATION_COUNT_CACHE_SIZE", "1024"))
+
+def encode_cursor(values: Sequence) -> str:
+    """
+    Gera o token opaco a partir dos valores da chave de ordenação.
+    """
+    payload = [v.isoformat() if isinstance(v, (datetime, date)) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str, columns: Sequence) -> list:
+    """
+    Decodifica o token e converte cada valor para o tipo da coluna correspondente.
+
+    Valores de tipo diferente do da coluna (ex.: texto ou booleano no lugar
+    de um id inteiro) são rejeitados com 400, em vez de chegarem ao banco.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        decoded = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if python_type in (datetime, date):
+                if not isinstance(value, str):
+                    raise ValueError
+                value = python_type.fromisoformat(value)
+            elif isinstance(value, bool) and python_type is not bool:
+                # bool é subclasse de int no Python: true não é um id válido
+                raise ValueError
+            elif python_type is float:
+                if not isinstance(value, (int, float)):
+                    raise ValueError
+                value = float(value)
+            elif python_type in (int, str) and not isinstance(value, python_type):
+                raise ValueError
+            decoded.append(value)
+        return decoded
+    except (ValueError, TypeError, binascii.Error, json.JSONDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido")
+
+class CountCache:
+    """
+    Cache LRU com TTL dos COUNTs de estimate_total, indexado pelo SQL
+    compilado e pelos parâmetros (o filtro da imobiliária vai junto).
+    Thread-safe.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, total: int):
+        if self.max_size <= 0 or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, total)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+count_cache = CountCache(PAGINATION_COUNT_CACHE_SIZE, PAGINATION_COUNT_TTL_SECONDS)
+
+def _planner_estimate(session: Session, query) -> Optional[int]:
+    """
+    PostgreSQL: linhas estimadas pelo planner (EXPLAIN), sem percorrer a
+    tabela. None se algum parâmetro da consulta não pode ser escrito como
+    literal no SQL (o EXPLAIN não recebe parâmetros à parte).
+    """
+    # Compilada à mão, fora do session.execute: o filtro da imobiliária vai junto
+    try:
+        sql = str(scoped(session, query).compile(
+            dialect=session.get_bind().dialect, compile_kwargs={"literal_binds": True}
+        ))
+    except (CompileError, NotImplementedError):
+        return None
+    # Direto no driver: o SQL compilado já vem no formato dele (ex.: % escapado)
+    plan = session.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def estimate_total(session: Session, query) -> int:
+    """
+    Estima o total de linhas que a consulta filtrada retornaria.
+
+    No PostgreSQL usa a estimativa do planner (EXPLAIN), que não percorre a
+    tabela. Nos demais bancos, ou se a consulta não pode ir para o
+    EXPLAIN, faz um COUNT sobre a consulta filtrada, que percorre as
+    linhas: o resultado fica em count_cache por
+    PAGINATION_COUNT_TTL_SECONDS, então só a primeira página de cada
+    filtro nesse intervalo paga o COUNT (e a estimativa pode não incluir
+    as escritas desse intervalo, como a do planner).
+    """
+    bind = session.get_bind()
+    if bind.dialect.name == "postgresql":
+        total = _planner_estimate(session, query)
+        if total is not None:
+            return total
+    compiled = scoped(session, query).compile(bind)
+    key = (str(compiled), repr(sorted(compiled.params.items())))
+    total = count_cache.get(key)
+    if total is None:
+        total = session.exec(select(func.count()).select_from(query.subquery())).one()
+        count_cache.set(key, total)
+    return total
+
+def keyset_paginate(
+    session: Session,
+    query,
+    response: Response,
+    columns: Sequence,
+    limit: int,
+    after: Optional[str] = None,
+    descending: bool = False,
+) -> list:
+    """
+    Aplica paginação keyset a uma consulta já filtrada.
+
+    ``columns`` é a chave de ordenação e deve terminar em uma coluna única
+    (normalmente o ``id``) para o cursor ser estável. O token da próxima
+    página vai no cabeçalho ``X-Next-Cursor``; na primeira página (sem
+    ``after``) o cabeçalho ``X-Total-Estimate`` traz o total estimado.
+    """
+    if after:
+        values = decode_cursor(after, columns)
+        if len(columns) == 1:
+            key, value = columns[0], values[0]
+        else:
+            key, value = tuple_(*columns), tuple_(*values)
+        query = query.where(key < value if descending else key > value)
+    else:
+        response.headers[TOTAL_ESTIMATE_HEADER] = str(estimate_total(session, query))
+
+    order = [c.desc() for c in columns] if descending else [c.asc() for c in columns]
+    rows = session.exec(query.order_by(*order).limit(limit + 1)).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(last, c.key) for c in columns])
+    return rows
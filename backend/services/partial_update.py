@@ -0,0 +1,85 @@
+"""
+Atualização parcial (PATCH) com concorrência otimista pela coluna version.
+
+A escrita é um único ``UPDATE ... WHERE id = :id [AND version = :version]
+RETURNING``, que incrementa version e devolve a linha atualizada: o
+objeto não é carregado antes nem recarregado depois. Quando o UPDATE não
+afeta nenhuma linha, uma consulta (só nesse caminho) diferencia 404 de 409.
+
+O UPDATE não passa pelo ORM, então nem o filtro da imobiliária nem os
+eventos de mapper se aplicam: a condição ``agency_id`` é incluída aqui
+(services/tenancy.py) e quem chama mantém as estruturas derivadas da
+tabela (o ETag é versionado e o evento do feed de alterações é publicado
+aqui). Se elas precisam dos valores anteriores, `old_columns` lista as colunas a ler antes; o UPDATE passa então a exigir a versão lida, e uma
+escrita concorrente entre as duas etapas resulta em 409.
+"""
+from typing import Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlmodel import Session
+
+from services.change_feed import change_event, publish_session_events
+from services.http_cache import bump_versions
+from services.tenancy import session_user, tenant_criteria
+
+def _conflict(current_version: int):
+    return HTTPException(
+        status_code=409,
+        detail=f"Registro alterado por outra requisição (versão atual: {current_version})",
+    )
+
+def patch_row(
+    session: Session,
+    model,
+    row_id: int,
+    changes: dict,
+    expected_version: Optional[int] = None,
+    old_columns: Sequence[str] = (),
+    not_found: str = "Not found",
+) -> Tuple[Optional[dict], dict]:
+    """
+    Aplica `changes` à linha `row_id` de `model` e retorna (antes, depois).
+
+    `antes` traz version e `old_columns` quando alguma delas está em
+    `changes` (senão None); `depois` é a linha completa retornada pelo
+    UPDATE. Sem alterações, apenas confere a versão e devolve a linha.
+    """
+    table = model.__table__
+    row_filter = [table.c.id == row_id, *tenant_criteria(session, table)]
+    old = None
+    guard_version = expected_version
+
+    if not changes or set(old_columns) & changes.keys():
+        columns = [table.c.version, *(table.c[name] for name in old_columns)] if changes else list(table.c)
+        row = session.execute(select(*columns).where(*row_filter)).mappings().first()
+        if row is None:
+            raise HTTPException(status_code=404, detail=not_found)
+        if expected_version is not None and row["version"] != expected_version:
+            raise _conflict(row["version"])
+        if not changes:
+            return None, dict(row)
+        old = dict(row)
+        guard_version = old["version"]
+
+    statement = (
+        update(table)
+        .where(*row_filter)
+        .values(**changes, version=table.c.version + 1)
+        .returning(*table.c)
+    )
+    if guard_version is not None:
+        statement = statement.where(table.c.version == guard_version)
+    new = session.execute(statement).mappings().first()
+    if new is None:
+        current_version = session.execute(select(table.c.version).where(*row_filter)).scalar()
+        if current_version is None:
+            raise HTTPException(status_code=404, detail=not_found)
+        raise _conflict(current_version)
+
+    bump_versions(session.connection(), new["agency_id"], [table.name])
+    new = dict(new)
+    publish_session_events(session, new["agency_id"], [
+        change_event(table.name, "updated", row_id, new, session_user(session)),
+    ])
+    return old, new
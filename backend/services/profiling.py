@@ -0,0 +1,402 @@
+"""
+Perfil de requisições sob demanda: comandos SQL, planos e pilha Python.
+
+Uma requisição é perfilada quando:
+- traz o cabeçalho X-Profile (1/sql ou stack) e o usuário do token está
+  em ADMIN_USERNAMES (conferido no fim; de outros usuários é descartada);
+- cai na amostragem PROFILING_SAMPLE_RATE;
+- PROFILING_SLOW_REQUEST_MS > 0 e ela passa do limite (os comandos são
+  anotados em todas as requisições e só as lentas ficam).
+
+Cada comando SQL é guardado com parâmetros e duração; os que passam de
+PROFILING_EXPLAIN_MS ganham o plano (EXPLAIN na mesma conexão e
+transação, logo depois da execução). Comandos repetidos com o mesmo texto
+são agrupados em `repeated`, o sinal de consultas por item (N+1).
+
+Com X-Profile: stack (ou PROFILING_STACK_SAMPLING nas amostradas), uma
+thread amostra a pilha Python a cada PROFILING_STACK_INTERVAL_MS, no
+estilo do pyinstrument. Só entram as threads que executaram SQL da
+requisição e o event loop, sem as amostras ociosas.
+
+Os perfis ficam num buffer circular em memória, por processo, servido em
+/admin/profiles.
+"""
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+
+from starlette.datastructures import Headers
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_SLOW_REQUEST_MS = float(os.getenv("PROFILING_SLOW_REQUEST_MS", "0"))
+PROFILING_EXPLAIN_MS = float(os.getenv("PROFILING_EXPLAIN_MS", "20"))
+PROFILING_BUFFER_SIZE = int(os.getenv("PROFILING_BUFFER_SIZE", "100"))
+PROFILING_MAX_STATEMENTS = int(os.getenv("PROFILING_MAX_STATEMENTS", "500"))
+PROFILING_STACK_SAMPLING = os.getenv("PROFILING_STACK_SAMPLING", "false").lower() in ("1", "true", "yes", "on")
+PROFILING_STACK_INTERVAL_MS = float(os.getenv("PROFILING_STACK_INTERVAL_MS", "5"))
+
+# Comandos com o mesmo texto a partir desta contagem aparecem em `repeated`
+REPEATED_STATEMENT_MIN = 3
+MAX_PARAMS_CHARS = 300
+MAX_STACK_DEPTH = 64
+# Parâmetros de comandos na tabela de usuários (hash de senha) não são guardados
+_REDACTED_TABLES = re.compile(r'\b"?user"?\b', re.IGNORECASE)
+_EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE")
+# Listas de IN com tamanhos diferentes contam como o mesmo comando
+_PLACEHOLDER_LIST = re.compile(r"(\?|%s|\$\d+|%\(\w+\)s)(\s*,\s*(\?|%s|\$\d+|%\(\w+\)s))+")
+
+class RequestProfile:
+    """Comandos SQL e amostras de pilha de uma requisição."""
+
+    def __init__(self, profile_id: int, method: str, path: str, query_string: str, reason: str, stack: bool):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.reason = reason
+        self.stack = stack
+        self.started_at = datetime.utcnow()
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.duration_ms = 0.0
+        self.statements: List[dict] = []
+        self.dropped_statements = 0
+        # Threads em que a requisição rodou código (event loop e as que executaram SQL)
+        self.threads = {threading.get_ident()}
+        self.samples: Counter = Counter()
+
+    def add_statement(self, entry: dict):
+        self.threads.add(threading.get_ident())
+        if len(self.statements) >= PROFILING_MAX_STATEMENTS:
+            self.dropped_statements += 1
+        else:
+            self.statements.append(entry)
+
+    def db_ms(self) -> float:
+        return sum(s["duration_ms"] for s in self.statements)
+
+    def repeated(self) -> List[dict]:
+        groups = {}
+        for statement in self.statements:
+            key = _PLACEHOLDER_LIST.sub("?...", " ".join(statement["sql"].split()))
+            group = groups.setdefault(key, {"sql": key, "count": 0, "total_ms": 0.0})
+            group["count"] += 1
+            group["total_ms"] += statement["duration_ms"]
+        repeated = [g for g in groups.values() if g["count"] >= REPEATED_STATEMENT_MIN]
+        for group in repeated:
+            group["total_ms"] = round(group["total_ms"], 3)
+        return sorted(repeated, key=lambda g: g["count"], reverse=True)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "started_at": self.started_at.isoformat(),
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "reason": self.reason,
+            "duration_ms": round(self.duration_ms, 3),
+            "db_ms": round(self.db_ms(), 3),
+            "statements": len(self.statements) + self.dropped_statements,
+            "repeated_statements": sum(g["count"] for g in self.repeated()),
+            "has_stack": self.stack,
+        }
+
+    def detail(self) -> dict:
+        return {
+            **self.summary(),
+            "query_string": self.query_string,
+            "dropped_statements": self.dropped_statements,
+            "repeated": self.repeated(),
+            "sql": self.statements,
+            "stack": _stack_report(self.samples) if self.stack else None,
+        }
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("crm_request_profile", default=None)
+
+class ProfileBuffer:
+    """Últimos perfis, num deque de tamanho fixo. Thread-safe."""
+
+    def __init__(self, size: int):
+        self._profiles = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[RequestProfile]:
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+profile_buffer = ProfileBuffer(PROFILING_BUFFER_SIZE)
+
+# SQL
+
+def _format_params(statement: str, parameters) -> Optional[str]:
+    if not parameters:
+        return None
+    if _REDACTED_TABLES.search(statement):
+        return "[omitido]"
+    text = repr(parameters)
+    return text if len(text) <= MAX_PARAMS_CHARS else text[:MAX_PARAMS_CHARS] + "..."
+
+def _explain(conn, statement: str, parameters) -> List[str]:
+    """Plano do comando, na conexão (e transação) em que ele acabou de rodar."""
+    dialect = conn.dialect.name
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    # Um EXPLAIN com erro no PostgreSQL abortaria a transação da requisição
+    savepoint = dialect == "postgresql"
+    cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT crm_profile_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception as exc:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT crm_profile_explain")
+            return [f"EXPLAIN falhou: {exc}"]
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT crm_profile_explain")
+    finally:
+        cursor.close()
+    if dialect == "sqlite":
+        return [row[3] for row in rows]
+    return [str(row[0]) if len(row) == 1 else " | ".join(str(value) for value in row) for row in rows]
+
+def profile_engine(engine, name: str):
+    """Anota os comandos SQL do engine no perfil da requisição atual, quando houver."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_statement(conn, cursor, statement, parameters, context, executemany):
+        if _current_profile.get() is not None:
+            conn.info.setdefault("profile_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end_statement(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        starts = conn.info.get("profile_start_time")
+        if profile is None or not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        entry = {
+            "sql": statement,
+            "params": _format_params(statement, parameters),
+            "duration_ms": round(elapsed_ms, 3),
+            "engine": name,
+        }
+        if executemany:
+            entry["executemany"] = len(parameters)
+        elif elapsed_ms >= PROFILING_EXPLAIN_MS and statement.lstrip().upper().startswith(_EXPLAINABLE):
+            entry["plan"] = _explain(conn, statement, parameters)
+        profile.add_statement(entry)
+
+    @event.listens_for(engine, "handle_error")
+    def _failed_statement(context):
+        profile = _current_profile.get()
+        starts = context.connection.info.get("profile_start_time") if context.connection is not None else None
+        if profile is None or not starts:
+            return
+        profile.add_statement({
+            "sql": context.statement or "",
+            "params": _format_params(context.statement or "", context.parameters),
+            "duration_ms": round((time.perf_counter() - starts.pop()) * 1000, 3),
+            "engine": name,
+            "error": str(context.original_exception),
+        })
+
+# Pilha Python
+
+# Folhas de threads paradas (event loop no select, workers esperando trabalho)
+_IDLE_LEAVES = {("select", "selectors.py"), ("wait", "threading.py"), ("_worker", "thread.py")}
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _capture_stack(frame) -> Optional[tuple]:
+    code = frame.f_code
+    if (code.co_name, os.path.basename(code.co_filename)) in _IDLE_LEAVES:
+        return None
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+class StackSampler:
+    """
+    Amostrador de pilha compartilhado pelas requisições com perfil de pilha.
+
+    A thread só roda enquanto há alguma requisição ligada; cada amostra vai
+    para o perfil de todas elas, separada por thread.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._active = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def attach(self, profile: RequestProfile):
+        with self._lock:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="crm-stack-sampler", daemon=True)
+                self._thread.start()
+
+    def detach(self, profile: RequestProfile):
+        with self._lock:
+            self._active.discard(profile)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active)
+            stacks = {}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    stacks[thread_id] = _capture_stack(frame)
+            # Sob o lock: depois de detach o perfil não recebe mais amostras
+            with self._lock:
+                for profile in self._active.intersection(active):
+                    for thread_id, stack in stacks.items():
+                        if stack is not None:
+                            profile.samples[(thread_id, stack)] += 1
+            time.sleep(self.interval_seconds)
+
+sampler = StackSampler(PROFILING_STACK_INTERVAL_MS / 1000)
+
+def _stack_report(samples: Counter, top: int = 30) -> dict:
+    """Pilhas agregadas (formato folded dos flame graphs) e tempo por função."""
+    folded = Counter()
+    self_samples, total_samples = Counter(), Counter()
+    for (_, stack), count in samples.items():
+        folded[";".join(stack)] += count
+        self_samples[stack[-1]] += count
+        for label in set(stack):
+            total_samples[label] += count
+    return {
+        "interval_ms": PROFILING_STACK_INTERVAL_MS,
+        "samples": sum(samples.values()),
+        "stacks": [{"stack": stack, "samples": count} for stack, count in folded.most_common(top)],
+        "functions": [
+            {"function": label, "self": self_samples[label], "total": count}
+            for label, count in total_samples.most_common(top)
+        ],
+    }
+
+def _filter_samples(profile: RequestProfile):
+    profile.samples = Counter({key: count for key, count in profile.samples.items() if key[0] in profile.threads})
+
+# Middleware
+
+def _token_user(headers: Headers):
+    """(resolvido, usuário) do token, sem consultar o banco."""
+    from auth.auth import resolve_user_without_db
+
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return True, None
+    user = resolve_user_without_db(token)
+    return user is not None, user
+
+def _is_admin_request(headers: Headers) -> bool:
+    from auth.auth import is_admin
+
+    return is_admin(_token_user(headers)[1])
+
+class ProfilingMiddleware:
+    """Middleware ASGI que decide quais requisições perfilar (ver o docstring do módulo)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        requested = headers.get(PROFILE_HEADER, "").strip().lower()
+        if requested in ("", "0", "false", "off"):
+            requested = None
+        elif requested:
+            # Usuário já conhecido e sem permissão: nem começa o perfil
+            from auth.auth import is_admin
+
+            resolved, user = _token_user(headers)
+            if resolved and not is_admin(user):
+                requested = None
+        sampled = PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+        if not (requested or sampled or PROFILING_SLOW_REQUEST_MS > 0):
+            await self.app(scope, receive, send)
+            return
+
+        stack = requested == "stack" or (sampled and not requested and PROFILING_STACK_SAMPLING)
+        reason = "header" if requested else "sample" if sampled else "slow"
+        profile = RequestProfile(profile_buffer.next_id(), scope["method"], scope["path"], scope["query_string"].decode("latin-1"), reason, stack)
+        token = _current_profile.set(profile)
+        if stack:
+            sampler.attach(profile)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                if requested:
+                    profile_id = (PROFILE_ID_HEADER.lower().encode(), str(profile.id).encode())
+                    message = {**message, "headers": [*message["headers"], profile_id]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            if stack:
+                sampler.detach(profile)
+            _current_profile.reset(token)
+
+        if requested:
+            # A rota já autenticou, então o usuário costuma estar no cache
+            keep = _is_admin_request(headers)
+        else:
+            keep = sampled or profile.duration_ms >= PROFILING_SLOW_REQUEST_MS
+        if keep:
+            from services.metrics import route_name
+
+            profile.route = route_name(scope)
+            _filter_samples(profile)
+            profile_buffer.add(profile)
@@ -0,0 +1,261 @@
+"""
+Estatísticas de valores dos imóveis servidas por uma tabela de rollup.
+
+A tabela PropertyValueRollup guarda, por imobiliária, um histograma dos
+valores para cada localização, cada tipo e cada status (e um geral,
+dimensão "all"), em
+faixas logarítmicas de largura BUCKET_RATIO (5%): quantidade de imóveis,
+soma dos valores e menor e maior valor por faixa.
+
+- Escritas pelo ORM (criar, editar, excluir imóvel) ajustam as faixas
+  afetadas na mesma transação, com UPSERT de incremento/decremento (e
+  MIN/MAX para os extremos); o PATCH, que não usa o ORM, chama
+  record_updated_property.
+- Remover da faixa o seu menor ou maior valor recalcula os extremos
+  daquela faixa a partir da tabela property (busca por faixa de valor no
+  índice (agency_id, value)).
+- A importação em lote chama record_inserted_properties para cada bloco.
+- rebuild_property_rollup recalcula tudo a partir da tabela property
+  (migração e bancos já existentes).
+
+As consultas leem só o rollup, pela chave primária: o custo depende do
+número de grupos e faixas, não do número de imóveis. Contagem, soma,
+média, mínimo e máximo são exatos; os percentis são aproximados dentro
+da faixa (limitados ao mínimo e ao máximo) e a resposta os marca com
+percentiles_approximate.
+"""
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import and_, bindparam, delete, event, func, inspect as sa_inspect, or_, select, update
+from sqlmodel import Session
+
+from models.models import Property, PropertyValueRollup
+from services.rollups import add_delta, histogram_percentile, increment_rows, log_bucket, log_bucket_bounds
+
+BUCKET_RATIO = 1.05
+GROUP_BY_OPTIONS = ["location", "type", "status"]
+PERCENTILES = {"p25": 0.25, "median": 0.5, "p75": 0.75, "p90": 0.9}
+
+# Colunas do imóvel que o rollup acompanha
+ROLLUP_COLUMNS = ("agency_id", "location", "type", "status", "value")
+
+# Dimensão do resumo geral
+ALL_DIMENSION = "all"
+
+_KEY_COLUMNS = ["agency_id", "dimension", "group_value", "bucket"]
+
+def _merge_extremes(entry: dict, low: str, high: str, value: float):
+    if entry.get(low) is None or value < entry[low]:
+        entry[low] = value
+    if entry.get(high) is None or value > entry[high]:
+        entry[high] = value
+
+def _add(deltas: Dict[tuple, dict], sign: int, agency_id, location, type, status, value):
+    """
+    Acumula o imóvel (sign=1) ou a sua remoção (sign=-1) em todas as
+    dimensões. Inclusões guardam o menor/maior valor incluído na faixa;
+    remoções, o menor/maior removido (para saber se os extremos mudaram).
+    """
+    bucket = log_bucket(value, BUCKET_RATIO)
+    groups = (("location", location), ("type", type), ("status", status), (ALL_DIMENSION, ""))
+    for dimension, group_value in groups:
+        key = (agency_id, dimension, group_value or "", bucket)
+        add_delta(deltas, key, listings=sign, total_value=sign * (value or 0.0))
+        if sign > 0:
+            _merge_extremes(deltas[key], "min_value", "max_value", value or 0.0)
+        else:
+            _merge_extremes(deltas[key], "removed_min", "removed_max", value or 0.0)
+
+def _bucket_range(bucket: int) -> Tuple[float, float]:
+    """
+    Intervalo de valores da faixa para a busca na tabela property, com
+    folga para o arredondamento do log nas bordas (a faixa 0 inclui os
+    valores até 1).
+    """
+    low, high = log_bucket_bounds(bucket, BUCKET_RATIO)
+    return (low * (1 - 1e-9) if bucket > 0 else float("-inf")), high * (1 + 1e-9)
+
+def _recompute_extremes(connection, keys: List[tuple]):
+    """Relê da tabela property o menor e o maior valor das faixas informadas."""
+    property_table = Property.__table__
+    rollup = PropertyValueRollup.__table__
+    dimension, group_value = bindparam("key_dimension"), bindparam("key_group_value")
+    in_bucket = and_(
+        property_table.c.agency_id == bindparam("key_agency_id"),
+        property_table.c.value >= bindparam("low"),
+        property_table.c.value < bindparam("high"),
+        or_(
+            dimension == ALL_DIMENSION,
+            *(
+                and_(dimension == name, func.coalesce(property_table.c[name], "") == group_value)
+                for name in GROUP_BY_OPTIONS
+            ),
+        ),
+    )
+    statement = (
+        update(rollup)
+        .where(
+            rollup.c.agency_id == bindparam("key_agency_id"),
+            rollup.c.dimension == dimension,
+            rollup.c.group_value == group_value,
+            rollup.c.bucket == bindparam("key_bucket"),
+        )
+        .values(
+            min_value=select(func.min(property_table.c.value)).where(in_bucket).scalar_subquery(),
+            max_value=select(func.max(property_table.c.value)).where(in_bucket).scalar_subquery(),
+        )
+    )
+    params = []
+    for agency_id, dimension_name, group, bucket in keys:
+        low, high = _bucket_range(bucket)
+        params.append({
+            "key_agency_id": agency_id, "key_dimension": dimension_name, "key_group_value": group,
+            "key_bucket": bucket, "low": low, "high": high,
+        })
+    connection.execute(statement, params)
+
+def _apply_deltas(connection, deltas: Dict[tuple, dict]):
+    """
+    Soma (quantidade, valor) às faixas e atualiza mínimo/máximo com
+    UPSERT, na conexão/transação informada. Faixas que perderam o seu
+    menor ou maior valor têm os extremos recalculados em seguida.
+
+    As faixas são travadas sempre na ordem da chave: duas transações que
+    mexem nas mesmas faixas (uma edição movendo o imóvel entre faixas,
+    uma importação em lote) esperam uma pela outra em vez de entrar em
+    deadlock.
+    """
+    rows, removed = [], {}
+    for key, entry in sorted(deltas.items()):
+        if entry.get("removed_min") is not None:
+            removed[key] = (entry["removed_min"], entry["removed_max"])
+        if entry["listings"] or entry["total_value"] or key in removed or entry.get("min_value") is not None:
+            rows.append(dict(
+                zip(_KEY_COLUMNS, key),
+                listings=entry["listings"], total_value=entry["total_value"],
+                min_value=entry.get("min_value"), max_value=entry.get("max_value"),
+            ))
+    result = increment_rows(
+        connection, PropertyValueRollup.__table__, _KEY_COLUMNS, rows,
+        returning=_KEY_COLUMNS + ["min_value", "max_value"] if removed else (),
+        minimum=["min_value"], maximum=["max_value"],
+    )
+    if not removed:
+        return
+    stale = []
+    for row in result:
+        key = tuple(row[:4])
+        if key not in removed:
+            continue
+        removed_min, removed_max = removed[key]
+        if row.min_value is None or removed_min <= row.min_value or removed_max >= row.max_value:
+            stale.append(key)
+    if stale:
+        _recompute_extremes(connection, sorted(stale))
+
+@event.listens_for(Property, "after_insert")
+def _rollup_insert(mapper, connection, target):
+    deltas = {}
+    _add(deltas, 1, target.agency_id, target.location, target.type, target.status, target.value)
+    _apply_deltas(connection, deltas)
+
+@event.listens_for(Property, "after_delete")
+def _rollup_delete(mapper, connection, target):
+    deltas = {}
+    _add(deltas, -1, target.agency_id, target.location, target.type, target.status, target.value)
+    _apply_deltas(connection, deltas)
+
+@event.listens_for(Property, "after_update")
+def _rollup_update(mapper, connection, target):
+    state = sa_inspect(target)
+    old = {}
+    for name in ROLLUP_COLUMNS:
+        history = state.attrs[name].history
+        old[name] = history.deleted[0] if history.deleted else getattr(target, name)
+    record_updated_property(connection, old, {name: getattr(target, name) for name in old})
+
+def record_updated_property(connection, old: dict, new: dict):
+    """
+    Move o imóvel das faixas antigas para as novas. `old`/`new` trazem
+    agency_id, location, type, status e value (chaves extras são
+    ignoradas); usado também pelo PATCH, que atualiza sem o ORM.
+    """
+    old = {name: old[name] for name in ROLLUP_COLUMNS}
+    new = {name: new[name] for name in ROLLUP_COLUMNS}
+    if old == new:
+        return
+    deltas = {}
+    _add(deltas, -1, **old)
+    _add(deltas, 1, **new)
+    _apply_deltas(connection, deltas)
+
+def record_inserted_properties(session: Session, rows: Iterable[dict]):
+    """Inclui no rollup imóveis inseridos sem o ORM (importação em lote)."""
+    deltas = {}
+    for row in rows:
+        _add(deltas, 1, row["agency_id"], row["location"], row["type"], row["status"], row["value"])
+    _apply_deltas(session.connection(), deltas)
+
+def rebuild_property_rollup(engine, batch_size: int = 10000):
+    """Recalcula o rollup inteiro (todas as imobiliárias) a partir da tabela property."""
+    deltas = {}
+    columns = select(Property.agency_id, Property.location, Property.type, Property.status, Property.value)
+    with engine.begin() as connection:
+        result = connection.execution_options(yield_per=batch_size).execute(columns)
+        for batch in result.partitions():
+            for row in batch:
+                _add(deltas, 1, *row)
+        connection.execute(delete(PropertyValueRollup.__table__))
+        _apply_deltas(connection, deltas)
+
+def _summarize(buckets: List[Tuple[int, int]], total_value: float, min_value: float, max_value: float) -> dict:
+    listings = sum(count for _, count in buckets)
+    stats = {
+        "count": listings,
+        "avg_value": round(total_value / listings, 2),
+        "min_value": round(min_value, 2),
+        "max_value": round(max_value, 2),
+        "percentiles_approximate": True,
+    }
+    for name, fraction in PERCENTILES.items():
+        # Interpolado na faixa: sem o limite poderia sair do intervalo real dos valores
+        value = histogram_percentile(buckets, fraction, BUCKET_RATIO)
+        stats[name] = round(min(max(value, min_value), max_value), 2)
+    return stats
+
+def _read_histograms(session: Session, dimension: str) -> Dict[str, tuple]:
+    """{grupo: (faixas [(faixa, quantidade)], soma dos valores, mínimo, máximo)}"""
+    rollup = PropertyValueRollup
+    query = (
+        select(rollup.group_value, rollup.bucket, rollup.listings, rollup.total_value, rollup.min_value, rollup.max_value)
+        .where(rollup.dimension == dimension, rollup.listings > 0)
+        .order_by(rollup.group_value, rollup.bucket)
+    )
+    histograms = {}
+    for group_value, bucket, listings, total_value, low, high in session.execute(query):
+        # Faixa sem extremos gravados: usa as bordas da faixa
+        edges = log_bucket_bounds(bucket, BUCKET_RATIO)
+        low = edges[0] if low is None else low
+        high = edges[1] if high is None else high
+        if group_value not in histograms:
+            histograms[group_value] = ([], 0.0, low, high)
+        buckets, total, group_low, group_high = histograms[group_value]
+        buckets.append((bucket, listings))
+        histograms[group_value] = (buckets, total + total_value, min(group_low, low), max(group_high, high))
+    return histograms
+
+def property_value_analytics(session: Session, group_by: str) -> dict:
+    """
+    Quantidade, média, mínimo, máximo e percentis (aproximados) dos
+    valores por localização, tipo ou status, mais o resumo geral, lidos
+    do rollup.
+    """
+    overall = _read_histograms(session, ALL_DIMENSION).get("")
+    return {
+        "group_by": group_by,
+        "total": _summarize(*overall) if overall else None,
+        "groups": [
+            {"group": group_value, **_summarize(*histogram)}
+            for group_value, histogram in _read_histograms(session, group_by).items()
+        ],
+    }
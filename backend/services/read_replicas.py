@@ -0,0 +1,268 @@
+"""
+Leituras em réplicas do banco (DATABASE_REPLICA_URLS).
+
+GETs vão para uma réplica disponível (em rodízio quando há mais de uma);
+os demais métodos, para o primário. ReplicaRoutingMiddleware escolhe o
+banco no início da requisição e o guarda num ContextVar, lido por
+get_session/get_async_session, pelas versões dos ETags e pela exportação
+(read_engine), então a requisição inteira lê do mesmo banco e o ETag
+corresponde ao que a réplica devolveu.
+
+Saúde e atraso: uma thread verifica as réplicas a cada
+DB_REPLICA_CHECK_INTERVAL_SECONDS. Cada verificação grava o horário em
+replicaheartbeat no primário e lê essa linha em cada réplica; o atraso é
+o tempo desde o heartbeat que a réplica enxerga (zero se ela já recebeu
+o que acabou de ser gravado). Vale para qualquer replicação que copie a
+tabela: streaming ou lógica no PostgreSQL, ou cópias de um arquivo
+SQLite (sqlite3 .backup, Litestream). Uma réplica sai do rodízio quando:
+- a verificação falha ou uma conexão com ela cai;
+- o atraso passa de DB_REPLICA_MAX_LAG_SECONDS;
+- a última verificação ficou antiga (verificação travada).
+Sem réplica disponível, as leituras vão para o primário.
+
+Leitura das próprias escritas: depois de um POST/PUT/PATCH/DELETE, os
+GETs do mesmo usuário vão para o primário por DB_READ_YOUR_WRITES_SECONDS
+(padrão: o atraso máximo). Cadastro e login não têm token, então as rotas
+registram o usuário (record_write) assim que têm o id: sem isso, os
+primeiros GETs depois do cadastro buscariam o usuário numa réplica que
+ainda não o recebeu e responderiam 401. O registro é por processo; com vários workers
+a garantia depende de o balanceador manter o usuário no mesmo worker.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.datastructures import Headers
+
+from auth.auth import token_user_id
+from models.database import create_async_db_engine, create_db_engine, engine, get_async_engine
+from models.models import ReplicaHeartbeat
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+DB_REPLICA_CHECK_INTERVAL_SECONDS = float(os.getenv("DB_REPLICA_CHECK_INTERVAL_SECONDS", "1"))
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", str(DB_REPLICA_MAX_LAG_SECONDS)))
+
+READ_METHODS = {"GET", "HEAD"}
+HEARTBEAT_ID = 1
+# Acima disto, o registro de escritas recentes descarta as expiradas
+_RECENT_WRITES_PRUNE_SIZE = 10000
+
+logger = logging.getLogger("crm.replicas")
+
+class Replica:
+    """Uma réplica: engines (síncrono e, sob demanda, assíncrono) e o resultado da última verificação."""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self._url = url
+        self.engine = create_db_engine(url, name=name)
+        self._async_engine = None
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.checked_at: Optional[float] = None  # time.monotonic()
+        self.error: Optional[str] = None
+        event.listen(self.engine, "handle_error", self._on_error)
+
+    @property
+    def async_engine(self):
+        if self._async_engine is None:
+            self._async_engine = create_async_db_engine(self._url, name=f"{self.name}-async")
+            event.listen(self._async_engine.sync_engine, "handle_error", self._on_error)
+        return self._async_engine
+
+    def _on_error(self, context):
+        # Conexão perdida no meio de uma consulta: sai do rodízio até a próxima verificação
+        if context.is_disconnect:
+            self.mark_down("conexão perdida")
+
+    def mark_down(self, error: str):
+        self.healthy = False
+        self.lag_seconds = None
+        self.error = error
+        self.checked_at = time.monotonic()
+
+    def record_check(self, lag_seconds: float, max_lag: float):
+        self.lag_seconds = lag_seconds
+        self.healthy = lag_seconds <= max_lag
+        self.error = None if self.healthy else f"atraso de {lag_seconds:.1f}s"
+        self.checked_at = time.monotonic()
+
+    def available(self, stale_after: float) -> bool:
+        return self.healthy and self.checked_at is not None and time.monotonic() - self.checked_at <= stale_after
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "url": make_url(self._url).render_as_string(hide_password=True),
+            "healthy": self.healthy,
+            "lag_seconds": round(self.lag_seconds, 3) if self.lag_seconds is not None else None,
+            "checked_seconds_ago": round(time.monotonic() - self.checked_at, 3) if self.checked_at else None,
+            "error": self.error,
+        }
+
+class ReplicaRouter:
+    """Escolhe o banco das leituras e mantém a saúde das réplicas (ver o docstring do módulo)."""
+
+    def __init__(self, primary, urls: List[str], max_lag: float, check_interval: float, read_your_writes_seconds: float):
+        self.primary = primary
+        self.replicas = [Replica(f"replica{i}", url) for i, url in enumerate(urls, 1)]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.read_your_writes_seconds = read_your_writes_seconds
+        # Verificação mais antiga que isto é tratada como travada
+        self.stale_after = 3 * check_interval + max_lag
+        self._cycle = itertools.count()
+        self._lock = Lock()
+        self._thread = None
+        self._recent_writes: Dict[int, float] = {}
+        # Contadores (atualizados só no event loop)
+        self.stats = {"replica": 0, "primary_fallback": 0, "primary_read_your_writes": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def start(self):
+        """Inicia a thread de verificação (uma vez, no primeiro uso)."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="crm-replica-check", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self.check()
+            time.sleep(self.check_interval)
+
+    def check(self):
+        """Grava o heartbeat no primário e mede o atraso de cada réplica."""
+        now = datetime.utcnow()
+        table = ReplicaHeartbeat.__table__
+        try:
+            with self.primary.begin() as connection:
+                updated = connection.execute(update(table).where(table.c.id == HEARTBEAT_ID).values(beat_at=now))
+                if updated.rowcount == 0:
+                    connection.execute(insert(table).values(id=HEARTBEAT_ID, beat_at=now))
+        except SQLAlchemyError as e:
+            logger.warning("Heartbeat das réplicas não gravado no primário: %s", e)
+
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as connection:
+                    beat_at = connection.execute(select(table.c.beat_at).where(table.c.id == HEARTBEAT_ID)).scalar()
+            except SQLAlchemyError as e:
+                replica.mark_down(str(e).splitlines()[0])
+                continue
+            if beat_at is None:
+                replica.mark_down("sem heartbeat")
+                continue
+            # Heartbeat de outro worker pode ser mais novo que `now`
+            replica.record_check(max(0.0, (now - beat_at).total_seconds()), self.max_lag)
+
+    def route(self, user_id: Optional[int]) -> Optional[Replica]:
+        """Réplica para um GET, ou None para ler do primário."""
+        if user_id is not None and self._wrote_recently(user_id):
+            self.stats["primary_read_your_writes"] += 1
+            return None
+        self.start()
+        available = [replica for replica in self.replicas if replica.available(self.stale_after)]
+        if not available:
+            self.stats["primary_fallback"] += 1
+            return None
+        self.stats["replica"] += 1
+        return available[next(self._cycle) % len(available)]
+
+    def record_write(self, user_id: int):
+        if self.read_your_writes_seconds <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._recent_writes) > _RECENT_WRITES_PRUNE_SIZE:
+                self._recent_writes = {uid: until for uid, until in self._recent_writes.items() if until > now}
+            self._recent_writes[user_id] = now + self.read_your_writes_seconds
+
+    def _wrote_recently(self, user_id: int) -> bool:
+        until = self._recent_writes.get(user_id)
+        return until is not None and until > time.monotonic()
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_lag_seconds": self.max_lag,
+            "read_your_writes_seconds": self.read_your_writes_seconds,
+            "replicas": [replica.status() for replica in self.replicas],
+            "reads": dict(self.stats),
+        }
+
+replica_router = ReplicaRouter(
+    engine, DATABASE_REPLICA_URLS, DB_REPLICA_MAX_LAG_SECONDS,
+    DB_REPLICA_CHECK_INTERVAL_SECONDS, DB_READ_YOUR_WRITES_SECONDS,
+)
+
+# Réplica escolhida para a requisição atual (None: primário). Propaga para
+# o threadpool (rotas síncronas) e para o run_sync do modo assíncrono
+_current_replica: ContextVar[Optional[Replica]] = ContextVar("crm_read_replica", default=None)
+
+def read_engine():
+    """Engine síncrono das leituras da requisição atual."""
+    replica = _current_replica.get()
+    return replica.engine if replica is not None else engine
+
+def read_async_engine():
+    """Engine assíncrono das leituras da requisição atual."""
+    replica = _current_replica.get()
+    return replica.async_engine if replica is not None else get_async_engine()
+
+def _request_user_id(scope) -> Optional[int]:
+    scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token_user_id(token)
+
+class ReplicaRoutingMiddleware:
+    """Middleware ASGI que direciona os GETs para as réplicas (ver o docstring do módulo)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_router.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        user_id = _request_user_id(scope)
+        if scope["method"] not in READ_METHODS:
+            # Registrada antes da rota: GETs do mesmo usuário enviados
+            # enquanto a escrita roda (ou assim que a resposta chega) já vão
+            # para o primário
+            if user_id is not None:
+                replica_router.record_write(user_id)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                # De novo no fim, para o prazo contar a partir do commit. Token
+                # sem uid e fora do cache antes da rota: a autenticação da
+                # rota já o colocou no cache
+                if user_id is None:
+                    user_id = _request_user_id(scope)
+                if user_id is not None:
+                    replica_router.record_write(user_id)
+            return
+
+        token = _current_replica.set(replica_router.route(user_id))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_replica.reset(token)
@@ -0,0 +1,87 @@
+"""
+Utilitários das tabelas de agregados mantidas incrementalmente
+(rollup de valores dos imóveis, funil de negociações).
+
+- increment_rows: soma contadores (ou guarda mínimo/máximo) por chave com
+  UPSERT (SQLite e PostgreSQL), na conexão/transação da escrita que
+  originou a mudança.
+- Histogramas em faixas logarítmicas: log_bucket / log_bucket_bounds e
+  histogram_percentile para mediana e percentis aproximados.
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+def _extreme(connection, kind: str, current, new):
+    """MIN/MAX de dois valores; NULL de um lado mantém o outro."""
+    if connection.dialect.name == "postgresql":
+        function = func.least if kind == "min" else func.greatest
+    else:
+        # min()/max() com dois argumentos são escalares no SQLite
+        function = func.min if kind == "min" else func.max
+    return function(func.coalesce(current, new), func.coalesce(new, current))
+
+def increment_rows(
+    connection,
+    table,
+    key_columns: Sequence[str],
+    rows: List[dict],
+    returning: Sequence[str] = (),
+    minimum: Sequence[str] = (),
+    maximum: Sequence[str] = (),
+):
+    """
+    Insere as linhas ou, se a chave já existe, soma os demais campos aos atuais.
+    Campos em `minimum`/`maximum` guardam o menor/maior valor em vez da soma
+    (None na linha mantém o atual). Com `returning`, devolve o resultado com
+    essas colunas (valores já atualizados).
+    """
+    if not rows:
+        return None
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(table)
+    excluded = statement.excluded
+    updates = {}
+    for name in rows[0]:
+        if name in key_columns:
+            continue
+        if name in minimum:
+            updates[name] = _extreme(connection, "min", table.c[name], excluded[name])
+        elif name in maximum:
+            updates[name] = _extreme(connection, "max", table.c[name], excluded[name])
+        else:
+            updates[name] = table.c[name] + excluded[name]
+    statement = statement.on_conflict_do_update(index_elements=list(key_columns), set_=updates)
+    if returning:
+        statement = statement.returning(*(table.c[name] for name in returning))
+    return connection.execute(statement, rows)
+
+def log_bucket(value: Optional[float], ratio: float) -> int:
+    """Faixa logarítmica do valor (valores até 1 ficam na faixa 0)."""
+    return int(math.floor(math.log(max(value or 0.0, 1.0)) / math.log(ratio)))
+
+def log_bucket_bounds(bucket: int, ratio: float) -> Tuple[float, float]:
+    return ratio ** bucket, ratio ** (bucket + 1)
+
+def histogram_percentile(buckets: List[Tuple[int, int]], fraction: float, ratio: float) -> float:
+    """
+    Percentil de um histograma [(faixa, quantidade)] ordenado por faixa,
+    por interpolação geométrica dentro da faixa.
+    """
+    total = sum(count for _, count in buckets)
+    target = fraction * total
+    seen = 0
+    for bucket, count in buckets:
+        if seen + count >= target:
+            low, high = log_bucket_bounds(bucket, ratio)
+            return low * (high / low) ** ((target - seen) / count)
+        seen += count
+    return log_bucket_bounds(buckets[-1][0], ratio)[1]
+
+def add_delta(deltas: Dict[tuple, Dict[str, float]], key: tuple, **counters):
+    """Acumula contadores por chave antes de um increment_rows."""
+    entry = deltas.setdefault(key, {})
+    for name, value in counters.items():
+        entry[name] = entry.get(name, 0) + value
@@ -0,0 +1,181 @@
+"""
+Busca textual em clientes (nome, e-mail, telefone) e imóveis
+(localização, descrição).
+
+- SQLite: tabelas FTS5 ``client_fts``/``property_fts`` (tokenizer unicode61
+  sem acentos), mantidas por triggers na mesma transação do INSERT/UPDATE/
+  DELETE da tabela principal. Ranking por bm25.
+- PostgreSQL: índice GIN sobre a expressão ``to_tsvector`` do documento,
+  com ``unaccent`` (extensão) para ignorar acentos. O índice é atualizado
+  pelo próprio banco na transação da escrita. Ranking por ts_rank.
+
+Nos dois casos os termos são buscados por prefixo (``"ana"`` encontra
+"Ana Paula", ``"jose"`` encontra "José") e todos precisam aparecer. O
+telefone é indexado só com dígitos, então "(11) 9999-8888" e
+"1199998888" encontram o mesmo cliente.
+
+O índice é único para todas as imobiliárias; a consulta textual não passa
+pelo filtro do ORM, então a condição ``agency_id`` da sessão entra no SQL
+antes do LIMIT (services/tenancy.py).
+"""
+import re
+from typing import List
+
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from models.models import Client, Property
+from services.tenancy import session_agency
+
+SEARCH_TYPES = ["all", "clients", "properties"]
+
+# Caracteres removidos do telefone antes de indexar
+PHONE_PUNCTUATION = [" ", "-", "(", ")", "+", "."]
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+_PHONE_QUERY = re.compile(r"^[\d\s()+.\-]+$")
+
+# SQLite: tabela FTS5 por entidade -> (tabela de origem, colunas indexadas)
+SQLITE_FTS = {
+    "client_fts": ("client", ["name", "email", "phone"]),
+    "property_fts": ("property", ["location", "description"]),
+}
+
+def _sqlite_phone_digits(column: str) -> str:
+    expr = column
+    for char in PHONE_PUNCTUATION:
+        expr = f"replace({expr}, '{char}', '')"
+    return expr
+
+def _sqlite_values(columns: List[str], prefix: str) -> str:
+    return ", ".join(
+        _sqlite_phone_digits(f"{prefix}.{c}") if c == "phone" else f"{prefix}.{c}" for c in columns
+    )
+
+# PostgreSQL: documento de busca de cada tabela (a mesma expressão do índice GIN)
+POSTGRES_DOCUMENTS = {
+    "client": (
+        "setweight(to_tsvector('simple', crm_unaccent(coalesce(name, ''))), 'A') || "
+        "to_tsvector('simple', crm_unaccent(regexp_replace(coalesce(email, ''), '[@.]', ' ', 'g'))) || "
+        "to_tsvector('simple', regexp_replace(coalesce(phone, ''), '\\D', '', 'g'))"
+    ),
+    "property": (
+        "setweight(to_tsvector('simple', crm_unaccent(coalesce(location, ''))), 'A') || "
+        "to_tsvector('simple', crm_unaccent(coalesce(description, '')))"
+    ),
+}
+
+def _sqlite_ddl() -> List[str]:
+    statements = []
+    for fts, (table, columns) in SQLITE_FTS.items():
+        column_list = ", ".join(columns)
+        statements += [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, tokenize='unicode61 remove_diacritics 2')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {_sqlite_values(columns, 'new')}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN "
+            f"DELETE FROM {fts} WHERE rowid = old.id; "
+            f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {_sqlite_values(columns, 'new')}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM {fts} WHERE rowid = old.id; END",
+        ]
+    return statements
+
+def postgres_search_ddl(concurrently: bool = False) -> List[str]:
+    """
+    DDL da busca no PostgreSQL. Com concurrently=True os índices GIN usam
+    CREATE INDEX CONCURRENTLY (executar fora de transação), que não
+    bloqueia escritas nas tabelas durante a construção.
+    """
+    statements = [
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        # unaccent() não é IMMUTABLE; o wrapper com dicionário fixo pode ser usado em índice
+        "CREATE OR REPLACE FUNCTION crm_unaccent(text) RETURNS text "
+        "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT "
+        "AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$",
+    ]
+    create_index = "CREATE INDEX CONCURRENTLY" if concurrently else "CREATE INDEX"
+    for table, document in POSTGRES_DOCUMENTS.items():
+        statements.append(f"{create_index} IF NOT EXISTS ix_{table}_search ON {table} USING GIN (({document}))")
+    return statements
+
+def create_search_index(engine) -> bool:
+    """
+    Cria as estruturas de busca que ainda não existem.
+
+    Retorna True quando as tabelas FTS5 foram criadas agora e precisam
+    ser populadas (ver rebuild_search_index). No PostgreSQL o índice é
+    construído a partir das linhas existentes no CREATE INDEX.
+    """
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            for statement in postgres_search_ddl():
+                conn.execute(text(statement))
+            return False
+        existing = {
+            row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))
+        }
+        for statement in _sqlite_ddl():
+            conn.execute(text(statement))
+        return any(fts not in existing for fts in SQLITE_FTS)
+
+def rebuild_search_index(engine):
+    """Repopula as tabelas FTS5 a partir das tabelas de origem (SQLite)."""
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            for table in POSTGRES_DOCUMENTS:
+                conn.execute(text(f"REINDEX INDEX ix_{table}_search"))
+        return
+    with engine.begin() as conn:
+        for fts, (table, columns) in SQLITE_FTS.items():
+            column_list = ", ".join(columns)
+            conn.execute(text(f"DELETE FROM {fts}"))
+            conn.execute(text(
+                f"INSERT INTO {fts}(rowid, {column_list}) "
+                f"SELECT id, {_sqlite_values(columns, table)} FROM {table}"
+            ))
+
+def search_terms(q: str) -> List[str]:
+    """
+    Separa a busca em termos. Uma busca só com dígitos e pontuação de
+    telefone vira um único termo com os dígitos.
+    """
+    if _PHONE_QUERY.match(q) and any(c.isdigit() for c in q):
+        return ["".join(c for c in q if c.isdigit())]
+    return _TERM.findall(q)
+
+def _search(session: Session, model, q: str, limit: int):
+    terms = search_terms(q)
+    if not terms:
+        return []
+    table = model.__tablename__
+    params = {"limit": limit}
+    agency_filter = ""
+    agency_id = session_agency(session)
+    if agency_id is not None:
+        agency_filter = f" AND {table}.agency_id = :agency_id"
+        params["agency_id"] = agency_id
+    if session.get_bind().dialect.name == "postgresql":
+        document = POSTGRES_DOCUMENTS[table]
+        statement = text(
+            f"SELECT {table}.* FROM {table}, to_tsquery('simple', crm_unaccent(:query)) AS query "
+            f"WHERE ({document}) @@ query{agency_filter} "
+            f"ORDER BY ts_rank(({document}), query) DESC, {table}.id LIMIT :limit"
+        )
+        params["query"] = " & ".join(f"{term}:*" for term in terms)
+    else:
+        fts = f"{table}_fts"
+        statement = text(
+            f"SELECT {table}.* FROM {fts} JOIN {table} ON {table}.id = {fts}.rowid "
+            f"WHERE {fts} MATCH :query{agency_filter} ORDER BY bm25({fts}), {table}.id LIMIT :limit"
+        )
+        params["query"] = " ".join(f'"{term}"*' for term in terms)
+    return session.execute(select(model).from_statement(statement.bindparams(**params))).scalars().all()
+
+def search_clients(session: Session, q: str, limit: int) -> List[Client]:
+    """Clientes cujo nome, e-mail ou telefone contém todos os termos (por prefixo)."""
+    return _search(session, Client, q, limit)
+
+def search_properties(session: Session, q: str, limit: int) -> List[Property]:
+    """Imóveis cuja localização ou descrição contém todos os termos (por prefixo)."""
+    return _search(session, Property, q, limit)
@@ -0,0 +1,170 @@
+"""
+Isolamento dos dados por imobiliária (multi-tenant).
+
+Clientes, imóveis, visitas, negociações e os agregados derivados deles
+pertencem a uma imobiliária (coluna agency_id). A sessão do banco guarda a
+imobiliária do usuário autenticado (get_current_user chama
+set_session_agency) e, a partir daí:
+
+- toda consulta do ORM (select, session.get, contagens, joins e
+  subconsultas, update/delete com o modelo) recebe ``agency_id = :agency``
+  em cada modelo de TENANT_MODELS, então os índices compostos que começam
+  por agency_id são usados;
+- objetos novos recebem o agency_id da sessão no flush; gravar um objeto
+  de outra imobiliária é erro.
+
+As sessões das rotas (get_session) exigem a imobiliária: sem ela as
+consultas não retornam nenhuma linha. Scripts, migrações e benchmarks
+abrem Session(engine) sem imobiliária e enxergam todas.
+
+Comandos Core sobre ``Model.__table__`` e SQL textual não passam pelo
+filtro do ORM; quem os usa aplica tenant_criteria ou session_agency
+(PATCH, busca, importação em lote, agregados).
+
+Com DB_ROW_LEVEL_SECURITY (PostgreSQL), cada transação também define
+``app.agency_id`` e as políticas de row-level security (create_row_level_security,
+migração 0011) restringem as linhas no próprio banco, como segunda barreira.
+"""
+import os
+from typing import List, Optional
+
+from sqlalchemy import event, false, text
+from sqlalchemy.orm import Session as OrmSession, with_loader_criteria
+
+from models.models import (
+    Client, EntityVersion, Negotiation, NegotiationStageDuration, NegotiationStageStats,
+    NegotiationTransition, Property, PropertyValueRollup, Visit,
+)
+
+DB_ROW_LEVEL_SECURITY = os.getenv("DB_ROW_LEVEL_SECURITY", "false").lower() in ("1", "true", "yes")
+
+# Modelos com coluna agency_id, filtrados em toda consulta do ORM
+TENANT_MODELS = [
+    Client, Property, Visit, Negotiation, NegotiationTransition,
+    PropertyValueRollup, NegotiationStageStats, NegotiationStageDuration, EntityVersion,
+]
+_TENANT_CLASSES = tuple(TENANT_MODELS)
+
+POLICY = "agency_isolation"
+# Sem app.agency_id (scripts, migrações, DB_ROW_LEVEL_SECURITY desligado) todas as linhas
+POLICY_CONDITION = (
+    "coalesce(current_setting('app.agency_id', true), '') = '' "
+    "OR agency_id = current_setting('app.agency_id', true)::integer"
+)
+
+# Chaves em Session.info
+_AGENCY = "agency_id"
+_USER = "user_id"
+_REQUIRED = "agency_required"
+_RLS_APPLIED = "agency_rls_applied"
+
+class TenantError(Exception):
+    """Escrita sem imobiliária ou em registro de outra imobiliária."""
+
+def require_agency(session):
+    """Sessão de rota: sem imobiliária definida, nenhuma linha é visível."""
+    session.info[_REQUIRED] = True
+
+def set_session_agency(session, agency_id: Optional[int], user_id: Optional[int] = None):
+    """
+    Restringe a sessão (síncrona ou AsyncSession) à imobiliária informada.
+    `user_id` é o usuário autenticado, autor dos eventos do feed de alterações.
+    """
+    session.info[_AGENCY] = agency_id
+    session.info[_USER] = user_id
+    session.info.pop(_RLS_APPLIED, None)
+
+def session_agency(session) -> Optional[int]:
+    return session.info.get(_AGENCY)
+
+def session_user(session) -> Optional[int]:
+    return session.info.get(_USER)
+
+def tenant_criteria(session, table) -> List:
+    """
+    Condições para comandos Core sobre `table` (``Model.__table__``), que
+    o filtro do ORM não alcança. Lista vazia em sessões sem imobiliária.
+    """
+    agency_id = session.info.get(_AGENCY)
+    if agency_id is None:
+        return [false()] if session.info.get(_REQUIRED) else []
+    return [table.c.agency_id == agency_id]
+
+def row_level_security_ddl(table: str) -> List[str]:
+    return [
+        f"DROP POLICY IF EXISTS {POLICY} ON {table}",
+        f"CREATE POLICY {POLICY} ON {table} USING ({POLICY_CONDITION}) WITH CHECK ({POLICY_CONDITION})",
+        f"ALTER TABLE {table} ENABLE ROW LEVEL SECURITY",
+        # FORCE: a política vale também para o dono da tabela (normalmente o usuário da aplicação)
+        f"ALTER TABLE {table} FORCE ROW LEVEL SECURITY",
+    ]
+
+def create_row_level_security(engine):
+    """Cria as políticas de row-level security (só PostgreSQL)."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        for model in TENANT_MODELS:
+            # exec_driver_sql: a condição tem "::", que text() trataria como parâmetro
+            for statement in row_level_security_ddl(model.__tablename__):
+                conn.exec_driver_sql(statement)
+
+def _loader_criteria(agency_id: Optional[int]):
+    if agency_id is None:
+        return [with_loader_criteria(model, false(), include_aliases=True) for model in TENANT_MODELS]
+    return [
+        with_loader_criteria(model, model.agency_id == agency_id, include_aliases=True)
+        for model in TENANT_MODELS
+    ]
+
+def scoped(session, statement):
+    """
+    Aplica à consulta o filtro da imobiliária da sessão. Necessário só
+    quando a consulta é compilada à mão (ex.: EXPLAIN em estimate_total);
+    o que passa por session.execute já é filtrado.
+    """
+    if session.info.get(_AGENCY) is None and not session.info.get(_REQUIRED):
+        return statement
+    return statement.options(*_loader_criteria(session.info.get(_AGENCY)))
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _scope_to_agency(orm_execute_state):
+    session = orm_execute_state.session
+    agency_id = session.info.get(_AGENCY)
+    if agency_id is None and not session.info.get(_REQUIRED):
+        return
+    if DB_ROW_LEVEL_SECURITY and agency_id is not None and not session.info.get(_RLS_APPLIED):
+        _apply_row_level_security(session, session.connection(), agency_id)
+    if orm_execute_state.is_select or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.statement = orm_execute_state.statement.options(*_loader_criteria(agency_id))
+
+@event.listens_for(OrmSession, "after_begin")
+def _start_transaction(session, transaction, connection):
+    session.info.pop(_RLS_APPLIED, None)
+    agency_id = session.info.get(_AGENCY)
+    if DB_ROW_LEVEL_SECURITY and agency_id is not None:
+        _apply_row_level_security(session, connection, agency_id)
+
+def _apply_row_level_security(session, connection, agency_id: int):
+    """Define app.agency_id até o fim da transação (lido pelas políticas de RLS)."""
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT set_config('app.agency_id', :agency_id, true)"), {"agency_id": str(agency_id)})
+    session.info[_RLS_APPLIED] = True
+
+@event.listens_for(OrmSession, "before_flush")
+def _assign_agency(session, flush_context, instances):
+    agency_id = session.info.get(_AGENCY)
+    for obj in session.new:
+        if not isinstance(obj, _TENANT_CLASSES):
+            continue
+        if obj.agency_id is None:
+            if agency_id is None:
+                raise TenantError(f"{type(obj).__name__} sem imobiliária (agency_id)")
+            obj.agency_id = agency_id
+        elif agency_id is not None and obj.agency_id != agency_id:
+            raise TenantError(f"{type(obj).__name__} pertence a outra imobiliária")
+    if agency_id is None:
+        return
+    for obj in session.dirty:
+        if isinstance(obj, _TENANT_CLASSES) and obj.agency_id != agency_id:
+            raise TenantError(f"{type(obj).__name__} pertence a outra imobiliária")
@@ -0,0 +1,133 @@
+"""
+Consultas de agenda de visitas.
+
+Centraliza os intervalos de datas e as consultas por período usadas pelo
+router de visitas, para que calendário, agenda do dia, filtros e detecção
+de conflitos usem o mesmo formato (datetime nativo) e os mesmos índices
+compostos ``(status | client_id | property_id, scheduled_datetime)``.
+
+A detecção de conflitos trava a agenda antes de consultar (ver
+``lock_schedule``): duas requisições simultâneas para o mesmo imóvel ou
+cliente não passam as duas pela verificação antes de gravar.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Tuple
+
+from sqlmodel import Session, or_, select
+
+from models.models import Client, Property, Visit
+
+# Status que ocupam a agenda
+ACTIVE_STATUSES = ["Agendada", "Reagendada"]
+
+# Limites de duração aceitos pelo VisitCreate (minutos); o máximo também
+# é garantido no banco (ck_visit_duration_minutes_max, migração 0015)
+DEFAULT_DURATION_MINUTES = 60
+MAX_DURATION_MINUTES = 480
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    """Intervalo semiaberto [00:00 do dia, 00:00 do dia seguinte)."""
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+def month_bounds(year: int, month: int) -> Tuple[datetime, datetime]:
+    """Intervalo semiaberto [primeiro dia do mês, primeiro dia do mês seguinte)."""
+    start = datetime(year, month, 1)
+    if month == 12:
+        return start, datetime(year + 1, 1, 1)
+    return start, datetime(year, month + 1, 1)
+
+def active_visits_between(
+    start: datetime,
+    end: datetime,
+    client_id: Optional[int] = None,
+    property_id: Optional[int] = None,
+):
+    """
+    Consulta das visitas ativas em [start, end), ordenadas por horário.
+
+    Com ``property_id`` ou ``client_id`` o banco usa o índice composto da
+    coluna correspondente; sem eles, o índice ``(status, scheduled_datetime)``.
+    """
+    query = select(Visit).where(
+        Visit.scheduled_datetime >= start,
+        Visit.scheduled_datetime < end,
+        Visit.status.in_(ACTIVE_STATUSES),
+    )
+    if client_id:
+        query = query.where(Visit.client_id == client_id)
+    if property_id:
+        query = query.where(Visit.property_id == property_id)
+    return query.order_by(Visit.scheduled_datetime)
+
+def visit_end(start: datetime, duration_minutes: Optional[int]) -> datetime:
+    """Fim da visita: início + duração (padrão de 60 minutos)."""
+    return start + timedelta(minutes=duration_minutes or DEFAULT_DURATION_MINUTES)
+
+def lock_schedule(session: Session, client_id: int, property_id: int):
+    """
+    Serializa verificação de conflito e gravação até o fim da transação.
+
+    - PostgreSQL: SELECT ... FOR UPDATE nas linhas do cliente e do imóvel,
+      sempre nessa ordem (sem deadlock entre agendamentos concorrentes)
+    - SQLite: BEGIN IMMEDIATE, que pega o lock de escrita do banco; se a
+      transação já gravou algo ela já tem esse lock
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        session.exec(select(Client.id).where(Client.id == client_id).with_for_update())
+        session.exec(select(Property.id).where(Property.id == property_id).with_for_update())
+    elif dialect == "sqlite":
+        connection = session.connection()
+        # O driver só abre a transação no primeiro INSERT/UPDATE/DELETE
+        if not connection.connection.driver_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+def find_conflicting_visit(
+    session: Session,
+    client_id: int,
+    property_id: int,
+    start: datetime,
+    duration_minutes: Optional[int],
+    exclude_visit_id: Optional[int] = None,
+) -> Optional[Visit]:
+    """
+    Retorna uma visita ativa do mesmo imóvel ou do mesmo cliente cujo
+    intervalo [início, início + duração) se sobrepõe ao informado.
+
+    Como nenhuma visita dura mais que MAX_DURATION_MINUTES (a constraint
+    ck_visit_duration_minutes_max vale também para as antigas), só podem
+    conflitar visitas que começam em (start - MAX_DURATION_MINUTES, end).
+    Essa janela é uma busca por faixa nos índices (property_id,
+    scheduled_datetime) e (client_id, scheduled_datetime): o custo é
+    O(log n) mais as poucas visitas da janela, independente do tamanho
+    da agenda. A sobreposição exata é verificada sobre esses candidatos.
+
+    Antes da consulta a agenda do cliente e do imóvel é travada até o
+    commit (``lock_schedule``), então a visita gravada em seguida não
+    pode conflitar com outra gravada em paralelo.
+    """
+    lock_schedule(session, client_id, property_id)
+    end = visit_end(start, duration_minutes)
+    window_start = start - timedelta(minutes=MAX_DURATION_MINUTES)
+
+    query = select(Visit).where(
+        or_(Visit.property_id == property_id, Visit.client_id == client_id),
+        Visit.scheduled_datetime > window_start,
+        Visit.scheduled_datetime < end,
+        Visit.status.in_(ACTIVE_STATUSES),
+    )
+    if exclude_visit_id is not None:
+        query = query.where(Visit.id != exclude_visit_id)
+
+    for candidate in session.exec(query.order_by(Visit.scheduled_datetime)):
+        if visit_end(candidate.scheduled_datetime, candidate.duration_minutes) > start:
+            return candidate
+    return None
+
+def conflict_message(conflict: Visit, property_id: int) -> str:
+    """Mensagem de erro para o conflito encontrado."""
+    horario = conflict.scheduled_datetime.strftime("%d/%m/%Y %H:%M")
+    if conflict.property_id == property_id:
+        return f"Já existe uma visita agendada para este imóvel neste horário ({horario})"
+    return f"O cliente já tem uma visita agendada neste horário ({horario})"
@@ -0,0 +1,119 @@
+"""
+Agregações de visitas para dashboards e relatórios.
+
+Todas as contagens são feitas no banco com GROUP BY e contagens
+condicionais, então o custo em memória é proporcional ao número de
+grupos e não ao número de visitas.
+"""
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import and_, case, func, or_
+from sqlmodel import Session, select
+
+from models.models import Client, Property, Visit
+from services.visit_schedule import day_bounds
+
+VISIT_STATUSES = ["Agendada", "Realizada", "Cancelada", "Reagendada"]
+GROUP_BY_OPTIONS = ["day", "week", "month", "property_type", "client_status"]
+
+def _time_bucket(group_by: str, dialect: str):
+    """
+    Expressão SQL que agrupa a data agendada por dia, semana ou mês.
+
+    Semanas são identificadas pela data da segunda-feira (YYYY-MM-DD).
+    """
+    column = Visit.scheduled_datetime
+    if dialect == "postgresql":
+        if group_by == "day":
+            return func.to_char(column, "YYYY-MM-DD")
+        if group_by == "week":
+            return func.to_char(func.date_trunc("week", column), "YYYY-MM-DD")
+        return func.to_char(column, "YYYY-MM")
+    if group_by == "day":
+        return func.strftime("%Y-%m-%d", column)
+    if group_by == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m", column)
+
+def _period_conditions(date_from: Optional[date], date_to: Optional[date]) -> list:
+    conditions = []
+    if date_from:
+        conditions.append(Visit.scheduled_datetime >= day_bounds(date_from)[0])
+    if date_to:
+        conditions.append(Visit.scheduled_datetime < day_bounds(date_to)[1])
+    return conditions
+
+def _apply_period(query, date_from: Optional[date], date_to: Optional[date]):
+    return query.where(*_period_conditions(date_from, date_to))
+
+def _status_counts(status_column):
+    """Uma contagem condicional por status, rotulada com o nome da chave de resposta."""
+    return [
+        func.count(case((status_column == status, 1))).label(status.lower() + "s")
+        for status in VISIT_STATUSES
+    ]
+
+def summarize_visits(
+    session: Session,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    group_by: Optional[str] = None,
+) -> dict:
+    """
+    Retorna o resumo das visitas no período e, opcionalmente, a série agrupada.
+
+    O resumo é uma única consulta ``GROUP BY status`` com contagens
+    condicionais: as do período e a das visitas de hoje, que não depende
+    do período pedido (um relatório do mês passado ainda mostra as
+    visitas de hoje). A série (quando ``group_by`` é informado) é uma
+    segunda consulta com uma linha por grupo.
+    """
+    start_of_day, end_of_day = day_bounds(datetime.now().date())
+    is_today = (Visit.scheduled_datetime >= start_of_day) & (Visit.scheduled_datetime < end_of_day)
+    period = _period_conditions(date_from, date_to)
+    in_period = and_(*period)
+
+    query = select(
+        Visit.status,
+        func.count(case((in_period, 1))).label("total") if period else func.count().label("total"),
+        func.count(case((is_today, 1))).label("hoje"),
+    ).group_by(Visit.status)
+    if period:
+        query = query.where(or_(in_period, is_today))
+    rows = session.exec(query).all()
+
+    by_status = {row.status: row.total for row in rows}
+    total_visits = sum(by_status.values())
+    realizadas = by_status.get("Realizada", 0)
+
+    summary = {
+        "total_visitas": total_visits,
+        "agendadas": by_status.get("Agendada", 0),
+        "realizadas": realizadas,
+        "canceladas": by_status.get("Cancelada", 0),
+        "reagendadas": by_status.get("Reagendada", 0),
+        "visitas_hoje": sum(row.hoje for row in rows),
+        "taxa_realizacao": round((realizadas / total_visits * 100), 2) if total_visits > 0 else 0,
+    }
+
+    if group_by:
+        summary["series"] = _grouped_series(session, date_from, date_to, group_by)
+    return summary
+
+def _grouped_series(session: Session, date_from: Optional[date], date_to: Optional[date], group_by: str) -> list:
+    if group_by == "property_type":
+        key = Property.type
+    elif group_by == "client_status":
+        key = Client.status
+    else:
+        key = _time_bucket(group_by, session.get_bind().dialect.name)
+
+    query = select(key.label("grupo"), func.count().label("total"), *_status_counts(Visit.status)).select_from(Visit)
+    if group_by == "property_type":
+        query = query.join(Property, Property.id == Visit.property_id)
+    elif group_by == "client_status":
+        query = query.join(Client, Client.id == Visit.client_id)
+
+    query = _apply_period(query, date_from, date_to).group_by(key).order_by(key)
+    return [dict(row._mapping) for row in session.exec(query)]
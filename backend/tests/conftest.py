@@ -0,0 +1,112 @@
+"""
+Configuração comum dos testes do backend.
+
+O app roda sobre um SQLite temporário, configurado aqui antes de qualquer
+importação de models.database (que lê o ambiente na importação). O modo
+vem de DB_ASYNC (padrão: síncrono); test_async_mode.py roda a suíte de
+novo com DB_ASYNC=true, então `python -m pytest` cobre os dois modos.
+
+Uso:
+    cd backend
+    python -m pytest
+"""
+import itertools
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/tests.db"
+os.environ.setdefault("DB_ASYNC", "false")
+os.environ["DATABASE_REPLICA_URLS"] = ""
+os.environ["RESPONSE_CACHE_URL"] = ""
+# Sem a limpeza do feed de alterações, que roda numa thread e entraria nas contagens
+os.environ["CHANGE_FEED_RETENTION_HOURS"] = "0"
+# bcrypt no custo mínimo: os testes não medem o hash
+os.environ["BCRYPT_ROUNDS"] = "4"
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.engine import Engine
+
+from models.database import assert_num_queries, count_queries, create_db_and_tables
+
+_sequence = itertools.count(1)
+
+def unique(prefix: str) -> str:
+    return f"{prefix}{next(_sequence)}"
+
+@pytest.fixture(scope="session")
+def client():
+    import main
+
+    create_db_and_tables()
+    # Um único TestClient (um único event loop) para a sessão inteira
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+@pytest.fixture(scope="session")
+def headers(client):
+    username = unique("teste")
+    client.post("/users/register", json={"username": username, "email": f"{username}@example.com", "password": "senha"})
+    token = client.post("/users/login", data={"username": username, "password": "senha"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.get("/clients/", headers=headers)  # carrega o usuário no cache de autenticação
+    return headers
+
+@pytest.fixture(name="unique")
+def unique_fixture():
+    return unique
+
+# Contagens sobre todos os engines: no modo assíncrono as rotas usam o
+# engine do aiosqlite e o cadastro/login, o síncrono
+
+@pytest.fixture
+def assert_queries():
+    return lambda expected: assert_num_queries(expected, bind=Engine)
+
+@pytest.fixture
+def count_sql():
+    return lambda: count_queries(bind=Engine)
+
+@pytest.fixture
+def api(client, headers):
+    """Chamada autenticada que falha com a resposta se o status for de erro."""
+    def call(method: str, url: str, **kwargs):
+        response = client.request(method, url, headers=headers, **kwargs)
+        assert response.status_code < 400, f"{method} {url}: HTTP {response.status_code} {response.text}"
+        return response.json()
+    return call
+
+@pytest.fixture
+def new_client(api):
+    name = unique("Cliente ")
+    return api("POST", "/clients/", json={
+        "name": name, "phone": "11999990000", "email": f"{name.replace(' ', '.').lower()}@example.com",
+        "interest_type": "Compra", "preferences": "casa no Centro até 500 mil",
+    })
+
+@pytest.fixture
+def new_property(api):
+    return api("POST", "/properties/", json={"type": "Casa", "location": "Centro", "value": 450000, "status": "Disponível"})
+
+@pytest.fixture
+def new_negotiation(api, new_client, new_property):
+    return api("POST", "/negotiations/", json={
+        "client_id": new_client["id"], "property_id": new_property["id"], "status": "Novo",
+    })
+
+@pytest.fixture
+def visit_time():
+    """Horário livre: cada chamada usa um dia diferente."""
+    day = datetime.now() + timedelta(days=3 + next(_sequence))
+    return day.replace(hour=10, minute=0, second=0, microsecond=0).strftime("%Y-%m-%d %H:%M")
+
+@pytest.fixture
+def new_visit(api, new_client, new_property, visit_time):
+    return api("POST", "/visits/", json={
+        "client_id": new_client["id"], "property_id": new_property["id"],
+        "scheduled_datetime": visit_time, "duration_minutes": 60,
+    })
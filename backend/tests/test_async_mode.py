@@ -0,0 +1,27 @@
+"""
+Roda a suíte de novo com DB_ASYNC=true (rotas com AsyncSession).
+
+A configuração do banco é lida na importação de models.database, então o
+outro modo precisa de um processo separado.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# Um event loop travado pendura o processo no encerramento do TestClient
+TIMEOUT_SECONDS = 300
+
+@pytest.mark.skipif(os.environ["DB_ASYNC"] == "true", reason="a suíte já está rodando no modo assíncrono")
+def test_suite_in_async_mode():
+    try:
+        result = subprocess.run(
+            [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", TESTS_DIR],
+            cwd=os.path.dirname(TESTS_DIR), env={**os.environ, "DB_ASYNC": "true"},
+            capture_output=True, text=True, timeout=TIMEOUT_SECONDS,
+        )
+    except subprocess.TimeoutExpired:
+        pytest.fail(f"suíte assíncrona não terminou em {TIMEOUT_SECONDS}s")
+    assert result.returncode == 0, result.stdout[-5000:] + result.stderr[-2000:]
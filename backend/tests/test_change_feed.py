@@ -0,0 +1,74 @@
+"""
+Feed de alterações (/changes/stream): cada escrita gera um evento, na
+ordem dos commits, com posições seguidas; escritas rejeitadas não geram
+nenhum.
+"""
+import json
+
+import pytest
+
+@pytest.fixture
+def agency_headers(client, unique):
+    """Usuário numa imobiliária nova, com o feed vazio."""
+    username = unique("feed")
+    client.post("/users/register", json={"username": username, "email": f"{username}@example.com", "password": "senha"})
+    token = client.post("/users/login", data={"username": username, "password": "senha"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def read_events(client, headers, since: int = 0, **params) -> list:
+    """Eventos pendentes depois de `since` (timeout=0: não espera eventos novos)."""
+    response = client.get("/changes/stream", headers=headers, params={"since": since, "timeout": 0, **params})
+    assert response.status_code == 200
+    events = []
+    for block in response.text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if fields.get("event") == "change":
+            event = json.loads(fields["data"])
+            assert int(fields["id"]) == event["offset"]
+            events.append(event)
+    return events
+
+def test_writes_are_published_in_order(client, agency_headers, unique):
+    def call(method, url, expected=200, **kwargs):
+        response = client.request(method, url, headers=agency_headers, **kwargs)
+        assert response.status_code == expected, response.text
+        return response.json()
+
+    new_client = call("POST", "/clients/", json={
+        "name": unique("Cliente "), "phone": "11999990000", "email": f"{unique('e')}@example.com",
+        "interest_type": "Compra",
+    })
+    new_property = call("POST", "/properties/", json={"type": "Casa", "location": "Centro", "value": 450000, "status": "Disponível"})
+    call("PATCH", f"/clients/{new_client['id']}", json={"status": "Ativo"})
+    call("PUT", f"/properties/{new_property['id']}", json={"type": "Casa", "location": "Centro", "value": 460000, "status": "Disponível"})
+    negotiation = call("POST", "/negotiations/", json={
+        "client_id": new_client["id"], "property_id": new_property["id"], "status": "Novo",
+    })
+    # Rejeitada (versão desatualizada): nenhum evento
+    call("PATCH", f"/clients/{new_client['id']}", expected=409, json={"status": "Lead", "version": new_client["version"]})
+    call("DELETE", f"/negotiations/{negotiation['id']}")
+
+    events = read_events(client, agency_headers)
+
+    assert [(e["entity"], e["action"], e["id"]) for e in events] == [
+        ("client", "created", new_client["id"]),
+        ("property", "created", new_property["id"]),
+        ("client", "updated", new_client["id"]),
+        ("property", "updated", new_property["id"]),
+        ("negotiation", "created", negotiation["id"]),
+        ("negotiation", "deleted", negotiation["id"]),
+    ]
+    assert [e["offset"] for e in events] == list(range(1, len(events) + 1))
+    assert events[2]["data"]["status"] == "Ativo"
+    assert events[3]["data"]["value"] == 460000
+    assert events[5]["data"] is None
+
+    # Retomada a partir de uma posição e filtro por entidade
+    assert read_events(client, agency_headers, since=4) == events[4:]
+    assert read_events(client, agency_headers, topics="property") == [events[1], events[3]]
+    assert read_events(client, agency_headers, topics=f"client:{new_client['id']}") == [events[0], events[2]]
+
+def test_other_agencies_do_not_see_the_events(client, agency_headers, api):
+    api("POST", "/properties/", json={"type": "Casa", "location": "Centro", "value": 450000, "status": "Disponível"})
+
+    assert read_events(client, agency_headers) == []
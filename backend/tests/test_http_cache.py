@@ -0,0 +1,94 @@
+"""
+ETag / If-None-Match e cache de respostas (services/http_cache.py): 304
+enquanto nada muda, ETag novo a cada escrita e nenhum corpo guardado para
+quem deixou de valer como usuário da imobiliária.
+"""
+import pytest
+from sqlalchemy import text
+
+import services.http_cache as http_cache
+from models.database import engine
+from services.http_cache import MemoryResponseCache
+
+@pytest.fixture
+def response_cache(monkeypatch):
+    cache = MemoryResponseCache(max_entries=128, ttl_seconds=300)
+    monkeypatch.setattr(http_cache, "response_cache", cache)
+    return cache
+
+@pytest.fixture
+def agency_user(client, unique):
+    """Usuário novo, na sua própria imobiliária, já no cache de autenticação."""
+    username = unique("cache")
+    user = client.post("/users/register", json={
+        "username": username, "email": f"{username}@example.com", "password": "senha",
+    }).json()
+    token = client.post("/users/login", data={"username": username, "password": "senha"}).json()["access_token"]
+    user["headers"] = {"Authorization": f"Bearer {token}"}
+    client.get("/clients/", headers=user["headers"])
+    return user
+
+def update_user(user_id: int, **values):
+    """Alteração direta no banco, como a de outro worker ou de um administrador."""
+    assignments = ", ".join(f"{column} = :{column}" for column in values)
+    with engine.begin() as connection:
+        connection.execute(text(f'UPDATE "user" SET {assignments} WHERE id = :id'), {**values, "id": user_id})
+
+def test_matching_if_none_match_returns_304(client, headers, new_client):
+    first = client.get("/clients/", headers=headers)
+    etag = first.headers["etag"]
+
+    again = client.get("/clients/", headers={**headers, "If-None-Match": etag})
+
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == etag
+
+def test_patch_changes_the_etag(client, headers, api, new_client):
+    url = f"/clients/{new_client['id']}"
+    etag = client.get(url, headers=headers).headers["etag"]
+
+    api("PATCH", url, json={"status": "Inativo"})
+
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["status"] == "Inativo"
+
+def test_cached_body_is_served_while_nothing_changes(client, agency_user, response_cache):
+    first = client.get("/clients/", headers=agency_user["headers"])
+
+    again = client.get("/clients/", headers=agency_user["headers"])
+
+    assert response_cache.size() == 1
+    assert again.status_code == 200
+    assert again.content == first.content
+
+def test_deactivated_user_is_not_served_cached_body(client, agency_user, response_cache):
+    first = client.get("/clients/", headers=agency_user["headers"])
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    update_user(agency_user["id"], is_active=False)
+
+    assert client.get("/clients/", headers=agency_user["headers"]).status_code == 401
+    assert client.get("/clients/", headers={**agency_user["headers"], "If-None-Match": etag}).status_code == 401
+
+def test_user_moved_to_other_agency_is_not_served_cached_body(client, agency_user, unique, response_cache):
+    # Cliente da imobiliária de agency_user, no corpo guardado
+    own = client.post("/clients/", headers=agency_user["headers"], json={
+        "name": unique("Cliente "), "phone": "11999990000", "email": f"{unique('a')}@example.com",
+        "interest_type": "Compra",
+    }).json()
+    first = client.get("/clients/", headers=agency_user["headers"])
+    assert own["id"] in [c["id"] for c in first.json()]
+
+    other = unique("outra")
+    other_agency_id = client.post("/users/register", json={
+        "username": other, "email": f"{other}@example.com", "password": "senha",
+    }).json()["agency_id"]
+    update_user(agency_user["id"], agency_id=other_agency_id)
+
+    response = client.get("/clients/", headers=agency_user["headers"])
+    assert response.status_code == 200
+    assert response.json() == []
@@ -0,0 +1,39 @@
+"""
+Sugestões de imóveis (GET /clients/{id}/matches) sob concorrência.
+
+No modo DB_ASYNC as rotas síncronas rodam como greenlets na thread do event
+loop; um lock segurado durante a consulta ao banco travaria o loop inteiro.
+"""
+import asyncio
+import threading
+
+import httpx
+
+from services.matching import match_index
+
+CONCURRENT_REQUESTS = 8
+TIMEOUT_SECONDS = 30
+
+def test_concurrent_matches(client, headers, new_client, new_property):
+    # Índice expirado: todas as requisições recarregam do banco ao mesmo tempo
+    match_index.invalidate()
+
+    async def fetch_all():
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver", headers=headers) as http:
+            return await asyncio.gather(*(
+                http.get(f"/clients/{new_client['id']}/matches") for _ in range(CONCURRENT_REQUESTS)
+            ))
+
+    responses = []
+    # Roda no event loop do TestClient (o mesmo do engine assíncrono), numa
+    # thread daemon: se o loop travar, o teste falha em vez de pendurar
+    worker = threading.Thread(target=lambda: responses.extend(client.portal.call(fetch_all)), daemon=True)
+    worker.start()
+    worker.join(TIMEOUT_SECONDS)
+    assert not worker.is_alive(), f"{CONCURRENT_REQUESTS} consultas concorrentes não terminaram em {TIMEOUT_SECONDS}s"
+
+    assert [r.status_code for r in responses] == [200] * CONCURRENT_REQUESTS
+    for response in responses:
+        ids = [m["property"]["id"] for m in response.json()["matches"]]
+        assert new_property["id"] in ids
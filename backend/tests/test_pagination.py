@@ -0,0 +1,125 @@
+"""
+Paginação por cursor: percurso completo das páginas, cursores inválidos e
+total estimado da primeira página (X-Total-Estimate), que fora do
+PostgreSQL é um COUNT feito uma vez por filtro e guardado em cache.
+"""
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, PickleType, Table, create_engine, literal, select
+from sqlmodel import Session
+
+from services.pagination import NEXT_CURSOR_HEADER, TOTAL_ESTIMATE_HEADER, count_cache, estimate_total
+
+def cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def walk(client, headers, url: str) -> list:
+    """Segue X-Next-Cursor até a última página e devolve os itens de todas elas."""
+    items, after = [], None
+    while True:
+        page = client.get(url + (f"&after={after}" if after else ""), headers=headers)
+        assert page.status_code == 200, page.text
+        items += page.json()
+        after = page.headers.get(NEXT_CURSOR_HEADER)
+        if after is None:
+            return items
+
+def test_visit_pages_with_repeated_datetimes(client, headers, api, unique, visit_time):
+    day = visit_time[:10]
+    created = []
+    # Três visitas às 10h e duas às 14h, cada uma com cliente e imóvel próprios
+    for scheduled in [visit_time] * 3 + [f"{day} 14:00"] * 2:
+        client_id = api("POST", "/clients/", json={
+            "name": unique("Cliente "), "phone": "11999990000", "email": f"{unique('v')}@example.com",
+            "interest_type": "Compra",
+        })["id"]
+        property_id = api("POST", "/properties/", json={
+            "type": "Casa", "location": "Centro", "value": 450000, "status": "Disponível",
+        })["id"]
+        visit = api("POST", "/visits/", json={
+            "client_id": client_id, "property_id": property_id,
+            "scheduled_datetime": scheduled, "duration_minutes": 60,
+        })
+        created.append((datetime.strptime(scheduled, "%Y-%m-%d %H:%M"), visit["id"]))
+
+    visits = walk(client, headers, f"/visits/?limit=2&date_from={day}&date_to={day}")
+
+    # Mais recentes primeiro; no mesmo horário, maior id primeiro. Nada pulado ou repetido
+    assert [v["id"] for v in visits] == [visit_id for _, visit_id in sorted(created, reverse=True)]
+
+def test_filters_apply_after_the_first_page(client, headers, api, unique):
+    status = unique("Status ")
+    ids = [
+        api("POST", "/clients/", json={
+            "name": unique("Cliente "), "phone": "11999990000", "email": f"{unique('f')}@example.com",
+            "interest_type": "Compra", "status": status,
+        })["id"]
+        for _ in range(3)
+    ]
+    # Clientes fora do filtro entre os filtrados
+    api("POST", "/clients/", json={
+        "name": unique("Cliente "), "phone": "11999990000", "email": f"{unique('f')}@example.com",
+        "interest_type": "Compra",
+    })
+
+    clients = walk(client, headers, f"/clients/?limit=1&status={status}")
+
+    assert [c["id"] for c in clients] == ids
+    assert {c["status"] for c in clients} == {status}
+
+@pytest.mark.parametrize("after", [
+    "não-é-base64!",
+    base64.urlsafe_b64encode(b"{nao e json").decode(),
+    cursor({"id": 1}),
+    cursor([123, 1]),  # data agendada como número
+    cursor(["2030-01-01T10:00:00", "x"]),  # id como texto
+    cursor(["2030-01-01T10:00:00", True]),
+    cursor(["não é data", 1]),
+    cursor([1]),  # chave da listagem de visitas tem duas colunas
+    cursor(["2030-01-01T10:00:00", 1, 2]),
+])
+def test_invalid_cursor_is_rejected(client, headers, after):
+    response = client.get(f"/visits/?after={after}", headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor de paginação inválido"
+
+def test_first_page_count_is_cached(client, headers, new_client, assert_queries):
+    count_cache.clear()
+    # versões + COUNT + página
+    with assert_queries(3):
+        first = client.get("/clients/?limit=1", headers=headers)
+    # versões + página
+    with assert_queries(2):
+        again = client.get("/clients/?limit=1", headers=headers)
+    assert first.headers[TOTAL_ESTIMATE_HEADER] == again.headers[TOTAL_ESTIMATE_HEADER]
+    assert int(first.headers[TOTAL_ESTIMATE_HEADER]) >= 1
+
+    # Outro filtro é outra consulta: novo COUNT
+    with assert_queries(3):
+        client.get("/clients/?limit=1&status=Inexistente", headers=headers)
+
+def test_next_pages_skip_the_estimate(client, headers, new_client, unique, api):
+    api("POST", "/clients/", json={
+        "name": unique("Cliente "), "phone": "11999990000", "email": f"{unique('c')}@example.com",
+        "interest_type": "Compra",
+    })
+    first = client.get("/clients/?limit=1", headers=headers)
+    second = client.get(f"/clients/?limit=1&after={first.headers[NEXT_CURSOR_HEADER]}", headers=headers)
+    assert second.status_code == 200
+    assert TOTAL_ESTIMATE_HEADER not in second.headers
+
+def test_estimate_falls_back_to_count_when_explain_cannot_compile():
+    # Banco em memória que se apresenta como PostgreSQL; o parâmetro
+    # PickleType não tem forma literal, então o EXPLAIN não é montado
+    engine = create_engine("sqlite://")
+    engine.dialect.name = "postgresql"
+    table = Table("item", MetaData(), Column("id", Integer, primary_key=True), Column("data", PickleType))
+    table.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.execute(table.insert(), [{"data": [1]}, {"data": [2]}, {"data": [3]}])
+        query = select(table).where(table.c.data != literal([3], PickleType))
+        # COUNT de verdade: duas linhas diferentes de [3]
+        assert estimate_total(session, query) == 2
@@ -0,0 +1,55 @@
+"""
+PATCH com concorrência otimista (services/partial_update.py): só os campos
+enviados mudam, versão desatualizada dá 409 e registro inexistente, 404.
+"""
+import pytest
+
+def test_patch_changes_only_sent_fields(client, headers, new_client):
+    response = client.patch(f"/clients/{new_client['id']}", headers=headers, json={"status": "Ativo"})
+
+    assert response.status_code == 200
+    updated = response.json()
+    assert updated["status"] == "Ativo"
+    assert updated["version"] == new_client["version"] + 1
+    unchanged = {k: v for k, v in new_client.items() if k not in ("status", "version")}
+    assert {k: updated[k] for k in unchanged} == unchanged
+    assert client.get(f"/clients/{new_client['id']}", headers=headers).json() == updated
+
+def test_patch_with_current_version(client, headers, new_property):
+    response = client.patch(f"/properties/{new_property['id']}", headers=headers, json={
+        "value": 470000, "version": new_property["version"],
+    })
+
+    assert response.status_code == 200
+    assert response.json()["value"] == 470000
+    assert response.json()["location"] == new_property["location"]
+
+@pytest.mark.parametrize("url, changes", [
+    ("/clients/{id}", {"status": "Ativo"}),
+    ("/properties/{id}", {"value": 470000}),
+    # status é lido antes do UPDATE (funil de negociações): outro caminho
+    ("/negotiations/{id}", {"status": "Proposta"}),
+])
+def test_patch_with_stale_version_conflicts(client, headers, api, new_client, new_property, new_negotiation, url, changes):
+    record = {"/clients/{id}": new_client, "/properties/{id}": new_property, "/negotiations/{id}": new_negotiation}[url]
+    url = url.format(id=record["id"])
+    # Outra requisição altera o registro antes
+    current = api("PATCH", url, json={**changes, "version": record["version"]})
+    before = api("GET", url)
+
+    response = client.patch(url, headers=headers, json={**changes, "version": record["version"]})
+
+    assert response.status_code == 409
+    assert response.json()["detail"] == f"Registro alterado por outra requisição (versão atual: {current['version']})"
+    assert api("GET", url) == before
+
+@pytest.mark.parametrize("url", ["/clients/0", "/properties/0", "/negotiations/0"])
+def test_patch_missing_record_returns_404(client, headers, url):
+    for body in ({"status": "Ativo"}, {"status": "Ativo", "version": 1}, {}):
+        response = client.patch(url, headers=headers, json=body)
+        assert response.status_code == 404, body
+
+def test_patch_rejects_explicit_null(client, headers, new_client):
+    response = client.patch(f"/clients/{new_client['id']}", headers=headers, json={"name": None})
+
+    assert response.status_code == 422
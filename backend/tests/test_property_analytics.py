@@ -0,0 +1,55 @@
+"""
+Estatísticas de valores dos imóveis (/properties/analytics): o rollup
+acompanha criação, PATCH e exclusão, inclusive quando o imóvel muda de
+grupo ou de faixa e leva consigo o menor ou o maior valor.
+"""
+
+def location_stats(api, location: str):
+    groups = api("GET", "/properties/analytics", params={"group_by": "location"})["groups"]
+    return next((g for g in groups if g["group"] == location), None)
+
+def summary(stats):
+    return stats and (stats["count"], stats["min_value"], stats["max_value"])
+
+def test_rollup_follows_patch_between_groups(api, unique):
+    origin, target = unique("Bairro "), unique("Bairro ")
+    ids = {
+        value: api("POST", "/properties/", json={
+            "type": "Casa", "location": location, "value": value, "status": "Disponível",
+        })["id"]
+        for location, value in [(origin, 100000), (origin, 200000), (origin, 300000), (target, 500000)]
+    }
+    assert summary(location_stats(api, origin)) == (3, 100000, 300000)
+    assert summary(location_stats(api, target)) == (1, 500000, 500000)
+
+    # O maior valor da origem vai para o destino, com outro valor (outra faixa)
+    api("PATCH", f"/properties/{ids[300000]}", json={"location": target, "value": 600000})
+    assert summary(location_stats(api, origin)) == (2, 100000, 200000)
+    assert summary(location_stats(api, target)) == (2, 500000, 600000)
+    assert location_stats(api, target)["avg_value"] == 550000
+
+    # O menor valor muda de faixa sem mudar de grupo
+    api("PATCH", f"/properties/{ids[100000]}", json={"value": 250000})
+    assert summary(location_stats(api, origin)) == (2, 200000, 250000)
+
+    api("DELETE", f"/properties/{ids[500000]}")
+    assert summary(location_stats(api, target)) == (1, 600000, 600000)
+
+    # Grupo esvaziado some da resposta
+    for property_id in (ids[100000], ids[200000]):
+        api("DELETE", f"/properties/{property_id}")
+    assert location_stats(api, origin) is None
+
+def test_rollup_follows_status_patch(api, unique):
+    location = unique("Bairro ")
+    created = api("POST", "/properties/", json={"type": "Casa", "location": location, "value": 320000, "status": "Disponível"})
+    before = {g["group"]: summary(g) for g in api("GET", "/properties/analytics", params={"group_by": "status"})["groups"]}
+
+    api("PATCH", f"/properties/{created['id']}", json={"status": "Vendido"})
+
+    after = {g["group"]: summary(g) for g in api("GET", "/properties/analytics", params={"group_by": "status"})["groups"]}
+    assert after["Disponível"][0] == before["Disponível"][0] - 1
+    assert after["Vendido"][0] == before.get("Vendido", (0,))[0] + 1
+    assert after["Vendido"][1] <= 320000 <= after["Vendido"][2]
+    # A localização não mudou
+    assert summary(location_stats(api, location)) == (1, 320000, 320000)
@@ -0,0 +1,153 @@
+"""
+Comandos SQL por endpoint.
+
+Cada teste faz uma chamada com assert_num_queries e falha se o número de
+comandos mudar (para mais: regressão, como um refresh depois do commit ou
+consultas por item no enriquecimento; para menos: atualizar o número
+aqui). O usuário já está no cache de autenticação, como no uso normal.
+
+Os números incluem as escritas derivadas feitas na mesma transação, que
+não são consultas da rota:
+- versão do ETag (entityversion): 1 UPSERT por escrita;
+- feed de alterações: posição (changefeedhead) e evento (changeevent);
+- rollup de valores dos imóveis: 1 UPSERT, mais 1 UPDATE quando uma
+  faixa perde o seu menor ou maior valor;
+- funil das negociações: histórico, agregados e histograma de tempo;
+- nas visitas, a trava da agenda (BEGIN IMMEDIATE no SQLite);
+e, nos GETs, a leitura das versões do ETag.
+
+O custo da própria tabela (uma ida ao banco por criação ou atualização,
+sem SELECT depois do commit) é verificado à parte em
+test_single_round_trip_on_main_table.
+"""
+import re
+
+import pytest
+
+from services.pagination import count_cache
+
+# Criações: tabela principal + derivadas (ver o docstring)
+POST_BUDGETS = {
+    # SELECT do nome, INSERT da imobiliária e do usuário
+    "/users/register": 3,
+    # INSERT + feed (2) + versão
+    "/clients/": 4,
+    # INSERT + rollup + feed (2) + versão
+    "/properties/": 5,
+    # cliente e imóvel + INSERT + feed (2) + versão + funil (agregados e histórico)
+    "/negotiations/": 8,
+    # cliente e imóvel + trava + conflitos + INSERT + feed (2) + versão
+    "/visits/": 8,
+}
+
+def _post_body(path, new_client, new_property, visit_time, unique):
+    if path == "/users/register":
+        username = unique("orcamento")
+        return {"username": username, "email": f"{username}@example.com", "password": "x"}
+    if path == "/clients/":
+        name = unique("orcamento")
+        return {"name": name, "phone": "11999990000", "email": f"{name}@example.com", "interest_type": "Compra"}
+    if path == "/properties/":
+        return {"type": "Casa", "location": "Centro", "value": 450000, "status": "Disponível"}
+    ids = {"client_id": new_client["id"], "property_id": new_property["id"]}
+    if path == "/negotiations/":
+        return {**ids, "status": "Novo"}
+    return {**ids, "scheduled_datetime": visit_time, "duration_minutes": 60}
+
+@pytest.mark.parametrize("path,expected", POST_BUDGETS.items())
+def test_create(path, expected, client, headers, assert_queries, new_client, new_property, visit_time, unique):
+    body = _post_body(path, new_client, new_property, visit_time, unique)
+    with assert_queries(expected):
+        response = client.post(path, json=body, headers=headers)
+    assert response.status_code == 200, response.text
+
+# Atualizações: (método, recurso, corpo, comandos)
+UPDATE_BUDGETS = [
+    # SELECT + UPDATE + feed (2) + versão
+    ("PUT", "client", {"name": "Ana Maria", "phone": "11999990000", "email": "ana@example.com", "interest_type": "Compra"}, 5),
+    # SELECT + UPDATE + rollup (UPSERT e recálculo dos extremos) + feed (2) + versão
+    ("PUT", "property", {"type": "Casa", "location": "Centro", "value": 460000, "status": "Disponível"}, 7),
+    # SELECT + UPDATE + feed (2) + versão + funil (histórico, agregados, histograma, transição)
+    ("PUT", "negotiation", {"status": "Em contato"}, 9),
+    # SELECT (com cliente e imóvel da resposta) + trava + conflitos + UPDATE + feed (2) + versão
+    ("PUT", "visit", {"duration_minutes": 90}, 7),
+    # UPDATE ... RETURNING + versão + feed (2)
+    ("PATCH", "client", {"phone": "11888880000"}, 4),
+    # valores antigos + UPDATE ... RETURNING + versão + feed (2) + rollup (2)
+    ("PATCH", "property", {"value": 470000}, 7),
+    # SELECT + UPDATE + versão + feed (2) + funil (4)
+    ("PATCH", "negotiation", {"status": "Visita"}, 9),
+]
+
+RESOURCE_PATHS = {"client": "/clients", "property": "/properties", "negotiation": "/negotiations", "visit": "/visits"}
+
+@pytest.fixture
+def existing(request):
+    """Registro novo do recurso pedido (client, property, negotiation ou visit)."""
+    return request.getfixturevalue(f"new_{request.param}")
+
+@pytest.mark.parametrize(
+    "method,existing,body,expected", UPDATE_BUDGETS, indirect=["existing"],
+    ids=[f"{method} {resource}" for method, resource, _, _ in UPDATE_BUDGETS],
+)
+def test_update(method, existing, body, expected, client, headers, assert_queries, request):
+    resource = request.node.callspec.params["existing"]
+    if resource == "negotiation" and method == "PUT":
+        body = {"client_id": existing["client_id"], "property_id": existing["property_id"], **body}
+    with assert_queries(expected):
+        response = client.request(method, f"{RESOURCE_PATHS[resource]}/{existing['id']}", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+
+# Leituras: (caminho, comandos); todas começam pela leitura das versões do ETag
+READ_BUDGETS = [
+    # versões + COUNT (X-Total-Estimate, com o cache dos COUNTs vazio) + página
+    ("/clients/", 3),
+    ("/clients/{client}", 2),
+    ("/properties/", 3),
+    ("/properties/{property}", 2),
+    # versões + histograma do grupo + histograma geral
+    ("/properties/analytics", 3),
+    # versões + COUNT + página + clientes e imóveis da página (em lote)
+    ("/visits/", 5),
+    ("/visits/{visit}", 4),
+    ("/negotiations/", 3),
+    # versões + agregados + histograma de tempo
+    ("/negotiations/funnel", 3),
+]
+
+@pytest.mark.parametrize("path,expected", READ_BUDGETS)
+def test_read(path, expected, client, headers, assert_queries, new_client, new_property, new_visit):
+    url = path.format(client=new_client["id"], property=new_property["id"], visit=new_visit["id"])
+    count_cache.clear()
+    with assert_queries(expected):
+        response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.text
+
+# Escritas na tabela principal: INSERT/UPDATE seguidos de SELECT na mesma tabela
+# seriam o refresh depois do commit que esses endpoints não fazem mais
+MAIN_TABLE_WRITES = [
+    ("POST", "/clients/", "client"),
+    ("POST", "/properties/", "property"),
+    ("POST", "/negotiations/", "negotiation"),
+    ("POST", "/visits/", "visit"),
+]
+
+def _touches(statement: str, table: str) -> str:
+    """'write', 'read' ou '' conforme o comando grava ou lê `table`."""
+    statement = " ".join(statement.split())
+    if re.match(rf"(INSERT INTO|UPDATE) {table}\b", statement):
+        return "write"
+    if re.search(rf"\bFROM {table}\b", statement):
+        return "read"
+    return ""
+
+@pytest.mark.parametrize("method,path,table", MAIN_TABLE_WRITES)
+def test_single_round_trip_on_main_table(method, path, table, client, headers, count_sql, new_client, new_property, visit_time, unique):
+    body = _post_body(path, new_client, new_property, visit_time, unique)
+    with count_sql() as counter:
+        response = client.request(method, path, json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    touches = [_touches(statement, table) for statement in counter.statements]
+    assert touches.count("write") == 1, counter.statements
+    after_write = touches[touches.index("write") + 1:]
+    assert "read" not in after_write, counter.statements
@@ -0,0 +1,52 @@
+"""
+Leitura das próprias escritas com réplicas: a escrita do usuário é
+registrada antes de a rota rodar, e cadastro/login (sem token) registram o
+usuário pelas próprias rotas.
+"""
+import asyncio
+import os
+
+from auth.auth import create_access_token
+from services.read_replicas import Replica, ReplicaRoutingMiddleware, replica_router
+
+def test_register_and_login_record_the_user(client, unique, monkeypatch):
+    monkeypatch.setattr(replica_router, "_recent_writes", {})
+    username = unique("replica")
+    user = client.post("/users/register", json={
+        "username": username, "email": f"{username}@example.com", "password": "senha",
+    }).json()
+    assert replica_router._wrote_recently(user["id"])
+
+    monkeypatch.setattr(replica_router, "_recent_writes", {})
+    response = client.post("/users/login", data={"username": username, "password": "senha"})
+    assert response.status_code == 200
+    assert replica_router._wrote_recently(user["id"])
+
+def test_write_recorded_before_the_route(monkeypatch):
+    replica = Replica("replica1", os.environ["DATABASE_URL"])
+    monkeypatch.setattr(replica_router, "replicas", [replica])
+    monkeypatch.setattr(replica_router, "_recent_writes", {})
+    user_id = 987654
+    token = create_access_token(data={"sub": "replica-middleware", "uid": user_id})
+    seen = []
+
+    async def route(scope, receive, send):
+        seen.append(replica_router._wrote_recently(user_id))
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/clients/", "query_string": b"",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    }
+    try:
+        asyncio.run(ReplicaRoutingMiddleware(route)(scope, receive, send))
+    finally:
+        replica.engine.dispose()
+    assert seen == [True]
@@ -0,0 +1,56 @@
+"""
+Busca textual (services/search.py): o índice acompanha INSERT, UPDATE
+(PUT e PATCH) e DELETE na mesma transação da escrita.
+"""
+
+def search_ids(api, q: str, kind: str) -> list:
+    return [item["id"] for item in api("GET", "/search/", params={"q": q})[kind]]
+
+def test_client_search_follows_writes(api, unique):
+    name, renamed = unique("Zuleica"), unique("Wanderleia")
+    created = api("POST", "/clients/", json={
+        "name": f"José {name}", "phone": "(11) 97777-6666", "email": f"{unique('s')}@example.com",
+        "interest_type": "Compra",
+    })
+    assert search_ids(api, name, "clients") == [created["id"]]
+    # Sem acento, por prefixo e pelo telefone só com dígitos
+    assert created["id"] in search_ids(api, f"jose {name[:-1]}", "clients")
+    assert created["id"] in search_ids(api, "11977776666", "clients")
+
+    api("PATCH", f"/clients/{created['id']}", json={"name": f"José {renamed}"})
+    assert search_ids(api, name, "clients") == []
+    assert search_ids(api, renamed, "clients") == [created["id"]]
+
+    api("DELETE", f"/clients/{created['id']}")
+    assert search_ids(api, renamed, "clients") == []
+
+def test_property_search_follows_writes(api, unique):
+    word, replaced = unique("Quiosque"), unique("Sobrado")
+    created = api("POST", "/properties/", json={
+        "type": "Casa", "location": "Centro", "value": 450000, "status": "Disponível",
+        "description": f"{word} com vista",
+    })
+    assert search_ids(api, word, "properties") == [created["id"]]
+
+    updated = {**created, "description": f"{replaced} com vista"}
+    del updated["id"]
+    api("PUT", f"/properties/{created['id']}", json=updated)
+    assert search_ids(api, word, "properties") == []
+    assert search_ids(api, f"{replaced} vista", "properties") == [created["id"]]
+
+    api("DELETE", f"/properties/{created['id']}")
+    assert search_ids(api, replaced, "properties") == []
+
+def test_search_is_limited_to_the_agency(client, api, unique):
+    name = unique("Ximena")
+    api("POST", "/clients/", json={
+        "name": name, "phone": "11999990000", "email": f"{unique('s')}@example.com", "interest_type": "Compra",
+    })
+    username = unique("busca")
+    client.post("/users/register", json={"username": username, "email": f"{username}@example.com", "password": "senha"})
+    token = client.post("/users/login", data={"username": username, "password": "senha"}).json()["access_token"]
+
+    response = client.get("/search/", params={"q": name}, headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert response.json()["clients"] == []
@@ -1,10 +1,12 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import api from '../services/api';
+import { getClientsPage } from '../services/api';
 import type { Client } from '../types';
 
 export const ClientsPage = () => {
   const [clients, setClients] = useState<Client[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [filterStatus, setFilterStatus] = useState<string>('');
@@ -12,12 +14,13 @@ export const ClientsPage = () => {
   const [searchTerm, setSearchTerm] = useState<string>('');
   const navigate = useNavigate();
 
-  // Buscar clientes
+  // Buscar clientes (primeira página)
   const fetchClients = async () => {
     try {
       setLoading(true);
-      const response = await api.get('/clients/');
-      setClients(response.data);
+      const page = await getClientsPage();
+      setClients(page.items);
+      setNextCursor(page.nextCursor);
       setError(null);
     } catch (error) {
       console.error('Erro ao buscar clientes:', error);
@@ -27,6 +30,22 @@ export const ClientsPage = () => {
     }
   };
 
+  // Próxima página, a partir do cursor da anterior
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const page = await getClientsPage(nextCursor);
+      setClients(prev => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Erro ao buscar clientes:', error);
+      setError('Erro ao carregar clientes');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchClients();
   }, []);
@@ -252,6 +271,14 @@ export const ClientsPage = () => {
         )}
       </div>
 
+      {nextCursor && (
+        <div className="load-more">
+          <button className="btn btn-secondary" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? 'Carregando...' : 'Carregar mais'}
+          </button>
+        </div>
+      )}
+
       {/* Ações Rápidas */}
       <div className="quick-actions">
         <h3>⚡ Ações Rápidas</h3>
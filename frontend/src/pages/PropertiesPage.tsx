@@ -1,10 +1,12 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import api from '../services/api';
+import api, { getPropertiesPage } from '../services/api';
 import type { Property } from '../types';
 
 export const PropertiesPage = () => {
   const [properties, setProperties] = useState<Property[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [filterType, setFilterType] = useState<string>('');
@@ -12,12 +14,13 @@ export const PropertiesPage = () => {
   const [searchLocation, setSearchLocation] = useState<string>('');
   const navigate = useNavigate();
 
-  // Buscar imóveis
+  // Buscar imóveis (primeira página)
   const fetchProperties = async () => {
     try {
       setLoading(true);
-      const response = await api.get('/properties/');
-      setProperties(response.data);
+      const page = await getPropertiesPage();
+      setProperties(page.items);
+      setNextCursor(page.nextCursor);
       setError(null);
     } catch (error) {
       console.error('Erro ao buscar imóveis:', error);
@@ -27,6 +30,22 @@ export const PropertiesPage = () => {
     }
   };
 
+  // Próxima página, a partir do cursor da anterior
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const page = await getPropertiesPage(nextCursor);
+      setProperties(prev => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Erro ao buscar imóveis:', error);
+      setError('Erro ao carregar imóveis');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchProperties();
   }, []);
@@ -203,6 +222,14 @@ export const PropertiesPage = () => {
         )}
       </div>
 
+      {nextCursor && (
+        <div className="load-more">
+          <button className="btn btn-secondary" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? 'Carregando...' : 'Carregar mais'}
+          </button>
+        </div>
+      )}
+
       {/* Estatísticas */}
       {properties.length > 0 && (
         <div className="properties-stats">
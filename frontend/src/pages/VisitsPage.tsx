@@ -6,6 +6,7 @@ import {
   getVisitStatistics, 
   updateVisitStatus, 
   deleteVisit,
+  subscribeChanges,
   formatVisitDateTime,
   formatDuration,
   getVisitStatusColor,
@@ -88,6 +89,35 @@ export const VisitsPage: React.FC = () => {
     }
   }, [filters, selectedView]);
 
+  // Visitas alteradas por outros usuários: recarrega sem o indicador de carregamento
+  useEffect(() => {
+    let timer: ReturnType<typeof setTimeout> | undefined;
+    const refresh = () => {
+      // Agrupa rajadas de eventos (ex.: importação) numa recarga só
+      clearTimeout(timer);
+      timer = setTimeout(async () => {
+        try {
+          const [todayData, statsData, visitsData] = await Promise.all([
+            getTodayVisits(),
+            getVisitStatistics(),
+            selectedView === 'all' ? getVisits(filters) : Promise.resolve(null),
+          ]);
+          setTodayVisits(todayData);
+          setStatistics(statsData);
+          if (visitsData) setVisits(visitsData);
+        } catch (err) {
+          console.error('Erro ao atualizar visitas:', err);
+        }
+      }, 500);
+    };
+
+    const unsubscribe = subscribeChanges(refresh, { topics: ['visit'], author: 'others', onReset: refresh });
+    return () => {
+      clearTimeout(timer);
+      unsubscribe();
+    };
+  }, [filters, selectedView]);
+
   const handleStatusChange = async (visitId: number, newStatus: string) => {
     try {
       await updateVisitStatus(visitId, newStatus);
@@ -1,5 +1,9 @@
 import axios from 'axios';
-import type { Visit, VisitCreate, VisitUpdate, VisitFilter, VisitStatistics } from '../types';
+import type {
+  Visit, VisitCreate, VisitUpdate, VisitFilter, VisitStatistics, SearchResults, ClientMatches,
+  Client, ClientUpdate, Property, PropertyUpdate, Negotiation, NegotiationUpdate,
+  ChangeEvent, ChangeEntity, Page,
+} from '../types';
 
 // Configuração base da API
 const api = axios.create({
@@ -47,6 +51,22 @@ export const createVisit = async (visitData: VisitCreate): Promise<Visit> => {
   return response.data;
 };
 
+/**
+ * Uma página de uma listagem paginada por cursor. `nextCursor` vem do
+ * cabeçalho X-Next-Cursor e vai no parâmetro `after` da próxima chamada;
+ * null quando não há mais páginas.
+ */
+const getPage = async <T>(url: string, params: Record<string, string | number | undefined>): Promise<Page<T>> => {
+  const response = await api.get(url, { params });
+  return { items: response.data, nextCursor: response.headers['x-next-cursor'] ?? null };
+};
+
+export const getClientsPage = (after?: string, limit = 100): Promise<Page<Client>> =>
+  getPage<Client>('/clients/', { limit, after });
+
+export const getPropertiesPage = (after?: string, limit = 100): Promise<Page<Property>> =>
+  getPage<Property>('/properties/', { limit, after });
+
 /**
  * Lista visitas com filtros opcionais
  */
@@ -59,7 +79,7 @@ export const getVisits = async (filters?: VisitFilter): Promise<Visit[]> => {
   if (filters?.date_from) params.append('date_from', filters.date_from);
   if (filters?.date_to) params.append('date_to', filters.date_to);
   if (filters?.limit) params.append('limit', filters.limit.toString());
-  if (filters?.offset) params.append('offset', filters.offset.toString());
+  if (filters?.after) params.append('after', filters.after);
   
   const queryString = params.toString();
   const url = queryString ? `/visits/?${queryString}` : '/visits/';
@@ -124,6 +144,67 @@ export const getVisitStatistics = async (): Promise<VisitStatistics> => {
   return response.data;
 };
 
+/**
+ * Busca clientes (nome, e-mail, telefone) e imóveis (localização, descrição)
+ */
+export const search = async (
+  q: string,
+  type: 'all' | 'clients' | 'properties' = 'all',
+  limit = 20
+): Promise<SearchResults> => {
+  const response = await api.get('/search/', { params: { q, type, limit } });
+  return response.data;
+};
+
+/**
+ * Imóveis sugeridos a partir das preferências do cliente
+ */
+export const getClientMatches = async (clientId: number, limit = 10): Promise<ClientMatches> => {
+  const response = await api.get(`/clients/${clientId}/matches`, { params: { limit } });
+  return response.data;
+};
+
+/**
+ * Atualização parcial (só os campos enviados). Informe `version` para
+ * receber 409 se outra pessoa alterou o registro desde a leitura.
+ */
+export const patchClient = async (clientId: number, changes: ClientUpdate): Promise<Client> => {
+  const response = await api.patch(`/clients/${clientId}`, changes);
+  return response.data;
+};
+
+export const patchProperty = async (propertyId: number, changes: PropertyUpdate): Promise<Property> => {
+  const response = await api.patch(`/properties/${propertyId}`, changes);
+  return response.data;
+};
+
+export const patchNegotiation = async (negotiationId: number, changes: NegotiationUpdate): Promise<Negotiation> => {
+  const response = await api.patch(`/negotiations/${negotiationId}`, changes);
+  return response.data;
+};
+
+/**
+ * Feed de alterações em tempo real (Server-Sent Events). O EventSource
+ * reconecta sozinho a partir do último evento recebido; `onReset` indica
+ * eventos perdidos (recarregue os dados). Retorna a função que encerra a assinatura.
+ */
+export const subscribeChanges = (
+  onChange: (event: ChangeEvent) => void,
+  options: { topics?: ChangeEntity[]; author?: 'any' | 'me' | 'others'; onReset?: () => void } = {}
+): (() => void) => {
+  // EventSource não envia cabeçalhos: o token vai na query string
+  const params = new URLSearchParams();
+  const token = localStorage.getItem('token');
+  if (token) params.set('access_token', token);
+  if (options.topics?.length) params.set('topics', options.topics.join(','));
+  if (options.author) params.set('author', options.author);
+
+  const source = new EventSource(`${api.defaults.baseURL}/changes/stream?${params}`);
+  source.addEventListener('change', (event) => onChange(JSON.parse((event as MessageEvent).data)));
+  source.addEventListener('reset', () => options.onReset?.());
+  return () => source.close();
+};
+
 // ============================================
 // 🔧 FUNÇÕES AUXILIARES PARA VISITAS
 // ============================================
@@ -30,6 +30,7 @@ export interface Property {
   value: number;
   description?: string;
   status: string;
+  version: number;
 }
 
 export interface PropertyCreate {
@@ -40,6 +41,9 @@ export interface PropertyCreate {
   status: string;
 }
 
+// PATCH: só os campos enviados mudam; version evita sobrescrever outra edição (409)
+export type PropertyUpdate = Partial<PropertyCreate> & { version?: number };
+
 // Tipos para clientes
 export interface Client {
   id: number;
@@ -49,6 +53,7 @@ export interface Client {
   interest_type: string;
   status: string;
   preferences?: string;
+  version: number;
 }
 
 export interface ClientCreate {
@@ -60,6 +65,8 @@ export interface ClientCreate {
   preferences?: string;
 }
 
+export type ClientUpdate = Partial<ClientCreate> & { version?: number };
+
 // Tipos para visitas
 export interface Visit {
   id: number;
@@ -105,8 +112,20 @@ export interface VisitStatistics {
   agendadas: number;
   realizadas: number;
   canceladas: number;
+  reagendadas: number;
   visitas_hoje: number;
   taxa_realizacao: number;
+  series?: VisitStatisticsBucket[];
+}
+
+// Linha da série agrupada (group_by) das estatísticas de visitas
+export interface VisitStatisticsBucket {
+  grupo: string;
+  total: number;
+  agendadas: number;
+  realizadas: number;
+  canceladas: number;
+  reagendadas: number;
 }
 
 // Tipos para filtros de visitas
@@ -117,7 +136,7 @@ export interface VisitFilter {
   date_from?: string;
   date_to?: string;
   limit?: number;
-  offset?: number;
+  after?: string;
 }
 
 // Tipos para negociações
@@ -128,6 +147,7 @@ export interface Negotiation {
   status: string;
   created_at: string;
   updated_at?: string;
+  version: number;
 }
 
 export interface NegotiationCreate {
@@ -135,3 +155,50 @@ export interface NegotiationCreate {
   property_id: number;
   status: string;
 }
+
+export type NegotiationUpdate = Partial<NegotiationCreate> & { version?: number };
+
+// Página de uma listagem paginada por cursor (cabeçalho X-Next-Cursor)
+export interface Page<T> {
+  items: T[];
+  nextCursor: string | null;
+}
+
+// Tipos para busca
+export interface SearchResults {
+  clients: Client[];
+  properties: Property[];
+}
+
+// Tipos para sugestões de imóveis
+export interface MatchCriteria {
+  types: string[];
+  locations: string[];
+  min_value?: number | null;
+  max_value?: number | null;
+}
+
+export interface PropertyMatch {
+  property: Property;
+  score: number;
+}
+
+export interface ClientMatches {
+  client_id: number;
+  criteria: MatchCriteria;
+  matches: PropertyMatch[];
+}
+
+// Tipos do feed de alterações (tempo real)
+export type ChangeEntity = 'client' | 'property' | 'visit' | 'negotiation';
+
+export interface ChangeEvent {
+  type: 'change';
+  offset: number;
+  entity: ChangeEntity;
+  action: 'created' | 'updated' | 'deleted' | 'imported';
+  id: number | null;
+  user_id: number | null;
+  at: string;
+  data: Record<string, unknown> | null;
+}